@@ -0,0 +1,182 @@
+"""
+Parity checks between the MongoDB and SQLite storage backends.
+
+Usage (from the project root, with a local mongod running):
+    python -m benchmarks.backend_parity
+    python -m benchmarks.backend_parity --days 7
+
+The same readings are written to a MongoDB database and to a temporary
+SQLite file (webapp/sqlite_store.py). Every GET route of the sensors
+blueprint, plus explicit stats and aligned ranges, is then requested once
+per backend, back to back, and the responses are compared: JSON bodies must
+match (floats to a relative 1e-9, the sums are added up in a different
+order) and every other response must have the same status code. Exits 1 on
+any difference.
+
+The result cache is disabled so every request reaches the backend. User
+accounts live in MongoDB with either backend.
+"""
+import argparse
+import datetime
+import math
+import os
+import random
+import sys
+import tempfile
+import urllib.parse
+
+from . import common
+from .query_plans import sensor_routes
+
+DB_NAME = "iotbench_parity"
+
+# Routes served from MongoDB-only derived data (rollups), not from readings
+MONGO_ONLY = ("/quantiles",)
+INTERVAL = datetime.timedelta(seconds=60)
+
+
+def generate(days):
+    """{collection: [documents]} ending just before now, same for every run"""
+    rng = random.Random(common.SEED)
+    # Readings at :30 so a relative window rarely moves past one mid-check
+    end = datetime.datetime.now().replace(second=30, microsecond=0) - INTERVAL
+    count = int(datetime.timedelta(days=days) / INTERVAL)
+    start = end - INTERVAL * (count - 1)
+
+    documents = {
+        collection: [
+            {
+                "title": title,
+                "node": f"node-{i % 3 + 1}",
+                "value": common.generate_values(rng, collection),
+                "timestamp": start + INTERVAL * i,
+            }
+            for i in range(count)
+        ]
+        for collection, title in common.COLLECTIONS.items()
+    }
+    return documents, start, end
+
+
+def seed(documents, sqlite_path):
+    from webapp import sqlite_store
+
+    db = common.get_client()[DB_NAME]
+    for collection, docs in documents.items():
+        db[collection].drop()
+        # insert_many adds _id to the documents it is given
+        db[collection].insert_many([dict(doc) for doc in docs], ordered=False)
+        db[collection].create_index("timestamp")
+
+    store = sqlite_store.SQLiteStore(sqlite_path)
+    store.insert(documents)
+    return store
+
+
+def same(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None or isinstance(a, bool) or isinstance(b, bool):
+            return a == b
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def extra_urls(start, end):
+    """Fixed ranges that don't move with the clock"""
+    middle = start + (end - start) / 2
+    urls = []
+    for sensor in ("temperature", "humidity", "light", "rain", "smoke"):
+        query = urllib.parse.urlencode(
+            {"start": start.isoformat(), "end": middle.isoformat()}
+        )
+        urls.append(
+            (f"/sensors/{sensor}/stats?range", f"/sensors/{sensor}/stats?{query}")
+        )
+
+    for params in (
+        {"step": 900, "fill": "linear"},
+        {"step": 60, "sensors": "temperature,humidity", "fill.temperature": "ffill"},
+    ):
+        query = urllib.parse.urlencode(
+            {"start": middle.isoformat(), "end": end.isoformat(), **params}
+        )
+        urls.append(
+            (f"/sensors/aligned?step={params['step']}", f"/sensors/aligned?{query}")
+        )
+    return urls
+
+
+def fetch(client, backend, url):
+    from webapp.repositories import sensor_repository
+
+    sensor_repository.backend = backend
+    response = client.get(url)
+    body = response.get_json() if response.is_json else None
+    if isinstance(body, list):
+        # Reading ids are ObjectIds in MongoDB and rowids in SQLite
+        body = [
+            {k: v for k, v in item.items() if k != "id"}
+            if isinstance(item, dict)
+            else item
+            for item in body
+        ]
+    return response.status_code, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare MongoDB and SQLite backends")
+    parser.add_argument("--days", type=int, default=3, help="Days of readings to seed")
+    args = parser.parse_args()
+
+    documents, start, end = generate(args.days)
+    sqlite_path = os.path.join(tempfile.mkdtemp(prefix="parity-"), "readings.sqlite3")
+    print(f"Seeding {len(documents['temp_sensor']):,} readings per sensor...")
+    store = seed(documents, sqlite_path)
+
+    os.environ["CACHE_DEFAULT_TTL"] = "0"
+    client = common.create_client(DB_NAME)
+
+    from webapp.repositories import sensor_repository
+
+    backends = {
+        "mongo": sensor_repository.MongoBackend(),
+        "sqlite": sensor_repository.SQLiteBackend(store),
+    }
+
+    failures = []
+    routes = [
+        (route, url)
+        for route, url in sensor_routes(client.application, {"end": end})
+        + extra_urls(start, end)
+        if not any(part in route for part in MONGO_ONLY)
+    ]
+    for route, url in routes:
+        results = {
+            name: fetch(client, backend, url) for name, backend in backends.items()
+        }
+        if not same(results["mongo"], results["sqlite"]):
+            # A relative window may have crossed a reading between the two
+            results = {
+                name: fetch(client, backend, url) for name, backend in backends.items()
+            }
+
+        if same(results["mongo"], results["sqlite"]):
+            print(f"  ok    {route} ({results['mongo'][0]})")
+            continue
+
+        print(f"  DIFF  {route}")
+        for name, (status, body) in results.items():
+            print(f"        {name}: {status} {str(body)[:200]}")
+        failures.append(route)
+
+    print(f"{len(routes) - len(failures)}/{len(routes)} routes match")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Shared helpers for the benchmark scripts: dataset seeding, loading the
+subscriber module and building a logged-in Flask test client.
+
+All benchmarks run against a real MongoDB (MONGO_URI, default
+mongodb://localhost:27017/). A throwaway local instance is enough:
+
+    docker run --rm -p 27017:27017 mongo
+"""
+import datetime
+import importlib.util
+import os
+import pathlib
+import random
+import time
+
+from pymongo import MongoClient
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+
+# Dataset name -> number of readings (one document per sensor collection each)
+DATASETS = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+COLLECTIONS = {
+    "temp_sensor": "Temperature Reading",
+    "humidity_sensor": "Humidity Reading",
+    "light_sensor": "Light Status",
+    "rain_sensor": "Rain Status",
+    "smoke_sensor": "Smoke Status",
+}
+
+READING_INTERVAL = datetime.timedelta(seconds=10)
+SEED = 42
+BATCH = 10_000
+
+
+def get_client():
+    return MongoClient(MONGO_URI)
+
+
+def dataset_db_name(name):
+    return f"iotbench_{name}"
+
+
+def generate_values(rng, collection):
+    if collection == "temp_sensor":
+        return round(rng.uniform(15, 40), 2)
+    if collection == "humidity_sensor":
+        return round(rng.uniform(20, 100), 2)
+    if collection == "smoke_sensor":
+        return rng.random() < 0.001
+    return rng.random() < 0.5
+
+
+def seed_dataset(name, reseed=False):
+    """Seed (or reuse) the dataset and return its metadata.
+
+    Readings are spaced READING_INTERVAL apart and end at seeding time, values
+    come from a fixed random seed so every run sees the same data.
+    """
+    count = DATASETS[name]
+    client = get_client()
+    db = client[dataset_db_name(name)]
+    meta = db["bench_meta"].find_one({"_id": "dataset"})
+
+    if meta and meta["count"] == count and not reseed:
+        return meta
+
+    print(f"Seeding dataset {name} ({count} readings per sensor)...")
+    for collection in COLLECTIONS:
+        db[collection].drop()
+
+    rng = random.Random(SEED)
+    end = datetime.datetime.now().replace(microsecond=0)
+    start = end - READING_INTERVAL * (count - 1)
+
+    for collection, title in COLLECTIONS.items():
+        for offset in range(0, count, BATCH):
+            docs = [
+                {
+                    "title": title,
+                    "value": generate_values(rng, collection),
+                    "timestamp": start + READING_INTERVAL * i,
+                }
+                for i in range(offset, min(offset + BATCH, count))
+            ]
+            db[collection].insert_many(docs, ordered=False)
+
+    meta = {"_id": "dataset", "count": count, "start": start, "end": end}
+    db["bench_meta"].replace_one({"_id": "dataset"}, meta, upsert=True)
+    return meta
+
+
+_subscriber = None
+
+
+def load_subscriber():
+    """Import scripts/subscriber.py without starting the Pub/Sub listener"""
+    global _subscriber
+    if _subscriber is not None:
+        return _subscriber
+
+    spec = importlib.util.spec_from_file_location(
+        "subscriber", ROOT / "scripts" / "subscriber.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _subscriber = module
+    return module
+
+
+def create_client(db_name):
+    """Create the web app against db_name and return a logged-in test client"""
+    import mongoengine
+
+    os.environ["MONGODB_DB"] = db_name
+    os.environ["MONGODB_HOST"] = MONGO_URI
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["WTF_CSRF_ENABLED"] = "False"
+    mongoengine.disconnect_all()
+
+    started = time.perf_counter()
+    from webapp.web import create_app
+
+    app = create_app(import_seconds=time.perf_counter() - started)
+    from webapp.models.user_model import User
+
+    with app.app_context():
+        user = User.objects(username="bench").first()
+        if not user:
+            user = User(username="bench")
+            user.set_password("bench")
+            user.save()
+        user_id = str(user.id)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = user_id
+        session["_fresh"] = True
+    return client
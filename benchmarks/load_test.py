@@ -0,0 +1,453 @@
+"""
+Concurrent load test with simulated dashboard users.
+
+Usage (from the project root, against a running app and its mongod):
+    python -m benchmarks.load_test --url http://localhost --users 10,25,50,100
+    python -m benchmarks.load_test --users 50 --ingest-rate 200 --tick 5
+    python -m benchmarks.load_test --users 25,50,100 --replicas 1,2,3 \\
+        --scale-command "docker compose up -d --scale webapp={replicas}"
+
+Each virtual user follows the polling loop of dashboard/index.html: every
+--tick seconds it fetches the five /latest endpoints and then the four
+/history charts, sending ?since= with the last timestamp it already has
+after the first load. Users keep one HTTP connection each and issue their
+calls one after another. Logins are throttled per account and per IP
+(LOGIN_*), so the users share --sessions logged-in cookies obtained through
+the real /users/login form (CSRF token included).
+
+With --ingest-rate readings per second are fed through the subscriber's
+callback() into --db at the same time, and CACHE_URL should match the app's
+so its cached results are invalidated as in production.
+
+Every stage (users x replicas) runs --warmup seconds before --duration
+seconds of measurement. Per route it reports throughput, p50/p95/p99 and
+error rate. The saturation point is the first stage where throughput grows
+by less than --min-efficiency of the added users, p95 exceeds --max-p95-ms
+or more than --max-error-rate of the requests fail. Results are written to
+benchmarks/results/loadtest-*.json.
+"""
+import argparse
+import datetime
+import http.client
+import http.cookies
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+
+from . import common
+from .run import FakeMessage, RESULTS_DIR, git_revision, percentile
+
+LATEST_SENSORS = ["temperature", "humidity", "light", "rain", "smoke"]
+HISTORY_SENSORS = ["temperature", "humidity", "light", "rain"]
+HISTORY_HOURS = 24
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+class Connection:
+    """Keep-alive HTTP connection that carries a session cookie"""
+
+    def __init__(self, base_url, cookie="", timeout=30):
+        url = urllib.parse.urlsplit(base_url)
+        factory = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.connect = lambda: factory(url.netloc, timeout=timeout)
+        self.conn = self.connect()
+        self.cookie = cookie
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in range(2):
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server may close idle keep-alive connections
+                self.conn.close()
+                self.conn = self.connect()
+                if attempt:
+                    raise
+
+        cookies = http.cookies.SimpleCookie()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookies.load(header)
+        if cookies:
+            jar = http.cookies.SimpleCookie(self.cookie)
+            jar.update(cookies)
+            self.cookie = "; ".join(f"{k}={m.value}" for k, m in jar.items())
+        return response.status, data
+
+    def close(self):
+        self.conn.close()
+
+
+def login(base_url, username, password):
+    """Session cookie from the login form, the way a browser gets it"""
+    conn = Connection(base_url)
+    status, page = conn.request("GET", "/users/login")
+    match = CSRF_PATTERN.search(page.decode("utf-8", "replace"))
+    if status != 200 or not match:
+        raise RuntimeError(f"Login page returned {status} without a CSRF token")
+
+    body = urllib.parse.urlencode(
+        {"csrf_token": match[1], "username": username, "password": password}
+    )
+    status, _ = conn.request(
+        "POST",
+        "/users/login",
+        body=body,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    conn.close()
+    if status != 302:
+        raise RuntimeError(f"Login failed with status {status}")
+    return conn.cookie
+
+
+def ensure_user(db_name, username, password):
+    """Create the load-test account in db_name when it does not exist"""
+    import mongoengine
+
+    os.environ["MONGODB_DB"] = db_name
+    os.environ["MONGODB_HOST"] = common.MONGO_URI
+    mongoengine.disconnect_all()
+    os.chdir(common.ROOT)
+    from webapp.web import create_app
+    from webapp.models.user_model import User
+
+    with create_app().app_context():
+        if not User.objects(username=username).first():
+            user = User(username=username)
+            user.set_password(password)
+            user.save()
+            print(f"Created user {username}")
+
+
+class Recorder:
+    """Latency samples and failures per route for the current stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset(recording=False)
+
+    def reset(self, recording):
+        with self.lock:
+            self.recording = recording
+            self.samples = {}
+            self.errors = {}
+            self.started = time.perf_counter()
+
+    def add(self, route, seconds, ok):
+        with self.lock:
+            if not self.recording:
+                return
+            self.samples.setdefault(route, []).append(seconds * 1000)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            samples, errors = self.samples, self.errors
+
+        routes = {}
+        for route, values in sorted(samples.items()):
+            routes[route] = {
+                "requests": len(values),
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 0.50), 2),
+                "p95_ms": round(percentile(values, 0.95), 2),
+                "p99_ms": round(percentile(values, 0.99), 2),
+                "error_rate": round(errors.get(route, 0) / len(values), 4),
+            }
+
+        every = [value for values in samples.values() for value in values]
+        total = {
+            "requests": len(every),
+            "rps": round(len(every) / elapsed, 2) if every else 0.0,
+            "p50_ms": round(percentile(every, 0.50), 2) if every else None,
+            "p95_ms": round(percentile(every, 0.95), 2) if every else None,
+            "p99_ms": round(percentile(every, 0.99), 2) if every else None,
+            "error_rate": round(sum(errors.values()) / len(every), 4) if every else 0.0,
+        }
+        return {"total": total, "routes": routes}
+
+
+class DashboardUser(threading.Thread):
+    """One browser tab running the dashboard's polling loop"""
+
+    def __init__(self, base_url, cookie, tick, recorder, stop):
+        super().__init__(daemon=True)
+        self.conn = Connection(base_url, cookie)
+        self.tick = tick
+        self.recorder = recorder
+        self.stop = stop
+        self.cursors = {}
+
+    def get(self, route, path):
+        started = time.perf_counter()
+        try:
+            status, body = self.conn.request("GET", path)
+        except (http.client.HTTPException, OSError):
+            status, body = None, b""
+        # 404 is the app's "no data yet" answer, not a failure
+        self.recorder.add(
+            route, time.perf_counter() - started, status in (200, 404)
+        )
+        return status, body
+
+    def poll(self):
+        for sensor in LATEST_SENSORS:
+            self.get("latest", f"/sensors/{sensor}/latest")
+
+        for sensor in HISTORY_SENSORS:
+            path = f"/sensors/{sensor}/history?hours={HISTORY_HOURS}"
+            cursor = self.cursors.get(sensor)
+            route = "history"
+            if cursor:
+                path += "&since=" + urllib.parse.quote(cursor)
+                route = "history?since"
+            status, body = self.get(route, path)
+            if status == 200:
+                points = json.loads(body)
+                if points:
+                    self.cursors[sensor] = points[-1]["timestamp"]
+
+    def run(self):
+        # Tabs are opened at different times, don't poll in lockstep
+        if self.stop.wait(random.uniform(0, self.tick)):
+            return
+        while not self.stop.is_set():
+            started = time.monotonic()
+            self.poll()
+            self.stop.wait(max(0.0, self.tick - (time.monotonic() - started)))
+        self.conn.close()
+
+
+def payload(now, i):
+    return json.dumps(
+        {
+            "timestamp": now,
+            "temperature": 20 + (i % 150) / 10,
+            "humidity": 40 + (i % 500) / 10,
+            "is_dark": i % 2 == 0,
+            "is_raining": i % 7 == 0,
+            "is_smoke": False,
+        }
+    ).encode("utf-8")
+
+
+def run_ingest(db_name, rate, stop):
+    """Feed `rate` readings per second through the subscriber until stopped"""
+    subscriber = common.load_subscriber()
+    subscriber.db = common.get_client()[db_name]
+    threading.Thread(target=subscriber.bulk_writer.run, daemon=True).start()
+
+    sent = 0
+    started = time.monotonic()
+    while not stop.is_set():
+        due = int((time.monotonic() - started) * rate)
+        while sent < due:
+            subscriber.callback(FakeMessage(payload(time.time(), sent)))
+            sent += 1
+        stop.wait(0.01)
+    subscriber.bulk_writer.flush()
+    return sent
+
+
+def wait_ready(base_url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = Connection(base_url, timeout=5).request("GET", "/users/login")
+            if status == 200:
+                return
+        except (http.client.HTTPException, OSError):
+            pass
+        time.sleep(2)
+    raise RuntimeError(f"{base_url} did not become ready")
+
+
+def run_stage(args, sessions, users):
+    recorder = Recorder()
+    stop = threading.Event()
+    clients = [
+        DashboardUser(args.url, sessions[i % len(sessions)], args.tick, recorder, stop)
+        for i in range(users)
+    ]
+    for client in clients:
+        client.start()
+
+    time.sleep(args.warmup)
+    recorder.reset(recording=True)
+    time.sleep(args.duration)
+    result = recorder.summary()
+
+    stop.set()
+    for client in clients:
+        client.join(timeout=args.tick + 30)
+    return result
+
+
+def find_saturation(stages, args):
+    """First stage past the knee of the throughput curve, None if not reached"""
+    previous = None
+    for stage in stages:
+        total = stage["result"]["total"]
+        reasons = []
+        if total["p95_ms"] is not None and total["p95_ms"] > args.max_p95_ms:
+            reasons.append(f"p95 {total['p95_ms']:.0f}ms > {args.max_p95_ms:.0f}ms")
+        if total["error_rate"] > args.max_error_rate:
+            reasons.append(f"error rate {total['error_rate']:.1%}")
+        if (
+            previous
+            and previous["replicas"] == stage["replicas"]
+            and previous["result"]["total"]["rps"]
+        ):
+            growth = total["rps"] / previous["result"]["total"]["rps"]
+            expected = stage["users"] / previous["users"]
+            efficiency = (growth - 1) / (expected - 1) if expected > 1 else 1.0
+            if efficiency < args.min_efficiency:
+                reasons.append(f"throughput grew {efficiency:.0%} of the added load")
+        if reasons:
+            return {
+                "users": stage["users"],
+                "replicas": stage["replicas"],
+                "reasons": reasons,
+            }
+        previous = stage
+    return None
+
+
+def print_stage(stage):
+    total = stage["result"]["total"]
+    print(
+        f"\n== {stage['users']} users, {stage['replicas']} replica(s): "
+        f"{total['rps']:.1f} req/s, p95={total['p95_ms']}ms, "
+        f"errors={total['error_rate']:.2%}"
+    )
+    for route, stats in stage["result"]["routes"].items():
+        print(
+            f"  {route:<16} {stats['rps']:>8.1f} req/s  p50={stats['p50_ms']:>8.1f}ms "
+            f"p95={stats['p95_ms']:>8.1f}ms p99={stats['p99_ms']:>8.1f}ms "
+            f"errors={stats['error_rate']:.2%}"
+        )
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with dashboard users")
+    parser.add_argument("--url", default="http://localhost", help="App base URL")
+    parser.add_argument("--users", type=int_list, default=[10, 25, 50, 100])
+    parser.add_argument(
+        "--replicas",
+        type=int_list,
+        default=[1],
+        help="Replica counts; without --scale-command only a label",
+    )
+    parser.add_argument(
+        "--scale-command",
+        help="Run before each replica count, "
+        'e.g. "docker compose up -d --scale webapp={replicas}"',
+    )
+    parser.add_argument(
+        "--tick", type=float, default=30, help="Dashboard poll interval"
+    )
+    parser.add_argument("--warmup", type=float, default=15)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--ingest-rate", type=float, default=0, help="Readings/sec")
+    parser.add_argument("--db", default=os.getenv("MONGODB_DB", "iotdb"))
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--create-user", action="store_true")
+    parser.add_argument("--sessions", type=int, default=4, help="Logged-in cookies")
+    parser.add_argument("--max-p95-ms", type=float, default=1000)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-efficiency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.create_user:
+        ensure_user(args.db, args.username, args.password)
+
+    ingest_stop = threading.Event()
+    ingest = {}
+    if args.ingest_rate:
+        thread = threading.Thread(
+            target=lambda: ingest.update(
+                sent=run_ingest(args.db, args.ingest_rate, ingest_stop)
+            ),
+            daemon=True,
+        )
+        thread.start()
+
+    stages = []
+    try:
+        for replicas in args.replicas:
+            if args.scale_command:
+                command = args.scale_command.format(replicas=replicas)
+                print(f"$ {command}")
+                subprocess.run(command, shell=True, check=True)
+            wait_ready(args.url)
+            sessions = [
+                login(args.url, args.username, args.password)
+                for _ in range(args.sessions)
+            ]
+
+            for users in args.users:
+                stage = {
+                    "users": users,
+                    "replicas": replicas,
+                    "result": run_stage(args, sessions, users),
+                }
+                print_stage(stage)
+                stages.append(stage)
+    finally:
+        ingest_stop.set()
+        if args.ingest_rate:
+            thread.join(timeout=30)
+
+    saturation = find_saturation(stages, args)
+    if saturation:
+        print(
+            f"\nSaturated at {saturation['users']} users with "
+            f"{saturation['replicas']} replica(s): {', '.join(saturation['reasons'])}"
+        )
+    else:
+        print("\nNo saturation within the tested load")
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_rev": git_revision(),
+            "url": args.url,
+            "tick_s": args.tick,
+            "duration_s": args.duration,
+            "ingest_rate": args.ingest_rate,
+            "ingested": ingest.get("sent", 0),
+        },
+        "stages": stages,
+        "saturation": saturation,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = RESULTS_DIR / f"loadtest-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
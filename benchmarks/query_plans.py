@@ -0,0 +1,234 @@
+"""
+Query-plan regression checks for the sensor endpoints.
+
+Usage (from the project root, with a local mongod running):
+    python -m benchmarks.query_plans                  # check against the baseline
+    python -m benchmarks.query_plans --save-baseline  # record query counts
+
+Every GET route of the sensors blueprint is requested against a seeded
+dataset while a command listener records the queries it issues. Each query
+is then explained (executionStats) and the run fails when:
+
+- a plan contains a COLLSCAN,
+- documents examined exceed --max-ratio times the documents matched,
+- a route issues more queries than in benchmarks/query_baseline.json.
+
+The result cache is disabled so every request reaches MongoDB.
+"""
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import sys
+import urllib.parse
+
+from pymongo import monitoring
+
+from . import common
+
+BASELINE_FILE = pathlib.Path(__file__).resolve().parent / "query_baseline.json"
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+# Driver/session bookkeeping that explain does not accept
+STRIPPED_FIELDS = {"lsid", "txnNumber", "$db", "$clusterTime", "$readPreference"}
+# Cursor continuations, index builds and driver handshakes are not queries
+IGNORED_COMMANDS = {
+    "getMore",
+    "killCursors",
+    "createIndexes",
+    "listIndexes",
+    "hello",
+    "ismaster",
+    "isMaster",
+    "ping",
+    "endSessions",
+    "saslStart",
+    "saslContinue",
+}
+
+
+class QueryCapture(monitoring.CommandListener):
+    def __init__(self):
+        self.recording = False
+        self.commands = []
+
+    def started(self, event):
+        if not self.recording or event.command_name in IGNORED_COMMANDS:
+            return
+        command = {
+            key: value
+            for key, value in event.command.items()
+            if key not in STRIPPED_FIELDS
+        }
+        self.commands.append((event.database_name, event.command_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def walk(node):
+    """Every dict nested in an explain document"""
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from walk(value)
+
+
+def explain(db, command):
+    return db.command({"explain": command, "verbosity": "executionStats"})
+
+
+def analyse(db, name, command):
+    """Plan stages, documents examined and documents matched for one query"""
+    plan = explain(db, command)
+    stages = sorted(
+        {n["stage"] for n in walk(plan) if isinstance(n.get("stage"), str)}
+    )
+
+    # Grouping stages return far fewer documents than they read, so the ratio
+    # is taken on the find equivalent of the pipeline's leading $match
+    if name == "aggregate":
+        pipeline = command.get("pipeline", [])
+        if not pipeline or "$match" not in pipeline[0]:
+            return {"stages": stages, "examined": None, "matched": None}
+        find = {"find": command["aggregate"], "filter": pipeline[0]["$match"]}
+        plan = explain(db, find)
+
+    stats = next(n for n in walk(plan) if "totalDocsExamined" in n)
+    return {
+        "stages": stages,
+        "examined": stats["totalDocsExamined"],
+        "matched": stats["nReturned"],
+    }
+
+
+def sensor_routes(app, meta):
+    """
+    (name, url) for every GET route of the sensors blueprint. The name is
+    stable across datasets and keys the query-count baseline.
+    """
+    from webapp.web.views.sensors import SENSOR_CARDS
+
+    since = (meta["end"] - datetime.timedelta(minutes=10)).isoformat()
+    urls = []
+    for rule in app.url_map.iter_rules():
+        if not rule.endpoint.startswith("sensors.") or "GET" not in rule.methods:
+            continue
+
+        if "sensor" in rule.arguments:
+            paths = [rule.rule.replace("<sensor>", sensor) for sensor in SENSOR_CARDS]
+        else:
+            paths = [rule.rule]
+
+        for path in paths:
+            urls.append((path, path))
+            if rule.endpoint.endswith("_history"):
+                query = urllib.parse.urlencode({"hours": 24, "since": since})
+                urls.append((f"{path}?since", f"{path}?{query}"))
+    return sorted(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check query plans of sensor routes")
+    parser.add_argument("-d", "--dataset", choices=list(common.DATASETS), default="10k")
+    parser.add_argument("--reseed", action="store_true", help="Re-create the dataset")
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=5.0,
+        help="Allowed documents examined per document matched (default: 5)",
+    )
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    meta = common.seed_dataset(args.dataset, reseed=args.reseed)
+    db_name = common.dataset_db_name(args.dataset)
+
+    # Registered before create_app() so the app's MongoClient reports to it
+    capture = QueryCapture()
+    monitoring.register(capture)
+    os.environ["CACHE_DEFAULT_TTL"] = "0"
+    client = common.create_client(db_name)
+
+    from webapp.repositories import sensor_repository
+
+    with client.application.app_context():
+        for model in sensor_repository.SENSOR_MODELS.values():
+            model.ensure_indexes()
+
+    mongo = common.get_client()
+    counts = {}
+    failures = []
+
+    for route, url in sensor_routes(client.application, meta):
+        # The first request warms per-process caches (user loader, templates)
+        client.get(url)
+
+        capture.commands = []
+        capture.recording = True
+        response = client.get(url)
+        capture.recording = False
+
+        counts[route] = len(capture.commands)
+        print(f"\n{url} -> {response.status_code}, {counts[route]} queries")
+        if response.status_code >= 400:
+            failures.append(f"{url}: HTTP {response.status_code}")
+
+        for database, name, command in capture.commands:
+            if name not in EXPLAINABLE:
+                print(f"  {name}: not explainable, skipped")
+                continue
+
+            result = analyse(mongo[database], name, command)
+            target = command.get(name)
+            ratio = None
+            if result["examined"] is not None:
+                ratio = result["examined"] / max(result["matched"], 1)
+            ratio_text = "-" if ratio is None else f"{ratio:.1f}"
+            print(
+                f"  {name} {target}: {','.join(result['stages'])} "
+                f"examined={result['examined']} matched={result['matched']} "
+                f"ratio={ratio_text}"
+            )
+
+            if "COLLSCAN" in result["stages"]:
+                failures.append(f"{url}: COLLSCAN in {name} on {target}")
+            if ratio is not None and ratio > args.max_ratio:
+                failures.append(
+                    f"{url}: {name} on {target} examined {result['examined']} "
+                    f"documents for {result['matched']} matched"
+                )
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        for route, count in counts.items():
+            if route in baseline and count > baseline[route]:
+                failures.append(
+                    f"{route}: {count} queries, baseline {baseline[route]}"
+                )
+    else:
+        print(f"\nNo baseline at {args.baseline}, query counts not compared")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(counts, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+
+    mongo.close()
+    if failures:
+        print(f"\n{len(failures)} query plan regression(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll query plans OK")
+
+
+if __name__ == "__main__":
+    main()
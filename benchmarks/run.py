@@ -0,0 +1,266 @@
+"""
+Micro-benchmarks for the ingest and query hot paths.
+
+Usage (from the project root, with a local mongod running):
+    python -m benchmarks.run                        # 10k dataset, compare to baseline
+    python -m benchmarks.run -d 10k -d 1m           # several datasets
+    python -m benchmarks.run --save-baseline        # store results as the new baseline
+    python -m benchmarks.run --fail-on-regression   # non-zero exit on regressions
+
+Measures subscriber callback() throughput (messages/sec) and p50/p99 latency
+for every sensor endpoint. Results are written to benchmarks/results/ as JSON
+and compared against benchmarks/baseline.json when it exists.
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from bson import ObjectId
+
+from webapp import partitions
+
+from . import common
+
+RESULTS_DIR = pathlib.Path(__file__).resolve().parent / "results"
+BASELINE_FILE = pathlib.Path(__file__).resolve().parent / "baseline.json"
+
+SENSORS = ["temperature", "humidity", "light", "rain", "smoke"]
+ENDPOINTS = ["/sensors/"] + [
+    url
+    for sensor in SENSORS
+    for url in (f"/sensors/{sensor}/latest", f"/sensors/{sensor}/history?hours=24")
+]
+
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = {"messages_per_sec"}
+
+
+class FakeMessage:
+    """Stand-in for a Pub/Sub message as seen by callback()"""
+
+    def __init__(self, data):
+        self.data = data
+        self.publish_time = datetime.datetime.now(datetime.UTC)
+        self.acked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.acked = False
+
+
+def make_payloads(count):
+    now = time.time()
+    return [
+        json.dumps(
+            {
+                "timestamp": now + i * 0.001,
+                "temperature": 20 + (i % 150) / 10,
+                "humidity": 40 + (i % 500) / 10,
+                "is_dark": i % 2 == 0,
+                "is_raining": i % 7 == 0,
+                "is_smoke": False,
+            }
+        ).encode("utf-8")
+        for i in range(count)
+    ]
+
+
+def bench_ingest(db_name, messages):
+    """Feed messages through subscriber.callback() and measure throughput"""
+    subscriber = common.load_subscriber()
+    subscriber.db = common.get_client()[db_name]
+    boundary = ObjectId.from_datetime(datetime.datetime.now(datetime.UTC))
+
+    payloads = make_payloads(messages)
+    batch = [FakeMessage(data) for data in payloads]
+
+    start = time.perf_counter()
+    for message in batch:
+        subscriber.callback(message)
+    subscriber.bulk_writer.flush()
+    elapsed = time.perf_counter() - start
+
+    # Leave the seeded dataset as it was, partitions included
+    names = set(subscriber.db.list_collection_names())
+    for collection in common.COLLECTIONS:
+        for name in partitions.collections_between(collection, names):
+            subscriber.db[name].delete_many({"_id": {"$gte": boundary}})
+
+    acked = sum(message.acked for message in batch)
+    return {
+        "messages": messages,
+        "acked": acked,
+        "seconds": round(elapsed, 4),
+        "messages_per_sec": round(messages / elapsed, 1),
+    }
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def bench_endpoints(client, iterations, warmup):
+    results = {}
+
+    for url in ENDPOINTS:
+        for _ in range(warmup):
+            client.get(url)
+
+        samples = []
+        status = None
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - start) * 1000)
+            status = response.status_code
+
+        results[url] = {
+            "n": iterations,
+            "status": status,
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+            "mean_ms": round(statistics.fmean(samples), 3),
+        }
+        print(
+            f"  {url:<40} p50={results[url]['p50_ms']:>8.2f}ms "
+            f"p99={results[url]['p99_ms']:>8.2f}ms"
+        )
+
+    return results
+
+
+def run_dataset(name, args):
+    meta = common.seed_dataset(name, reseed=args.reseed)
+    db_name = common.dataset_db_name(name)
+    age = (datetime.datetime.now() - meta["end"]).total_seconds()
+
+    print(f"\n== dataset {name} ({meta['count']} readings, age {age:.0f}s)")
+    ingest = bench_ingest(db_name, args.messages)
+    print(f"  ingest: {ingest['messages_per_sec']:.0f} messages/sec")
+
+    client = common.create_client(db_name)
+    startup = client.application.config["STARTUP_TIMINGS"]
+    print(f"  startup: {startup['total']:.1f}ms")
+
+    return {
+        "readings": meta["count"],
+        "dataset_age_s": round(age),
+        "startup_ms": startup,
+        "ingest": ingest,
+        "endpoints": bench_endpoints(client, args.iterations, args.warmup),
+    }
+
+
+def flatten(results):
+    """Map 'dataset/section/name/metric' -> value for comparison"""
+    flat = {}
+    for name, data in results["datasets"].items():
+        flat[f"{name}/ingest/messages_per_sec"] = data["ingest"]["messages_per_sec"]
+        if "startup_ms" in data:
+            flat[f"{name}/startup/total_ms"] = data["startup_ms"]["total"]
+        for url, stats in data["endpoints"].items():
+            for metric in ("p50_ms", "p99_ms"):
+                flat[f"{name}/endpoints/{url}/{metric}"] = stats[metric]
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """Return a list of (key, baseline, current, change) regressions"""
+    current = flatten(results)
+    previous = flatten(baseline)
+    regressions = []
+
+    print(f"\n== comparison against baseline ({baseline['meta']['timestamp']})")
+    for key, value in current.items():
+        if key not in previous or not previous[key]:
+            continue
+
+        change = (value - previous[key]) / previous[key]
+        metric = key.rsplit("/", 1)[-1]
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        marker = "REGRESSION" if worse > threshold else ""
+        print(
+            f"  {key:<60} {previous[key]:>10} -> {value:>10} ({change:+.1%}) {marker}"
+        )
+
+        if worse > threshold:
+            regressions.append((key, previous[key], value, change))
+
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=common.ROOT, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingest and query benchmarks")
+    parser.add_argument(
+        "-d",
+        "--dataset",
+        action="append",
+        choices=list(common.DATASETS),
+        help="Dataset size to run (repeatable, default: 10k)",
+    )
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--reseed", action="store_true", help="Re-create datasets")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative change counted as a regression (default: 0.10)",
+    )
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "mongo_uri": common.MONGO_URI,
+        },
+        "datasets": {},
+    }
+    for name in args.dataset or ["10k"]:
+        results["datasets"][name] = run_dataset(name, args)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = RESULTS_DIR / f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    regressions = []
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
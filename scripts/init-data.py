@@ -1,237 +1,250 @@
 #!/usr/bin/env python3
-# filepath: scripts/seed_sensor_data.py
+# filepath: scripts/init-data.py
 """
 Script to generate sensor data for testing
 Usage:
-    python scripts/seed_sensor_data.py              # Generate 100 records per sensor
-    python scripts/seed_sensor_data.py -c 500       # Generate 500 records per sensor
-    python scripts/seed_sensor_data.py --clear      # Clear existing data first
-    python scripts/seed_sensor_data.py --rain-only  # Generate only rain sensor data
+    # 5 nodes, 1 day, one reading / 60s
+    python scripts/init-data.py
+    # 50 nodes x 30 days x 10s (~65M docs)
+    python scripts/init-data.py -n 50 --days 30 -i 10
+    # Clear existing data first
+    python scripts/init-data.py --clear
+    # Generate only some sensors
+    python scripts/init-data.py --sensor rain --sensor smoke
+    # Show current statistics
+    python scripts/init-data.py --stats
+
+Values are generated with numpy per (sensor, node, chunk) and written with
+unordered insert_many batches from a pool of worker processes, each with its
+own MongoClient.
 """
 import sys
 import os
-import random
 import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 from dotenv import load_dotenv
+from pymongo import MongoClient
 
 # Add project root to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from webapp import partitions
 from webapp.models import sensors
 import mongoengine as me
 
+SENSOR_MODELS = {
+    "rain": sensors.RainSensor,
+    "temperature": sensors.TemperatureSensor,
+    "light": sensors.LightSensor,
+    "humidity": sensors.HumiditySensor,
+    "smoke": sensors.SmokeSensor,
+}
 
-def connect_db():
-    """Connect to MongoDB"""
-    load_dotenv()
-    db_name = os.getenv("MONGODB_DB", "iotdb")
-    db_host = os.getenv("MONGODB_HOST", "localhost")
-    db_port = int(os.getenv("MONGODB_PORT", 27017))
+TITLES = {
+    "rain": "Rain Sensor",
+    "temperature": "Temperature Sensor",
+    "light": "Light Sensor",
+    "humidity": "Humidity Sensor",
+    "smoke": "Smoke Sensor",
+}
 
-    me.connect(db_name, host=db_host, port=db_port)
-    print(f"✓ Connected to MongoDB: {db_host}:{db_port}/{db_name}")
+SEED = 42
 
+# Per worker process state, set up by init_worker()
+worker_db = None
 
-def generate_timestamps(count=100, hours_back=None):
-    """
-    Generate timestamps
-    Args:
-        count: number of timestamps to generate
-        hours_back: if None, spread over 'count' hours; if set, spread over this many hours
-    """
-    now = datetime.datetime.now()
-    if hours_back is None:
-        hours_back = count
-
-    timestamps = []
-    for i in range(count):
-        # Distribute evenly over the time range
-        hours_offset = (i / count) * hours_back
-        ts = now - datetime.timedelta(hours=hours_offset)
-        timestamps.append(ts)
-
-    return timestamps
 
+def get_partitioning():
+    # Same SENSOR_PARTITIONING as the web app and the subscriber
+    load_dotenv()
+    return os.getenv("SENSOR_PARTITIONING", "none")
 
-def seed_rain_sensors(count=100):
-    """
-    Generate rain sensor data
-    Realistic range: 0-50mm per reading
-    """
-    print(f"\n📊 Generating {count} rain sensor records...")
-    timestamps = generate_timestamps(count)
-
-    created = 0
-    for i, ts in enumerate(timestamps):
-        # Rain is often 0, with occasional spikes
-        if random.random() < 0.7:  # 70% chance of no rain
-            value = 0.0
-        else:
-            value = round(random.uniform(0.1, 50), 2)
-
-        rain = sensors.RainSensor(
-            title=f"Rain Sensor Node-{i % 5 + 1}",  # Simulate 5 nodes
-            value=value,
-            timestamp=ts,
-        )
-        rain.save()
-        created += 1
-
-    print(f"✓ Created {created} rain sensor records")
-    return created
-
-
-def seed_temperature_sensors(count=100):
-    """
-    Generate temperature sensor data
-    Realistic range: 15-40°C with daily pattern
-    """
-    print(f"\n🌡️  Generating {count} temperature sensor records...")
-    timestamps = generate_timestamps(count)
-
-    created = 0
-    for i, ts in enumerate(timestamps):
-        # Simulate daily temperature pattern
-        hour = ts.hour
-
-        # Base temperature varies by time of day
-        if 6 <= hour < 12:  # Morning
-            base_temp = random.uniform(20, 28)
-        elif 12 <= hour < 18:  # Afternoon (hottest)
-            base_temp = random.uniform(28, 40)
-        elif 18 <= hour < 22:  # Evening
-            base_temp = random.uniform(22, 30)
-        else:  # Night (coolest)
-            base_temp = random.uniform(15, 25)
-
-        value = round(base_temp + random.uniform(-2, 2), 2)
-
-        temp = sensors.TemperatureSensor(
-            title=f"Temperature Sensor Node-{i % 5 + 1}", value=value, timestamp=ts
-        )
-        temp.save()
-        created += 1
-
-    print(f"✓ Created {created} temperature sensor records")
-    return created
-
-
-def seed_light_sensors(count=100):
-    """
-    Generate light sensor data
-    Realistic range: 0-10000 lux with day/night pattern
-    """
-    print(f"\n💡 Generating {count} light sensor records...")
-    timestamps = generate_timestamps(count)
-
-    created = 0
-    for i, ts in enumerate(timestamps):
-        hour = ts.hour
 
-        # Simulate day/night light pattern
-        if 6 <= hour < 18:  # Daytime
-            value = round(random.uniform(1000, 10000), 2)
-        elif 5 <= hour < 6 or 18 <= hour < 19:  # Dawn/Dusk
-            value = round(random.uniform(100, 1000), 2)
-        else:  # Night
-            value = round(random.uniform(0, 100), 2)
+def get_db_settings():
+    load_dotenv()
+    db_name = os.getenv("MONGODB_DB", "iotdb")
+    db_host = os.getenv("MONGODB_HOST", "localhost")
+    db_port = int(os.getenv("MONGODB_PORT", 27017))
+    return db_name, db_host, db_port
 
-        light = sensors.LightSensor(
-            title=f"Light Sensor Node-{i % 5 + 1}", value=value, timestamp=ts
-        )
-        light.save()
-        created += 1
 
-    print(f"✓ Created {created} light sensor records")
-    return created
+def connect_db():
+    """Connect to MongoDB"""
+    db_name, db_host, db_port = get_db_settings()
+    me.connect(db_name, host=db_host, port=db_port)
+    print(f"✓ Connected to MongoDB: {db_host}:{db_port}/{db_name}")
 
 
-def seed_humidity_sensors(count=100):
+def init_worker():
+    global worker_db
+    db_name, db_host, db_port = get_db_settings()
+    worker_db = MongoClient(db_host, db_port)[db_name]
+
+
+def hour_of_day(timestamps):
+    return (timestamps.astype("datetime64[h]").astype(np.int64) % 24).astype(np.int64)
+
+
+def generate_values(sensor, timestamps, rng):
+    """Vectorized value generation with daily patterns"""
+    hour = hour_of_day(timestamps)
+    size = len(timestamps)
+
+    morning = (hour >= 6) & (hour < 12)
+    afternoon = (hour >= 12) & (hour < 18)
+    evening = (hour >= 18) & (hour < 22)
+
+    if sensor == "temperature":
+        # Realistic range: 15-40°C, hottest in the afternoon
+        low = np.select([morning, afternoon, evening], [20, 28, 22], default=15)
+        high = np.select([morning, afternoon, evening], [28, 40, 30], default=25)
+        values = rng.uniform(low, high) + rng.uniform(-2, 2, size)
+        return np.round(values, 2)
+
+    if sensor == "humidity":
+        # Realistic range: 20-100%, driest in the afternoon
+        low = np.select([morning, afternoon], [60, 40], default=70)
+        high = np.select([morning, afternoon], [80, 60], default=95)
+        values = rng.uniform(low, high) + rng.uniform(-5, 5, size)
+        return np.clip(np.round(values, 2), 20, 100)
+
+    if sensor == "light":
+        # Dark at night, with some noise around dawn/dusk
+        dark = (hour < 6) | (hour >= 19)
+        twilight = (hour == 5) | (hour == 18)
+        return dark | (twilight & (rng.random(size) < 0.5))
+
+    if sensor == "rain":
+        # Rain comes in spells: flip state rarely and carry it forward
+        flips = rng.random(size) < 0.01
+        return (np.cumsum(flips) % 2).astype(bool)
+
+    # smoke: very rare positives
+    return rng.random(size) < 0.0005
+
+
+def seed_chunk(sensor, node, start, interval_ms, offset, count, batch_size):
+    """Generate and insert one chunk of readings for a single node"""
+    rng = np.random.default_rng([SEED, list(SENSOR_MODELS).index(sensor), node, offset])
+    index = np.arange(offset, offset + count, dtype=np.int64)
+    offsets = (index * interval_ms).astype("timedelta64[ms]")
+    timestamps = np.datetime64(start, "ms") + offsets
+    values = generate_values(sensor, timestamps, rng)
+
+    title = f"{TITLES[sensor]} Node-{node}"
+    node_id = f"node-{node:02d}"
+    base = SENSOR_MODELS[sensor]._get_collection_name()
+    scheme = get_partitioning()
+
+    ts_list = timestamps.tolist()
+    value_list = values.tolist()
+    for i in range(0, count, batch_size):
+        batch = zip(value_list[i : i + batch_size], ts_list[i : i + batch_size])
+        docs = [
+            {"title": title, "node": node_id, "value": value, "timestamp": ts}
+            for value, ts in batch
+        ]
+        grouped = partitions.group_by_collection(base, docs, scheme)
+        for name, part in grouped.items():
+            if name != base:
+                worker_db[name].create_index("timestamp")
+            worker_db[name].insert_many(part, ordered=False)
+
+    return sensor, count
+
+
+def seed_sensors(sensor_names, nodes, interval, days, workers, batch_size):
     """
-    Generate humidity sensor data
-    Realistic range: 20-100%
+    Generate readings for every sensor and node between now - days and now
+    Returns the number of documents created
     """
-    print(f"\n💧 Generating {count} humidity sensor records...")
-    timestamps = generate_timestamps(count)
-
-    created = 0
-    for i, ts in enumerate(timestamps):
-        # Higher humidity at night, lower during hot afternoon
-        hour = ts.hour
+    per_node = int(days * 86400 // interval)
+    interval_ms = int(interval * 1000)
+    end = datetime.datetime.now().replace(microsecond=0)
+    start = end - datetime.timedelta(milliseconds=interval_ms * (per_node - 1))
 
-        if 6 <= hour < 12:  # Morning
-            base_humidity = random.uniform(60, 80)
-        elif 12 <= hour < 18:  # Afternoon (driest)
-            base_humidity = random.uniform(40, 60)
-        else:  # Night/Evening (most humid)
-            base_humidity = random.uniform(70, 95)
-
-        value = round(base_humidity + random.uniform(-5, 5), 2)
-        value = max(20, min(100, value))  # Clamp to 20-100
-
-        humidity = sensors.HumiditySensor(
-            title=f"Humidity Sensor Node-{i % 5 + 1}", value=value, timestamp=ts
-        )
-        humidity.save()
-        created += 1
+    total = per_node * nodes * len(sensor_names)
+    print(
+        f"\n📊 Generating {total:,} records "
+        f"({len(sensor_names)} sensors x {nodes} nodes x {per_node:,} readings, "
+        f"every {interval}s over {days} days) with {workers} workers..."
+    )
 
-    print(f"✓ Created {created} humidity sensor records")
-    return created
+    # Chunks are several batches long so each task amortises its setup cost
+    chunk = batch_size * 10
+    tasks = [
+        (sensor, node, start, interval_ms, offset, min(chunk, per_node - offset))
+        for sensor in sensor_names
+        for node in range(1, nodes + 1)
+        for offset in range(0, per_node, chunk)
+    ]
+
+    created = {sensor: 0 for sensor in sensor_names}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(seed_chunk, *task, batch_size) for task in tasks]
+        for future in as_completed(futures):
+            sensor, count = future.result()
+            created[sensor] += count
+
+    elapsed = time.perf_counter() - started
+    for sensor, count in created.items():
+        print(f"✓ Created {count:,} {sensor} sensor records")
+    rate = total / max(elapsed, 1e-9)
+    print(f"⚡ {total:,} records in {elapsed:.1f}s ({rate:,.0f} docs/sec)")
+    return total
 
 
 def clear_all_sensors():
     """Clear all sensor data from all collections"""
     print("\n🗑️  Clearing all sensor data...")
 
-    rain_count = sensors.RainSensor.objects.delete()
-    temp_count = sensors.TemperatureSensor.objects.delete()
-    light_count = sensors.LightSensor.objects.delete()
-    humidity_count = sensors.HumiditySensor.objects.delete()
+    counts = {name: model.objects.delete() for name, model in SENSOR_MODELS.items()}
 
-    total = rain_count + temp_count + light_count + humidity_count
-    print(f"✓ Cleared {total} total records")
-    print(f"  - Rain: {rain_count}")
-    print(f"  - Temperature: {temp_count}")
-    print(f"  - Light: {light_count}")
-    print(f"  - Humidity: {humidity_count}")
+    # Partitions are dropped outright
+    db = me.get_db()
+    names = db.list_collection_names()
+    for name, model in SENSOR_MODELS.items():
+        base = model._get_collection_name()
+        for partition, _, _ in partitions.partitions_of(base, names):
+            counts[name] += db[partition].estimated_document_count()
+            db.drop_collection(partition)
+
+    print(f"✓ Cleared {sum(counts.values())} total records")
+    for name, count in counts.items():
+        print(f"  - {name.capitalize()}: {count}")
 
 
 def show_stats():
     """Show statistics of generated data"""
+    db = me.get_db()
+    names = db.list_collection_names()
+
+    def sensor_collections(model):
+        base = model._get_collection_name()
+        found = [name for name, _, _ in partitions.partitions_of(base, names)]
+        return [db[name] for name in [base, *found]]
+
     print("\n📈 Current Data Statistics:")
-    print(f"  Rain sensors:        {sensors.RainSensor.objects.count():>6} records")
-    print(
-        f"  Temperature sensors: {sensors.TemperatureSensor.objects.count():>6} records"
-    )
-    print(f"  Light sensors:       {sensors.LightSensor.objects.count():>6} records")
-    print(f"  Humidity sensors:    {sensors.HumiditySensor.objects.count():>6} records")
+    for name, model in SENSOR_MODELS.items():
+        label = f"{name.capitalize()} sensors:"
+        count = sum(c.estimated_document_count() for c in sensor_collections(model))
+        print(f"  {label:<21}{count:>10} records")
 
     # Show latest record from each
     print("\n📋 Latest Records:")
-
-    latest_rain = sensors.RainSensor.objects.order_by("-timestamp").first()
-    if latest_rain:
-        print(
-            f"  Rain:        {latest_rain.value:>6.2f} mm    @ {latest_rain.timestamp}"
-        )
-
-    latest_temp = sensors.TemperatureSensor.objects.order_by("-timestamp").first()
-    if latest_temp:
-        print(
-            f"  Temperature: {latest_temp.value:>6.2f} °C   @ {latest_temp.timestamp}"
-        )
-
-    latest_light = sensors.LightSensor.objects.order_by("-timestamp").first()
-    if latest_light:
-        print(
-            f"  Light:       {latest_light.value:>6.2f} lux  @ {latest_light.timestamp}"
-        )
-
-    latest_humidity = sensors.HumiditySensor.objects.order_by("-timestamp").first()
-    if latest_humidity:
-        print(
-            f"  Humidity:    {latest_humidity.value:>6.2f} %    @ {latest_humidity.timestamp}"
-        )
+    for name, model in SENSOR_MODELS.items():
+        found = [
+            doc
+            for c in sensor_collections(model)
+            if (doc := c.find_one(sort=[("timestamp", -1)]))
+        ]
+        if found:
+            latest = max(found, key=lambda d: d["timestamp"])
+            label = f"{name.capitalize()}:"
+            print(f"  {label:<13}{latest['value']!s:>8}  @ {latest['timestamp']}")
 
 
 def main():
@@ -243,37 +256,45 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  python scripts/seed_sensor_data.py                    # Generate 100 records per sensor
-  python scripts/seed_sensor_data.py -c 500             # Generate 500 records per sensor
-  python scripts/seed_sensor_data.py --clear            # Clear existing data first
-  python scripts/seed_sensor_data.py --rain-only -c 200 # Generate only rain data
-  python scripts/seed_sensor_data.py --stats            # Show current statistics
+  python scripts/init-data.py                             # 5 nodes, 1 day, every 60s
+  python scripts/init-data.py -n 50 --days 30 -i 10       # 50 nodes x 30 days x 10s
+  python scripts/init-data.py --clear                     # Clear existing data first
+  python scripts/init-data.py --sensor rain --days 7      # Generate only rain data
+  python scripts/init-data.py --stats                     # Show current statistics
         """,
     )
 
     parser.add_argument(
-        "-c",
-        "--count",
-        type=int,
-        default=100,
-        help="Number of records per sensor type (default: 100)",
+        "-n", "--nodes", type=int, default=5, help="Number of sensor nodes (default: 5)"
     )
     parser.add_argument(
-        "--clear", action="store_true", help="Clear existing data before generating"
+        "-i",
+        "--interval",
+        type=float,
+        default=60,
+        help="Seconds between readings of one node (default: 60)",
     )
     parser.add_argument(
-        "--rain-only", action="store_true", help="Generate only rain sensor data"
+        "--days", type=float, default=1, help="Time span to generate (default: 1)"
     )
     parser.add_argument(
-        "--temp-only", action="store_true", help="Generate only temperature sensor data"
+        "--sensor",
+        action="append",
+        choices=list(SENSOR_MODELS),
+        help="Sensor type to generate (repeatable, default: all)",
     )
     parser.add_argument(
-        "--light-only", action="store_true", help="Generate only light sensor data"
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes (default: CPU count)",
     )
     parser.add_argument(
-        "--humidity-only",
-        action="store_true",
-        help="Generate only humidity sensor data",
+        "--batch-size", type=int, default=10_000, help="Documents per insert_many"
+    )
+    parser.add_argument(
+        "--clear", action="store_true", help="Clear existing data before generating"
     )
     parser.add_argument("--stats", action="store_true", help="Show statistics and exit")
 
@@ -291,25 +312,16 @@ Examples:
     if args.clear:
         clear_all_sensors()
 
-    # Generate data based on flags
-    total_created = 0
-
-    if args.rain_only:
-        total_created += seed_rain_sensors(args.count)
-    elif args.temp_only:
-        total_created += seed_temperature_sensors(args.count)
-    elif args.light_only:
-        total_created += seed_light_sensors(args.count)
-    elif args.humidity_only:
-        total_created += seed_humidity_sensors(args.count)
-    else:
-        # Generate all sensor types
-        total_created += seed_rain_sensors(args.count)
-        total_created += seed_temperature_sensors(args.count)
-        total_created += seed_light_sensors(args.count)
-        total_created += seed_humidity_sensors(args.count)
-
-    print(f"\n✅ Successfully generated {total_created} total records!")
+    total_created = seed_sensors(
+        args.sensor or list(SENSOR_MODELS),
+        nodes=args.nodes,
+        interval=args.interval,
+        days=args.days,
+        workers=args.workers,
+        batch_size=args.batch_size,
+    )
+
+    print(f"\n✅ Successfully generated {total_created:,} total records!")
 
     # Show final statistics
     show_stats()
@@ -1,78 +1,919 @@
+import collections
 import json
+import multiprocessing
 import os
+import queue
+import signal
+import sys
 import datetime
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from google.cloud import pubsub_v1
 from pymongo import MongoClient
 
+# Add project root to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from webapp import (
+    cache,
+    ingest_schema,
+    metrics,
+    mongo_options,
+    partitions,
+    rollups,
+    sqlite_store,
+)
+
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "./keycredentials.json"
 project_id = "sda-project-486506"
 subscription_id = "sensor-data-sub"
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongodb:27017/")
-client = MongoClient(MONGO_URI)
+# Pool size, timeouts and compression come from the same MONGODB_* variables
+# as the web app (see webapp/mongo_options.py)
+client = MongoClient(
+    MONGO_URI,
+    event_listeners=metrics.mongo_listeners,
+    **mongo_options.client_options(os.environ),
+)
 db = client["iotdb"]
 
+# "mongo" or "sqlite" (webapp/sqlite_store.py), must match the web app
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+store = None
+if STORAGE_BACKEND == "sqlite":
+    store = sqlite_store.SQLiteStore(os.getenv("SQLITE_PATH", "data/readings.sqlite3"))
 
-def callback(message):
-    try:
-        raw_data = json.loads(message.data.decode("utf-8"))
-        ts = datetime.datetime.fromtimestamp(
-            raw_data.get("timestamp", datetime.datetime.now().timestamp())
-        )
+# "none", "monthly" or "weekly", must match the web app (webapp/partitions.py)
+PARTITIONING = os.getenv("SENSOR_PARTITIONING", "none")
 
-        db["temp_sensor"].insert_one(
-            {
-                "title": "Temperature Reading",
-                "value": float(raw_data.get("temperature", 0)),
-                "timestamp": ts,
-            }
-        )
+# Keep the hourly rollups (webapp/rollups.py) up to date on every write;
+# python -m webapp.cmd.backfill rollups fills in the history. MongoDB only.
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+# Seconds between merges of the buffered readings into the rollups
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", 1.0))
+live_rollups = None
+if ROLLUPS_ENABLED and store is None:
+    live_rollups = rollups.LiveRollups(db, ROLLUP_INTERVAL)
 
-        # Humidity Sensor
-        db["humidity_sensor"].insert_one(
-            {
-                "title": "Humidity Reading",
-                "value": float(raw_data.get("humidity", 0)),
-                "timestamp": ts,
-            }
-        )
+# Web app result cache to invalidate after writes; must be shared with the
+# web replicas (file:// on a common volume or redis://), unset disables
+CACHE_URL = os.getenv("CACHE_URL")
+if CACHE_URL:
+    cache.result_cache.configure(cache.create_backend(CACHE_URL))
+
+# Bulk (non-critical) telemetry is buffered and written with insert_many.
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 100))
+BATCH_INTERVAL = float(os.getenv("BATCH_INTERVAL", 1.0))
+
+# Messages that fail validation, or fail to transform MAX_DELIVERY_ATTEMPTS
+# times, are acked and stored with the reason in QUARANTINE_COLLECTION, or
+# appended as JSON lines to QUARANTINE_FILE when set (always a file with the
+# SQLite backend, default data/quarantine.jsonl). Failed writes are nacked
+# and retried without counting towards the limit.
+MAX_DELIVERY_ATTEMPTS = int(os.getenv("MAX_DELIVERY_ATTEMPTS", 5))
+QUARANTINE_COLLECTION = os.getenv("QUARANTINE_COLLECTION", "ingest_quarantine")
+QUARANTINE_FILE = os.getenv("QUARANTINE_FILE") or (
+    "data/quarantine.jsonl" if store is not None else None
+)
+if QUARANTINE_FILE and os.path.dirname(QUARANTINE_FILE):
+    os.makedirs(os.path.dirname(QUARANTINE_FILE), exist_ok=True)
+
+# Extra critical conditions on top of is_smoke, e.g.
+# CRITICAL_CONDITIONS='{"temperature": {"gt": 60}, "humidity": {"lt": 5}}'
+CRITICAL_CONDITIONS = json.loads(os.getenv("CRITICAL_CONDITIONS", "{}"))
+
+# Optional webhook that receives a JSON POST for every critical reading.
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL")
+
+LATENCY_REPORT_INTERVAL = float(os.getenv("LATENCY_REPORT_INTERVAL", 60))
+
+# Prometheus scrape endpoint (also /healthz), 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Supervisor mode: worker processes that decode and write messages, routed by
+# node id so each node's readings are handled in order by one worker; 0 keeps
+# everything in this process
+SUBSCRIBER_WORKERS = int(os.getenv("SUBSCRIBER_WORKERS", 0))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 1000))
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", 5))
+# A worker without a heartbeat for this long fails /healthz
+WORKER_STALL_TIMEOUT = float(os.getenv("WORKER_STALL_TIMEOUT", 60))
+# Messages a worker never answered are nacked after this long
+PENDING_TIMEOUT = float(os.getenv("PENDING_TIMEOUT", 600))
+# Seconds workers get to finish queued messages on shutdown
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+
+MESSAGES = metrics.Counter(
+    "subscriber_messages_total", "Messages written and acked, by lane", ["lane"]
+)
+ERRORS = metrics.Counter(
+    "subscriber_errors_total", "Messages that failed processing, by stage", ["stage"]
+)
+BATCH_SIZES = metrics.Histogram(
+    "subscriber_batch_size",
+    "Messages per bulk flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+REJECTED = metrics.Counter(
+    "subscriber_rejected_total",
+    "Messages quarantined, by reason and field",
+    ["reason", "field"],
+)
+WORKER_MESSAGES = metrics.Counter(
+    "subscriber_worker_messages_total",
+    "Messages acked or nacked for a worker process",
+    ["worker", "result"],
+)
+WORKER_INFLIGHT = metrics.Gauge(
+    "subscriber_worker_inflight",
+    "Messages routed to a worker, not yet acked",
+    ["worker"],
+)
+WORKER_LAG = metrics.Gauge(
+    "subscriber_worker_lag_seconds",
+    "Age of the oldest message a worker has not acked",
+    ["worker"],
+)
+WORKER_RESTARTS = metrics.Counter(
+    "subscriber_worker_restarts_total", "Worker processes restarted", ["worker"]
+)
+ACK_LATENCY = metrics.Histogram(
+    "subscriber_ack_latency_seconds",
+    "Publish to ack latency, by lane",
+    ["lane"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+OPERATORS = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+    "eq": lambda a, b: a == b,
+}
 
+
+def build_documents(reading):
+    """Transform one validated message into the documents for each sensor collection"""
+    ts = datetime.datetime.fromtimestamp(
+        reading.get("timestamp", datetime.datetime.now().timestamp())
+    )
+
+    documents = {
+        # Smoke first so the priority path lands the fire signal before the rest
+        "smoke_sensor": {
+            "title": "Smoke Status",
+            "value": reading["is_smoke"],
+            "timestamp": ts,
+        },
+        "temp_sensor": {
+            "title": "Temperature Reading",
+            "value": reading["temperature"],
+            "timestamp": ts,
+        },
+        "humidity_sensor": {
+            "title": "Humidity Reading",
+            "value": reading["humidity"],
+            "timestamp": ts,
+        },
         # Light Sensor (Boolean)
-        db["light_sensor"].insert_one(
-            {
-                "title": "Light Status",
-                "value": bool(raw_data.get("is_dark")),  # บันทึกเป็น Boolean
-                "timestamp": ts,
-            }
+        "light_sensor": {
+            "title": "Light Status",
+            "value": reading["is_dark"],  # บันทึกเป็น Boolean
+            "timestamp": ts,
+        },
+        # Rain Sensor (Boolean)
+        "rain_sensor": {
+            "title": "Rain Status",
+            "value": reading["is_raining"],  # บันทึกเป็น Boolean
+            "timestamp": ts,
+        },
+    }
+
+    if "node" in reading:
+        for doc in documents.values():
+            doc["node"] = reading["node"]
+    return documents
+
+
+def critical_reasons(raw_data):
+    """Return the reasons a reading must skip the bulk queue (empty if none)"""
+    reasons = []
+    if raw_data.get("is_smoke") in (True, 1):
+        reasons.append("is_smoke")
+
+    for field, rules in CRITICAL_CONDITIONS.items():
+        if raw_data.get(field) is None:
+            continue
+        for op, threshold in rules.items():
+            try:
+                if OPERATORS[op](float(raw_data[field]), threshold):
+                    reasons.append(f"{field} {op} {threshold}")
+            except (KeyError, TypeError, ValueError):
+                continue
+
+    return reasons
+
+
+class LatencyStats:
+    """End-to-end latency (publish -> ack) for one lane"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.samples = []
+
+    def observe(self, message):
+        MESSAGES.inc(lane=self.name)
+        publish_time = getattr(message, "publish_time", None)
+        if publish_time is None:
+            return
+        latency = time.time() - publish_time.timestamp()
+        ACK_LATENCY.observe(latency, lane=self.name)
+        with self.lock:
+            self.samples.append(latency)
+
+    def report(self):
+        with self.lock:
+            samples, self.samples = sorted(self.samples), []
+        if not samples:
+            return
+        p50 = samples[len(samples) // 2]
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(
+            f"⏱  {self.name}: n={len(samples)} "
+            f"p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms "
+            f"max={samples[-1] * 1000:.1f}ms"
         )
 
-        # Rain Sensor (Boolean)
-        db["rain_sensor"].insert_one(
-            {
-                "title": "Rain Status",
-                "value": bool(raw_data.get("is_raining")),  # บันทึกเป็น Boolean
-                "timestamp": ts,
-            }
+
+priority_latency = LatencyStats("priority")
+bulk_latency = LatencyStats("bulk")
+
+
+def notify(raw_data, reasons):
+    """Send an alert for a critical reading without blocking the ack"""
+    print(f"🔥 Critical reading: {', '.join(reasons)} {raw_data}")
+    if not ALERT_WEBHOOK_URL:
+        return
+
+    def send():
+        body = json.dumps({"reasons": reasons, "reading": raw_data}).encode("utf-8")
+        req = urllib.request.Request(
+            ALERT_WEBHOOK_URL,
+            data=body,
+            headers={"Content-Type": "application/json"},
         )
-        db["smoke_sensor"].insert_one(
+        try:
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            ERRORS.inc(stage="notify")
+            print(f"❌ Alert webhook failed: {e}")
+
+    threading.Thread(target=send, daemon=True).start()
+
+
+indexed_partitions = set()
+
+
+def target_collection(collection, doc):
+    """Partition for the reading, created with its timestamp index on first use"""
+    if store is not None:
+        # SQLite keeps every sensor in one indexed table
+        return collection
+    name = partitions.collection_for(collection, doc["timestamp"], PARTITIONING)
+    if name != collection and name not in indexed_partitions:
+        db[name].create_index("timestamp")
+        indexed_partitions.add(name)
+    return name
+
+
+class BulkWriter:
+    """Buffers bulk readings and flushes them with one insert_many per collection.
+
+    Messages are acked only after the batch containing them is written, so a crash
+    before the flush results in redelivery rather than data loss.
+    """
+
+    def __init__(self, batch_size, interval):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.documents = {}
+        self.messages = []
+
+    def add(self, documents, message):
+        with self.lock:
+            for collection, doc in documents.items():
+                target = target_collection(collection, doc)
+                self.documents.setdefault(target, []).append(doc)
+            self.messages.append(message)
+            full = len(self.messages) >= self.batch_size
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            documents, self.documents = self.documents, {}
+            messages, self.messages = self.messages, []
+
+        if not messages:
+            return
+
+        BATCH_SIZES.observe(len(messages))
+        try:
+            write(documents)
+        except Exception as e:
+            # Like every write failure, retried without counting an attempt
+            ERRORS.inc(len(messages), stage="batch_write")
+            print(f"❌ Error during batch save ({len(messages)} messages): {e}")
+            for message in messages:
+                message.nack()
+            return
+
+        invalidate_cache(documents)
+        for message in messages:
+            message.ack()
+            bulk_latency.observe(message)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+bulk_writer = BulkWriter(BATCH_SIZE, BATCH_INTERVAL)
+
+
+def write(documents):
+    """Write {collection: [documents]}, one transaction for SQLite"""
+    if store is not None:
+        store.insert(documents)
+        return
+    for collection, docs in documents.items():
+        db[collection].insert_many(docs, ordered=False)
+
+    if live_rollups is not None:
+        # Merged into the rollups by a background thread, off the ack path
+        live_rollups.add(documents)
+
+
+def rollup_failed(error):
+    # Kept for the next flush; a backfill of the range repairs anything lost
+    ERRORS.inc(stage="rollups")
+    print(f"❌ Error updating rollups: {error}")
+
+
+def start_rollups():
+    if live_rollups is not None:
+        threading.Thread(
+            target=live_rollups.run, args=(rollup_failed,), daemon=True
+        ).start()
+
+
+def flush_rollups():
+    if live_rollups is not None:
+        try:
+            live_rollups.flush()
+        except Exception as e:
+            rollup_failed(e)
+
+
+def invalidate_cache(collections):
+    """Drop the web app's cached results for every collection written"""
+    if CACHE_URL:
+        cache.result_cache.invalidate(
+            *{partitions.base_collection(name) for name in collections}
+        )
+
+
+def handle_priority(documents, message, raw_data, reasons):
+    """Unbatched path: write, ack and notify immediately"""
+    try:
+        write(
             {
-                "title": "Smoke Status",
-                "value": bool(raw_data.get("is_smoke")),
-                "timestamp": ts,
+                target_collection(collection, doc): [doc]
+                for collection, doc in documents.items()
             }
         )
-        message.ack()
+    except Exception:
+        # Alert now, the reading itself is stored on redelivery
+        notify(raw_data, reasons)
+        raise
+    invalidate_cache(documents)
+    message.ack()
+    priority_latency.observe(message)
+    notify(raw_data, reasons)
+
+
+validate_message = ingest_schema.compile_schema(ingest_schema.MESSAGE_SCHEMA)
+
+quarantine_lock = threading.Lock()
+
+# message id -> failed attempts seen by this process, oldest first
+failed_attempts = collections.OrderedDict()
+MAX_TRACKED_FAILURES = 10_000
+
+
+def quarantine(message, errors):
+    """Store a message that can't be processed with its reasons, then ack it"""
+    publish_time = getattr(message, "publish_time", None)
+    entry = {
+        "message_id": getattr(message, "message_id", None),
+        "publish_time": publish_time.isoformat() if publish_time else None,
+        "quarantined_at": datetime.datetime.now().isoformat(),
+        "errors": [{"reason": reason, "field": field} for reason, field in errors],
+        "data": message.data.decode("utf-8", "replace"),
+    }
+    try:
+        if QUARANTINE_FILE:
+            line = json.dumps(entry, ensure_ascii=False) + "\n"
+            with quarantine_lock, open(QUARANTINE_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+        else:
+            db[QUARANTINE_COLLECTION].insert_one(entry)
     except Exception as e:
-        print(f"❌ Error during transformation/save: {e}")
+        # Keep the message rather than lose it
+        ERRORS.inc(stage="quarantine")
+        print(f"❌ Quarantine failed, message kept for redelivery: {e}")
+        message.nack()
+        return
+
+    for reason, field in errors:
+        REJECTED.inc(reason=reason, field=field)
+    message.ack()
+    print(f"🚫 Quarantined message {entry['message_id']}: {entry['errors']}")
 
-subscriber = pubsub_v1.SubscriberClient()
-subscription_path = subscriber.subscription_path(project_id, subscription_id)
 
-print(f"Listening for messages on {subscription_id} and routing to 4 collections...")
-streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback)
+def record_failure(message):
+    """Delivery attempts that failed so far, including this one"""
+    attempt = getattr(message, "delivery_attempt", None)
+    message_id = getattr(message, "message_id", None)
+    if message_id is None:
+        return attempt or 1
 
-with subscriber:
+    count = failed_attempts.pop(message_id, 0) + 1
+    failed_attempts[message_id] = count
+    if len(failed_attempts) > MAX_TRACKED_FAILURES:
+        failed_attempts.popitem(last=False)
+    # Pub/Sub counts attempts itself when the subscription has a dead-letter policy
+    return max(count, attempt or 0)
+
+
+def callback(message):
     try:
-        streaming_pull_future.result()
-    except KeyboardInterrupt:
+        raw_data = json.loads(message.data)
+    except ValueError:
+        quarantine(message, [("invalid_json", "message")])
+        return
+
+    # From the raw payload, so a smoke alert is raised even when another
+    # field (a NaN or out of range temperature) gets the message quarantined
+    reasons = critical_reasons(raw_data) if isinstance(raw_data, dict) else []
+    reading, errors = validate_message(raw_data)
+    if errors:
+        if reasons:
+            notify(raw_data, reasons)
+        quarantine(message, errors)
+        return
+
+    try:
+        documents = build_documents(reading)
+    except Exception as e:
+        # Fails the same way on every delivery, quarantined after a few
+        ERRORS.inc(stage="transform")
+        print(f"❌ Error during transformation: {e}")
+        if record_failure(message) >= MAX_DELIVERY_ATTEMPTS:
+            quarantine(message, [("error", type(e).__name__)])
+        else:
+            message.nack()
+        return
+
+    try:
+        if reasons:
+            handle_priority(documents, message, raw_data, reasons)
+        else:
+            bulk_writer.add(documents, message)
+    except Exception as e:
+        # Storage outages are transient: redeliver, never quarantine
+        ERRORS.inc(stage="write")
+        print(f"❌ Error during save: {e}")
+        message.nack()
+
+
+def report_latency():
+    while True:
+        time.sleep(LATENCY_REPORT_INTERVAL)
+        priority_latency.report()
+        bulk_latency.report()
+
+
+# Set by the supervisor, returns (healthy, details) for /healthz
+health_check = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/healthz":
+            healthy, details = health_check() if health_check else (True, {})
+            body = json.dumps({"healthy": healthy, **details}).encode("utf-8")
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on :{port}/metrics")
+
+
+class RoutedMessage:
+    """A message handed to a worker process; ack/nack go back to the supervisor"""
+
+    def __init__(self, seq, data, publish_time, results, message_id, delivery_attempt):
+        self.seq = seq
+        self.data = data
+        self.message_id = message_id
+        self.delivery_attempt = delivery_attempt
+        self.publish_time = datetime.datetime.fromtimestamp(publish_time, datetime.UTC)
+        self.results = results
+
+    def ack(self):
+        self.results.put(("ack", self.seq))
+
+    def nack(self):
+        self.results.put(("nack", self.seq))
+
+
+def worker_main(worker_id, inbox, results):
+    """Worker process: the single-process pipeline fed from the supervisor"""
+    # Ctrl-C and SIGTERM go to the supervisor, which drains the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    threading.Thread(target=bulk_writer.run, daemon=True).start()
+    threading.Thread(target=report_latency, daemon=True).start()
+    start_rollups()
+
+    processed = 0
+    last_heartbeat = 0.0
+    while True:
+        try:
+            item = inbox.get(timeout=HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            item = False
+
+        if item is None:
+            break
+        if item:
+            seq, data, publish_time, message_id, attempt = item
+            callback(
+                RoutedMessage(seq, data, publish_time, results, message_id, attempt)
+            )
+            processed += 1
+
+        if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+            # The supervisor serves this process's metrics from the snapshot
+            results.put(("heartbeat", worker_id, processed, metrics.snapshot()))
+            last_heartbeat = time.monotonic()
+
+    # Drain: write what is buffered so its messages are acked, not redelivered
+    bulk_writer.flush()
+    flush_rollups()
+    results.put(("exit", worker_id, processed, metrics.snapshot()))
+
+
+def route_key(message):
+    """Node id of a message: ordering key, "node" attribute or payload field"""
+    if getattr(message, "ordering_key", ""):
+        return message.ordering_key
+    attributes = getattr(message, "attributes", None)
+    node = attributes.get("node") if attributes else None
+    if node:
+        return node
+    try:
+        node = json.loads(message.data).get("node")
+    except (ValueError, AttributeError):
+        return None
+    return str(node) if node is not None else None
+
+
+class Supervisor:
+    """
+    Receives from Pub/Sub and routes each message to the worker process
+    owning its node (crc32 of the node id), so decoding and writing run on
+    every core and a node's messages are queued to one worker in the order
+    they are routed. Pub/Sub runs callbacks concurrently, so that is the
+    order they were published only with message ordering enabled on the
+    subscription (the client then hands over a key's next message after the
+    previous one is acked). Messages without a node are spread round-robin.
+    Acks happen here, when a worker reports the message as written. Workers
+    that die are restarted and their messages nacked for redelivery.
+
+    Workers send a snapshot of their metrics with every heartbeat;
+    metric_snapshots() adds them to this process's /metrics.
+    """
+
+    def __init__(self, workers):
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.lock = threading.Lock()
+        self.pending = {}  # seq -> (message, worker, routed at)
+        self.seq = 0
+        self.round_robin = 0
+        self.draining = threading.Event()
+        self.processes = [None] * workers
+        self.queues = [None] * workers
+        self.heartbeats = [0.0] * workers
+        self.acked = [0] * workers
+        # Routing to a worker is serialised so its queue keeps routing order
+        self.route_locks = [threading.Lock() for _ in range(workers)]
+        self.worker_metrics = [None] * workers
+        # Counters and histograms of workers that exited
+        self.retired_metrics = {}
+        for worker in range(workers):
+            self.start_worker(worker)
+
+    def start_worker(self, worker):
+        with self.lock:
+            if self.worker_metrics[worker]:
+                self.retired_metrics = metrics.combine(
+                    [self.retired_metrics, self.worker_metrics[worker]], gauges=False
+                )
+            self.worker_metrics[worker] = None
+        inbox = self.context.Queue(WORKER_QUEUE_SIZE)
+        process = self.context.Process(
+            target=worker_main,
+            args=(worker, inbox, self.results),
+            name=f"subscriber-worker-{worker}",
+            daemon=True,
+        )
+        process.start()
+        self.queues[worker] = inbox
+        self.processes[worker] = process
+        self.heartbeats[worker] = time.monotonic()
+
+    def route(self, message):
+        if self.draining.is_set():
+            # Shutting down: hand it back to Pub/Sub for another subscriber
+            message.nack()
+            return
+
+        key = route_key(message)
+        with self.lock:
+            if key is None:
+                worker = self.round_robin % len(self.queues)
+                self.round_robin += 1
+            else:
+                worker = zlib.crc32(key.encode("utf-8")) % len(self.queues)
+
+        publish_time = getattr(message, "publish_time", None)
+        publish_time = publish_time.timestamp() if publish_time else time.time()
+        with self.route_locks[worker]:
+            with self.lock:
+                self.seq += 1
+                seq = self.seq
+                self.pending[seq] = (message, worker, time.monotonic())
+                inbox = self.queues[worker]
+                process = self.processes[worker]
+            item = (
+                seq,
+                message.data,
+                publish_time,
+                getattr(message, "message_id", None),
+                getattr(message, "delivery_attempt", None),
+            )
+            # Blocks while the worker is behind, which holds back Pub/Sub
+            # delivery, but never on the queue of a worker that died
+            while True:
+                try:
+                    inbox.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if not process.is_alive() or self.draining.is_set():
+                        break
+        self.settle(seq, False)
+
+    def settle(self, seq, ack):
+        with self.lock:
+            entry = self.pending.pop(seq, None)
+        if entry is None:
+            return
+        message, worker, _ = entry
+        if ack:
+            message.ack()
+            self.acked[worker] += 1
+        else:
+            message.nack()
+        WORKER_MESSAGES.inc(worker=str(worker), result="ack" if ack else "nack")
+
+    def handle_results(self):
+        while True:
+            kind, *data = self.results.get()
+            if kind == "ack":
+                self.settle(data[0], True)
+            elif kind == "nack":
+                self.settle(data[0], False)
+            elif kind in ("heartbeat", "exit"):
+                worker, _, snapshot = data
+                self.heartbeats[worker] = time.monotonic()
+                with self.lock:
+                    self.worker_metrics[worker] = snapshot
+
+    def metric_snapshots(self):
+        with self.lock:
+            return [self.retired_metrics] + [m for m in self.worker_metrics if m]
+
+    def nack_pending(self, worker=None, older_than=None):
+        with self.lock:
+            expired = [
+                seq
+                for seq, (_, owner, routed) in self.pending.items()
+                if (worker is None or owner == worker)
+                and (older_than is None or routed < older_than)
+            ]
+        for seq in expired:
+            self.settle(seq, False)
+        return len(expired)
+
+    def monitor(self):
+        last_report = time.monotonic()
+        acked_at_report = list(self.acked)
+        while not self.draining.is_set():
+            time.sleep(1)
+            now = time.monotonic()
+            for worker, process in enumerate(self.processes):
+                if not process.is_alive():
+                    lost = self.nack_pending(worker)
+                    print(
+                        f"❌ Worker {worker} exited ({process.exitcode}), "
+                        f"restarting; {lost} message(s) nacked"
+                    )
+                    WORKER_RESTARTS.inc(worker=str(worker))
+                    self.start_worker(worker)
+            self.nack_pending(older_than=now - PENDING_TIMEOUT)
+
+            stats = self.worker_stats(now)
+            for worker, (inflight, lag) in enumerate(stats):
+                WORKER_INFLIGHT.set(inflight, worker=str(worker))
+                WORKER_LAG.set(lag, worker=str(worker))
+
+            if now - last_report >= LATENCY_REPORT_INTERVAL:
+                elapsed = now - last_report
+                for worker, (inflight, lag) in enumerate(stats):
+                    rate = (self.acked[worker] - acked_at_report[worker]) / elapsed
+                    print(
+                        f"👷 worker {worker}: {rate:.1f} msg/s, "
+                        f"in flight={inflight}, lag={lag:.1f}s"
+                    )
+                last_report, acked_at_report = now, list(self.acked)
+
+    def worker_stats(self, now):
+        """(in flight, seconds since the oldest unacked was routed) per worker"""
+        inflight = [0] * len(self.processes)
+        oldest = [now] * len(self.processes)
+        with self.lock:
+            for _, worker, routed in self.pending.values():
+                inflight[worker] += 1
+                oldest[worker] = min(oldest[worker], routed)
+        return [(inflight[w], now - oldest[w]) for w in range(len(self.processes))]
+
+    def health(self):
+        now = time.monotonic()
+        workers = []
+        for worker, process in enumerate(self.processes):
+            silent = now - self.heartbeats[worker]
+            workers.append(
+                {
+                    "worker": worker,
+                    "alive": process.is_alive(),
+                    "seconds_since_heartbeat": round(silent, 1),
+                    "acked": self.acked[worker],
+                }
+            )
+        healthy = not self.draining.is_set() and all(
+            w["alive"] and w["seconds_since_heartbeat"] < WORKER_STALL_TIMEOUT
+            for w in workers
+        )
+        return healthy, {"workers": workers}
+
+    def drain(self):
+        """Stop taking messages, let workers finish and ack what they wrote"""
+        self.draining.set()
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for inbox, process in zip(self.queues, self.processes):
+            # A dead or stuck worker never takes it, it is terminated below
+            try:
+                inbox.put(None, timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Full:
+                print(f"❌ {process.name} did not take the stop signal")
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+
+        # Acks posted by the workers just before they exited
+        while self.pending and time.monotonic() < deadline:
+            time.sleep(0.1)
+        lost = self.nack_pending()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        print(f"Drained {len(self.processes)} worker(s), {lost} message(s) nacked")
+
+
+def run_supervisor(workers):
+    global health_check
+
+    # Workers are started before the Pub/Sub client creates its threads
+    supervisor = Supervisor(workers)
+    health_check = supervisor.health
+    metrics.sources.append(supervisor.metric_snapshots)
+    threading.Thread(target=supervisor.handle_results, daemon=True).start()
+    threading.Thread(target=supervisor.monitor, daemon=True).start()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(project_id, subscription_id)
+    # Never lease more than the workers can queue
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=workers * WORKER_QUEUE_SIZE
+    )
+
+    print(f"Listening for messages on {subscription_id} with {workers} workers...")
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=supervisor.route, flow_control=flow_control
+    )
+
+    def stream_done(future):
+        # An auth or network failure ends the stream: shut down, don't hang
+        if not future.cancelled() and future.exception():
+            print(f"❌ Pub/Sub stream failed: {future.exception()!r}")
+        stop.set()
+
+    streaming_pull_future.add_done_callback(stream_done)
+
+    with subscriber:
+        stop.wait()
+        print("Shutting down, draining workers...")
+        # The stream stays open while draining so the workers' acks still land
+        supervisor.drain()
         streaming_pull_future.cancel()
+        # Re-raises a stream failure so the process exits non-zero
+        streaming_pull_future.result()
+
+
+def main():
+    if SUBSCRIBER_WORKERS > 0:
+        run_supervisor(SUBSCRIBER_WORKERS)
+        return
+
+    threading.Thread(target=bulk_writer.run, daemon=True).start()
+    threading.Thread(target=report_latency, daemon=True).start()
+    start_rollups()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(project_id, subscription_id)
+
+    print(
+        f"Listening for messages on {subscription_id} and routing to 5 collections..."
+    )
+    streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback)
+
+    with subscriber:
+        try:
+            streaming_pull_future.result()
+        except KeyboardInterrupt:
+            streaming_pull_future.cancel()
+        finally:
+            bulk_writer.flush()
+            flush_rollups()
+
+
+if __name__ == "__main__":
+    main()
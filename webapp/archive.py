@@ -0,0 +1,296 @@
+"""
+Columnar archive of closed days of sensor readings.
+
+Each archived day of a collection is a directory of NumPy .npy columns:
+
+    <SENSOR_ARCHIVE_DIR>/<collection>/<YYYY-MM-DD>/
+        timestamp.npy   datetime64[ms], sorted ascending
+        value.npy       float64 (or bool for on/off sensors)
+        node.npy        int16 index into meta.json "nodes", -1 when unknown
+        meta.json       count, min/max/sum and the node names; written last,
+                        a day without it is incomplete and ignored
+
+Columns are stored uncompressed so np.load(mmap_mode="r") can map them and
+range reads slice the mapped arrays without copying. Only days before
+archived_until() are read from here; anything newer comes from MongoDB.
+Readings that reach MongoDB after their day was archived are not read until
+webapp.cmd.archive folds them into the archived day.
+NumPy is imported by the functions that need it, so the web app can import
+this module at startup without paying for it.
+"""
+import datetime
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+
+DAY = datetime.timedelta(days=1)
+COLUMNS = ("timestamp", "value", "node")
+
+# Archived days are listed at most this often (seconds)
+LISTING_TTL = 60
+
+
+def day_name(day):
+    return f"{day:%Y-%m-%d}"
+
+
+def to_datetime64(timestamp):
+    import numpy as np
+
+    return np.datetime64(timestamp, "ms")
+
+
+def to_datetime(value):
+    return value.astype("datetime64[ms]").astype(datetime.datetime)
+
+
+def combine_stats(result, part):
+    """Merge two min/max/sum/count dicts, either may be None"""
+    if part is None:
+        return result
+    if result is None:
+        return {key: part[key] for key in ("min", "max", "sum", "count")}
+    return {
+        "min": min(result["min"], part["min"]),
+        "max": max(result["max"], part["max"]),
+        "sum": result["sum"] + part["sum"],
+        "count": result["count"] + part["count"],
+    }
+
+
+class ArchiveDay:
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.start = datetime.datetime.fromisoformat(meta["day"])
+        self.end = self.start + DAY
+        self.columns = {}
+
+    def column(self, name):
+        import numpy as np
+
+        if name not in self.columns:
+            self.columns[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self.columns[name]
+
+    def slice(self, start=None, end=None):
+        """(first, last) row indexes of readings in [start, end)"""
+        import numpy as np
+
+        timestamps = self.column("timestamp")
+        first, last = 0, len(timestamps)
+        if start is not None:
+            first = np.searchsorted(timestamps, to_datetime64(start))
+        if end is not None:
+            last = np.searchsorted(timestamps, to_datetime64(end))
+        return int(first), int(last)
+
+
+class Archive:
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.days = {}
+
+    def collection_dir(self, collection):
+        return self.directory / collection
+
+    def list_days(self, collection):
+        """Complete archived days of a collection, oldest first"""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.listings.get(collection)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        days = []
+        folder = self.collection_dir(collection)
+        if folder.exists():
+            for path in sorted(folder.iterdir()):
+                if path.name.startswith("."):
+                    continue
+                day = self.load_day(path)
+                if day is not None:
+                    days.append(day)
+
+        with self.lock:
+            self.listings[collection] = (now + LISTING_TTL, days)
+        return days
+
+    def load_day(self, path):
+        # Mapped columns are kept with the day until it is rewritten (late
+        # readings folded in by webapp.cmd.archive), which changes meta.json
+        try:
+            version = (path / "meta.json").stat().st_mtime_ns
+        except OSError:
+            return None
+        cached = self.days.get(str(path))
+        if cached and cached[0] == version:
+            return cached[1]
+        try:
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        day = ArchiveDay(path, meta)
+        self.days[str(path)] = (version, day)
+        return day
+
+    def archived_until(self, collection):
+        """Readings before this are served from the archive, None if empty"""
+        days = self.list_days(collection)
+        return days[-1].end if days else None
+
+    def newest(self, collection):
+        """(timestamp, value) of the last archived reading, None if empty"""
+        for day in reversed(self.list_days(collection)):
+            if day.meta["count"]:
+                return (
+                    to_datetime(day.column("timestamp")[-1]),
+                    day.column("value")[-1].item(),
+                )
+        return None
+
+    def overlapping(self, collection, start=None, end=None):
+        return [
+            day
+            for day in self.list_days(collection)
+            if (start is None or day.end > start) and (end is None or day.start < end)
+        ]
+
+    def read(self, collection, start=None, end=None):
+        """
+        (timestamps, values, nodes) in [start, end). A range inside one day
+        returns views of the mapped files; longer ranges are concatenated.
+        """
+        import numpy as np
+
+        parts = []
+        for day in self.overlapping(collection, start, end):
+            first, last = day.slice(start, end)
+            if last > first:
+                parts.append(
+                    (
+                        day.column("timestamp")[first:last],
+                        day.column("value")[first:last],
+                        day.column("node")[first:last],
+                    )
+                )
+
+        if not parts:
+            return (
+                np.empty(0, "datetime64[ms]"),
+                np.empty(0, "float64"),
+                np.empty(0, "int16"),
+            )
+        if len(parts) == 1:
+            return parts[0]
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def stats(self, collection, start=None, end=None):
+        """min/max/sum/count over [start, end), None when nothing matches"""
+        result = None
+        for day in self.overlapping(collection, start, end):
+            whole = (start is None or start <= day.start) and (
+                end is None or end >= day.end
+            )
+            if whole:
+                # Whole days use the totals stored at archive time
+                part = day.meta if day.meta["count"] else None
+            else:
+                first, last = day.slice(start, end)
+                values = day.column("value")[first:last]
+                part = None
+                if len(values):
+                    part = {
+                        "min": values.min().item(),
+                        "max": values.max().item(),
+                        "sum": float(values.sum(dtype="float64")),
+                        "count": len(values),
+                    }
+
+            result = combine_stats(result, part)
+        return result
+
+    def write_day(self, collection, day, timestamps, values, nodes, node_names):
+        """
+        Write one day atomically (temporary directory renamed into place),
+        replacing the archived day if there is one
+        """
+        import numpy as np
+
+        target = self.collection_dir(collection) / day_name(day)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        order = np.argsort(timestamps, kind="stable")
+        np.save(tmp / "timestamp.npy", timestamps[order])
+        np.save(tmp / "value.npy", values[order])
+        np.save(tmp / "node.npy", nodes[order])
+
+        meta = {
+            "day": day.isoformat(),
+            "count": len(values),
+            "nodes": node_names,
+            "dtype": str(values.dtype),
+        }
+        if len(values):
+            meta.update(
+                min=values.min().item(),
+                max=values.max().item(),
+                sum=float(values.sum(dtype="float64")),
+            )
+        with open(tmp / "meta.json", "w") as f:
+            json.dump(meta, f, indent=2)
+
+        old = target.with_name(f".{target.name}.{os.getpid()}.old")
+        shutil.rmtree(old, ignore_errors=True)
+        if target.exists():
+            target.rename(old)
+        os.replace(tmp, target)
+        shutil.rmtree(old, ignore_errors=True)
+        with self.lock:
+            self.listings.pop(collection, None)
+        return meta
+
+
+def columns_from_documents(documents, boolean):
+    """Build the archive columns from reading documents"""
+    import numpy as np
+
+    node_names = []
+    node_codes = {}
+    timestamps, values, nodes = [], [], []
+    for doc in documents:
+        node = doc.get("node")
+        if node is None:
+            code = -1
+        elif node in node_codes:
+            code = node_codes[node]
+        else:
+            code = node_codes[node] = len(node_names)
+            node_names.append(node)
+        timestamps.append(doc["timestamp"])
+        values.append(doc["value"])
+        nodes.append(code)
+
+    return (
+        np.array(timestamps, dtype="datetime64[ms]"),
+        np.array(values, dtype=bool if boolean else "float64"),
+        np.array(nodes, dtype="int16"),
+        node_names,
+    )
+
+
+sensor_archive = None
+
+
+def init_app(app):
+    global sensor_archive
+    directory = app.config["SENSOR_ARCHIVE_DIR"]
+    sensor_archive = Archive(directory) if directory else None
@@ -0,0 +1,376 @@
+"""
+Result cache for computed query results, shared by web workers and replicas.
+
+Backends are picked by URL (CACHE_URL):
+
+    memory://                  per-process LRU
+    file:///var/cache/webapp   files on a directory shared by workers/replicas
+    redis://host:6379/0        Redis (needs the optional redis package)
+
+Values must be JSON serializable. Every key lives in a namespace whose
+version is stored in the backend; invalidate(namespace) bumps the version so
+all replicas stop seeing older entries at once, which then expire by TTL.
+The subscriber invalidates the namespace of each collection it writes.
+
+A miss is computed once: threads of one process wait for the first caller,
+and other processes wait on a short lock entry in the backend before
+computing themselves. Backend failures fall back to computing the result.
+
+Only the standard library is required so the subscriber image can copy this
+module along with metrics.py.
+"""
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import struct
+import threading
+import time
+import urllib.parse
+
+from . import metrics
+
+CACHE_REQUESTS = metrics.Counter(
+    "webapp_cache_requests_total",
+    "Result cache lookups by namespace and outcome (hit, miss, wait_hit)",
+    ["namespace", "result"],
+)
+CACHE_ERRORS = metrics.Counter(
+    "webapp_cache_errors_total",
+    "Result cache backend errors by operation",
+    ["operation"],
+)
+CACHE_COMPUTE = metrics.Histogram(
+    "webapp_cache_compute_seconds",
+    "Time spent computing results on a cache miss",
+    ["namespace"],
+)
+
+MISSING = object()
+
+
+class MemoryBackend:
+    """
+    LRU dict for a single process. Entries without a TTL (namespace versions)
+    are kept apart and never evicted, so an invalidation can't be undone by
+    a burst of cached results.
+    """
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.persistent = {}
+
+    def get(self, key):
+        with self.lock:
+            if key in self.persistent:
+                return self.persistent[key]
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def store(self, key, value, ttl):
+        # Caller holds self.lock
+        if not ttl:
+            self.entries.pop(key, None)
+            self.persistent[key] = value
+            return
+        self.persistent.pop(key, None)
+        self.entries[key] = (time.time() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.store(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        with self.lock:
+            entry = self.entries.get(key)
+            if key in self.persistent or (entry and entry[0] > time.time()):
+                return False
+            self.store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.persistent.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self.persistent.get(key, b"0")) + 1
+            self.store(key, str(value).encode(), 0)
+            return value
+
+
+class FileBackend:
+    """
+    One file per key under a directory, for workers and replicas on one host.
+    Each file starts with its expiry time; writes go through a rename so
+    readers never see partial files.
+    """
+
+    header = struct.Struct("!d")
+
+    def __init__(self, directory, max_entries=10_000):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.writes = 0
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Serializes add/incr/prune between processes sharing the directory"""
+        with open(self.directory / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def get(self, key):
+        try:
+            data = self.path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        (expires,) = self.header.unpack_from(data)
+        # Expired files are left to prune(), which holds the lock; unlinking
+        # here could remove an entry add() just replaced it with
+        if expires and expires <= time.time():
+            return None
+        return data[self.header.size :]
+
+    def write(self, path, value, ttl):
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(self.header.pack(time.time() + ttl if ttl else 0) + value)
+        os.replace(tmp, path)
+
+    def set(self, key, value, ttl):
+        self.write(self.path(key), value, ttl)
+
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            self.prune()
+
+    def add(self, key, value, ttl):
+        with self.locked():
+            if self.get(key) is not None:
+                return False
+            self.write(self.path(key), value, ttl)
+        return True
+
+    def delete(self, key):
+        self.path(key).unlink(missing_ok=True)
+
+    def incr(self, key):
+        with self.locked():
+            value = int(self.get(key) or b"0") + 1
+            self.write(self.path(key), str(value).encode(), 0)
+        return value
+
+    def prune(self):
+        """Drop expired files, then the oldest ones beyond max_entries"""
+        with self.locked():
+            now = time.time()
+            files = []
+            for path in self.directory.glob("*/*"):
+                try:
+                    with open(path, "rb") as f:
+                        (expires,) = self.header.unpack(f.read(self.header.size))
+                    if expires and expires <= now:
+                        path.unlink(missing_ok=True)
+                    elif expires:
+                        files.append((path.stat().st_mtime, path))
+                except (OSError, struct.error):
+                    continue
+
+            files.sort()
+            for _, path in files[: max(0, len(files) - self.max_entries)]:
+                path.unlink(missing_ok=True)
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(
+            url, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=int(ttl) or None)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, value, ex=int(ttl) or None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+def create_backend(url, max_entries=10_000):
+    parsed = urllib.parse.urlparse(url or "memory://")
+    if parsed.scheme == "memory":
+        return MemoryBackend(max_entries)
+    if parsed.scheme == "file":
+        return FileBackend(parsed.path, max_entries)
+    if parsed.scheme in ("redis", "rediss", "unix"):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend: {url}")
+
+
+class ResultCache:
+    def __init__(
+        self, backend=None, ttl=10, lock_timeout=10, version_ttl=1, prefix="webapp"
+    ):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        # Namespace versions are re-read from the backend at most this often
+        self.version_ttl = version_ttl
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.inflight = {}
+
+    def configure(self, backend, ttl=None, lock_timeout=None):
+        self.backend = backend
+        if ttl is not None:
+            self.ttl = ttl
+        if lock_timeout is not None:
+            self.lock_timeout = lock_timeout
+        with self.lock:
+            self.versions.clear()
+
+    def version(self, namespace):
+        now = time.monotonic()
+        cached = self.versions.get(namespace)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        try:
+            version = int(self.backend.get(f"{self.prefix}:ns:{namespace}") or 0)
+        except Exception:
+            CACHE_ERRORS.inc(operation="version")
+            version = cached[1] if cached else 0
+        self.versions[namespace] = (now + self.version_ttl, version)
+        return version
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            try:
+                version = self.backend.incr(f"{self.prefix}:ns:{namespace}")
+            except Exception:
+                CACHE_ERRORS.inc(operation="invalidate")
+                continue
+            self.versions[namespace] = (time.monotonic() + self.version_ttl, version)
+
+    def read(self, key):
+        try:
+            data = self.backend.get(key)
+        except Exception:
+            CACHE_ERRORS.inc(operation="get")
+            return MISSING
+        return MISSING if data is None else json.loads(data)
+
+    def get_or_compute(self, namespace, key, compute, ttl=None):
+        """Cached result of compute() for key, computing it once on a miss"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return compute()
+
+        full_key = f"{self.prefix}:{namespace}:v{self.version(namespace)}:{key}"
+        value = self.read(full_key)
+        if value is not MISSING:
+            CACHE_REQUESTS.inc(namespace=namespace, result="hit")
+            return value
+
+        # Threads of this process share one computation per key
+        with self.lock:
+            event = self.inflight.get(full_key)
+            leader = event is None
+            if leader:
+                event = self.inflight[full_key] = threading.Event()
+
+        if not leader:
+            event.wait(self.lock_timeout)
+            value = self.read(full_key)
+            if value is not MISSING:
+                CACHE_REQUESTS.inc(namespace=namespace, result="wait_hit")
+                return value
+            CACHE_REQUESTS.inc(namespace=namespace, result="miss")
+            return compute()
+
+        try:
+            return self.compute(namespace, full_key, compute, ttl)
+        finally:
+            with self.lock:
+                self.inflight.pop(full_key, None)
+            event.set()
+
+    def compute(self, namespace, full_key, compute, ttl):
+        # Other processes: only the one holding the lock entry computes
+        lock_key = f"{full_key}:lock"
+        try:
+            locked = self.backend.add(lock_key, b"1", self.lock_timeout)
+        except Exception:
+            CACHE_ERRORS.inc(operation="lock")
+            locked = True
+
+        if not locked:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.read(full_key)
+                if value is not MISSING:
+                    CACHE_REQUESTS.inc(namespace=namespace, result="wait_hit")
+                    return value
+
+        CACHE_REQUESTS.inc(namespace=namespace, result="miss")
+        try:
+            started = time.perf_counter()
+            value = compute()
+            CACHE_COMPUTE.observe(time.perf_counter() - started, namespace=namespace)
+            try:
+                self.backend.set(full_key, json.dumps(value).encode(), ttl)
+            except Exception:
+                CACHE_ERRORS.inc(operation="set")
+            return value
+        finally:
+            # Also when compute() raises, so other processes don't sit out
+            # the whole lock timeout waiting for a result that never comes
+            if locked:
+                try:
+                    self.backend.delete(lock_key)
+                except Exception:
+                    CACHE_ERRORS.inc(operation="unlock")
+
+
+result_cache = ResultCache()
+
+
+def init_app(app):
+    result_cache.configure(
+        create_backend(app.config["CACHE_URL"], app.config["CACHE_MAX_ENTRIES"]),
+        ttl=app.config["CACHE_DEFAULT_TTL"],
+        lock_timeout=app.config["CACHE_LOCK_TIMEOUT"],
+    )
@@ -0,0 +1,214 @@
+"""
+Export closed days of sensor readings to the columnar archive
+(SENSOR_ARCHIVE_DIR, see webapp/archive.py).
+
+    python -m webapp.cmd.archive                      # days older than 7 days
+    python -m webapp.cmd.archive --keep-days 2 --sensor temperature
+    python -m webapp.cmd.archive --delete             # then remove them from MongoDB
+
+Archiving resumes after the last archived day. Days without readings are
+archived empty so the archive stays contiguous. With --delete the archived
+readings are removed from MongoDB once their day is written; the web app
+reads them from the archive from then on.
+
+The web app only reads archived days from the files, so readings that reach
+MongoDB after their day was archived are folded into it first: with
+--delete every reading left before the archive's end is one of those;
+without it the last --recheck-days archived days are rewritten when MongoDB
+holds more readings for them than the archive.
+"""
+import argparse
+import datetime
+import sys
+import time
+
+from pymongo import ReadPreference
+
+from webapp import archive
+from webapp.repositories import sensor_repository
+from webapp.web import create_app
+
+BOOLEAN_SENSORS = {"light", "rain", "smoke"}
+# Archived _ids removed per delete_many
+DELETE_BATCH = 10_000
+
+
+def first_day(sensor):
+    """Day of the oldest reading in MongoDB, None when there are none"""
+    found = [
+        doc["timestamp"]
+        for collection in sensor_repository.collections(sensor)
+        if (doc := collection.find_one(sort=[("timestamp", 1)]))
+    ]
+    if not found:
+        return None
+    oldest = min(found)
+    return datetime.datetime(oldest.year, oldest.month, oldest.day)
+
+
+def primary_collections(sensor, start, end):
+    # Read from the primary, the same readings may be deleted afterwards
+    return [
+        collection.with_options(read_preference=ReadPreference.PRIMARY)
+        for collection in sensor_repository.collections(sensor, start=start, end=end)
+    ]
+
+
+def day_documents(day):
+    """Readings of an archived day as documents"""
+    names = day.meta["nodes"]
+    return [
+        {
+            "timestamp": archive.to_datetime(timestamp),
+            "value": value.item(),
+            "node": names[node] if node >= 0 else None,
+        }
+        for timestamp, value, node in zip(
+            day.column("timestamp"), day.column("value"), day.column("node")
+        )
+    ]
+
+
+def find_readings(collections, query):
+    return [
+        doc
+        for collection in collections
+        for doc in collection.find(query, {"timestamp": 1, "value": 1, "node": 1})
+    ]
+
+
+def delete_ids(collections, ids):
+    """Delete exactly the given readings, leaving ones inserted since the read"""
+    deleted = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        batch = ids[i : i + DELETE_BATCH]
+        for collection in collections:
+            deleted += collection.delete_many({"_id": {"$in": batch}}).deleted_count
+    return deleted
+
+
+def archive_late(store, sensor, recheck_days, delete):
+    """Fold readings that arrived after their day was archived into it"""
+    base = sensor_repository.collection_name(sensor)
+    boundary = store.archived_until(base)
+    if boundary is None:
+        return 0
+
+    if delete:
+        # Archived readings were removed, whatever is left before the end is late
+        late = {}
+        query = {"timestamp": {"$lt": boundary}}
+        for doc in find_readings(primary_collections(sensor, None, boundary), query):
+            late.setdefault(doc["timestamp"].date(), []).append(doc)
+        days = [day for day in store.list_days(base) if day.start.date() in late]
+    else:
+        days = store.overlapping(base, boundary - recheck_days * archive.DAY, boundary)
+
+    folded = 0
+    for day in days:
+        query = {"timestamp": {"$gte": day.start, "$lt": day.end}}
+        collections = primary_collections(sensor, day.start, day.end)
+        if delete:
+            documents = day_documents(day) + late[day.start.date()]
+        else:
+            stored = sum(c.count_documents(query) for c in collections)
+            if stored <= day.meta["count"]:
+                continue
+            documents = find_readings(collections, query)
+        count = len(documents) - day.meta["count"]
+
+        columns = archive.columns_from_documents(documents, sensor in BOOLEAN_SENSORS)
+        store.write_day(base, day.start, *columns)
+        if delete:
+            delete_ids(collections, [doc["_id"] for doc in late[day.start.date()]])
+        print(f"{sensor} {archive.day_name(day.start)}: {count:,} late readings added")
+        folded += count
+    return folded
+
+
+def archive_sensor(store, sensor, cutoff, delete):
+    base = sensor_repository.collection_name(sensor)
+    day = store.archived_until(base) or first_day(sensor)
+    if day is None:
+        print(f"{sensor}: no readings")
+        return 0
+
+    archived = 0
+    while day + archive.DAY <= cutoff:
+        end = day + archive.DAY
+        started = time.perf_counter()
+        collections = primary_collections(sensor, day, end)
+        query = {"timestamp": {"$gte": day, "$lt": end}}
+        documents = find_readings(collections, query)
+
+        columns = archive.columns_from_documents(documents, sensor in BOOLEAN_SENSORS)
+        meta = store.write_day(base, day, *columns)
+
+        deleted = 0
+        if delete:
+            # By _id, not by range: readings flushed into the day after the
+            # read are not archived yet and are picked up by archive_late()
+            deleted = delete_ids(collections, [doc["_id"] for doc in documents])
+
+        elapsed = time.perf_counter() - started
+        note = f", deleted {deleted:,} from MongoDB" if delete else ""
+        print(
+            f"{sensor} {archive.day_name(day)}: {meta['count']:,} readings "
+            f"in {elapsed:.2f}s{note}"
+        )
+        archived += meta["count"]
+        day = end
+
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed days of readings")
+    parser.add_argument(
+        "--keep-days",
+        type=int,
+        default=7,
+        help="Most recent days to leave in MongoDB only (default: 7)",
+    )
+    parser.add_argument(
+        "--sensor",
+        action="append",
+        choices=list(sensor_repository.SENSOR_MODELS),
+        help="Sensor to archive (repeatable, default: all)",
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Remove archived readings from MongoDB",
+    )
+    parser.add_argument(
+        "--recheck-days",
+        type=int,
+        default=2,
+        help="Archived days checked for late readings without --delete (default: 2)",
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    if app.config["STORAGE_BACKEND"] != "mongo":
+        print("Archiving reads from MongoDB, STORAGE_BACKEND must be mongo")
+        sys.exit(1)
+    if archive.sensor_archive is None:
+        print("SENSOR_ARCHIVE_DIR is not set")
+        sys.exit(1)
+
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - datetime.timedelta(days=args.keep_days)
+
+    total = 0
+    with app.app_context():
+        for sensor in args.sensor or sensor_repository.SENSOR_MODELS:
+            archive_late(
+                archive.sensor_archive, sensor, args.recheck_days, args.delete
+            )
+            total += archive_sensor(archive.sensor_archive, sensor, cutoff, args.delete)
+    print(f"Archived {total:,} readings up to {cutoff:%Y-%m-%d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Compute derived data over the readings already stored.
+
+    python -m webapp.cmd.backfill rollups                       # all history
+    python -m webapp.cmd.backfill rollups --start 2026-01-01 --end 2026-02-01
+    python -m webapp.cmd.backfill rollups --workers 8 --max-rate 50000
+    python -m webapp.cmd.backfill rollups --restart             # ignore checkpoints
+    python -m webapp.cmd.backfill sketches                      # add quantile sketches
+
+The range (default: the oldest reading up to the current hour, which is never
+included) is split into
+--chunk-hours chunks per sensor collection, processed by a pool of worker
+processes. Each chunk reads its readings with one cursor per partition (and
+from the columnar archive for archived days) and writes the job's results in
+bulk. A job replaces everything it owns in the chunk, so rerunning a chunk
+is safe and gives what live ingest would have produced.
+
+Finished chunks are recorded in the backfill_checkpoints collection; an
+interrupted run resumes where it stopped. Reads use the analytics read
+preference and --max-rate caps the readings read per second across all
+workers, to leave room for live ingest.
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pymongo import MongoClient
+
+from webapp import archive, mongo_options, partitions, rollups
+from webapp.repositories import sensor_repository
+from webapp.web import create_app
+
+# job name -> function(db, base, start, end, readings) returning documents written
+JOBS = {
+    "rollups": rollups.rebuild,
+    # The quantile sketches live in the rollup documents; a job of its own so
+    # ranges rolled up before sketches existed are rebuilt despite checkpoints
+    "sketches": rollups.rebuild,
+}
+
+CHECKPOINTS = "backfill_checkpoints"
+READ_BATCH = 10_000
+
+# Per worker process state, set up by init_worker()
+worker_db = None
+worker_archive = None
+worker_throttle = None
+
+
+class Throttle:
+    """Sleeps so that no more than `rate` readings per second are read"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def add(self, count):
+        if not self.rate:
+            return
+        self.count += count
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def worker_settings(config):
+    """The part of the app config workers need, picklable"""
+    keys = set(mongo_options.CLIENT_OPTIONS) | {
+        "MONGODB_DB",
+        "MONGODB_HOST",
+        "MONGODB_PORT",
+        "MONGODB_ANALYTICS_READ_PREFERENCE",
+        "MONGODB_MAX_STALENESS_SECONDS",
+        "SENSOR_ARCHIVE_DIR",
+    }
+    return {key: config.get(key) for key in keys}
+
+
+def init_worker(settings, rate):
+    global worker_db, worker_archive, worker_throttle
+
+    client = MongoClient(
+        settings["MONGODB_HOST"] or "localhost",
+        int(settings["MONGODB_PORT"] or 27017),
+        **mongo_options.client_options(settings),
+    )
+    worker_db = client.get_database(
+        settings["MONGODB_DB"],
+        read_preference=mongo_options.read_preference(
+            settings["MONGODB_ANALYTICS_READ_PREFERENCE"],
+            settings["MONGODB_MAX_STALENESS_SECONDS"],
+        ),
+    )
+    directory = settings["SENSOR_ARCHIVE_DIR"]
+    worker_archive = archive.Archive(directory) if directory else None
+    worker_throttle = Throttle(rate)
+
+
+def archived_readings(base, start, end):
+    """(timestamp, value, node) of archived days in [start, end)"""
+    for day in worker_archive.overlapping(base, start, end):
+        first, last = day.slice(start, end)
+        names = day.meta["nodes"]
+        timestamps = day.column("timestamp")[first:last].tolist()
+        values = day.column("value")[first:last].tolist()
+        nodes = day.column("node")[first:last].tolist()
+        worker_throttle.add(len(values))
+        for timestamp, value, node in zip(timestamps, values, nodes):
+            yield timestamp, value, names[node] if node >= 0 else None
+
+
+def stored_readings(base, start, end):
+    """(timestamp, value, node) of every reading in [start, end)"""
+    boundary = worker_archive.archived_until(base) if worker_archive else None
+    if boundary and start < boundary:
+        yield from archived_readings(base, start, min(end, boundary))
+        start = max(start, boundary)
+        if start >= end:
+            return
+
+    names = partitions.collections_between(
+        base, set(worker_db.list_collection_names()), start, end
+    )
+    query = {"timestamp": {"$gte": start, "$lt": end}}
+    projection = {"_id": 0, "timestamp": 1, "value": 1, "node": 1}
+    for name in names:
+        cursor = worker_db[name].find(query, projection, batch_size=READ_BATCH)
+        for count, doc in enumerate(cursor, 1):
+            if count % READ_BATCH == 0:
+                worker_throttle.add(READ_BATCH)
+            yield doc["timestamp"], doc["value"], doc.get("node")
+
+
+def run_chunk(job, base, start, end):
+    started = time.perf_counter()
+    read = 0
+
+    def counted():
+        nonlocal read
+        for reading in stored_readings(base, start, end):
+            read += 1
+            yield reading
+
+    # Results are written with the primary's default write concern
+    db = worker_db.client.get_database(worker_db.name)
+    written = JOBS[job](db, base, start, end, counted())
+    db[CHECKPOINTS].replace_one(
+        {"_id": checkpoint_id(job, base, start)},
+        {
+            "job": job,
+            "collection": base,
+            "start": start,
+            "end": end,
+            "read": read,
+            "written": written,
+            "finished_at": datetime.datetime.now(),
+        },
+        upsert=True,
+    )
+    return base, start, read, written, time.perf_counter() - started
+
+
+def checkpoint_id(job, base, start):
+    return f"{job}:{base}:{start:%Y-%m-%dT%H}"
+
+
+def oldest_reading(db, base):
+    if archive.sensor_archive:
+        days = archive.sensor_archive.list_days(base)
+        if days:
+            return days[0].start
+
+    found = [
+        doc["timestamp"]
+        for name in partitions.collections_between(
+            base, set(db.list_collection_names())
+        )
+        if (doc := db[name].find_one(sort=[("timestamp", 1)]))
+    ]
+    return min(found) if found else None
+
+
+def chunks(start, end, hours):
+    step = datetime.timedelta(hours=hours)
+    while start < end:
+        yield start, min(start + step, end)
+        start += step
+
+
+def plan(db, job, sensors, start, end, hours, restart):
+    """(base, chunk start, chunk end) still to process, oldest first"""
+    tasks = []
+    for sensor in sensors:
+        base = sensor_repository.collection_name(sensor)
+        first = start or oldest_reading(db, base)
+        if first is None:
+            print(f"{sensor}: no readings")
+            continue
+
+        done = set()
+        if not restart:
+            done = {
+                (doc["start"], doc["end"])
+                for doc in db[CHECKPOINTS].find({"job": job, "collection": base})
+            }
+        tasks.extend(
+            (base, *chunk)
+            for chunk in chunks(rollups.hour_of(first), end, hours)
+            if chunk not in done
+        )
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill derived data")
+    parser.add_argument("job", choices=list(JOBS))
+    parser.add_argument(
+        "--start",
+        type=datetime.datetime.fromisoformat,
+        help="Start of the range (default: the oldest reading)",
+    )
+    parser.add_argument(
+        "--end",
+        type=datetime.datetime.fromisoformat,
+        help="End of the range, exclusive (default: the start of the current hour)",
+    )
+    parser.add_argument(
+        "--sensor",
+        action="append",
+        choices=list(sensor_repository.SENSOR_MODELS),
+        help="Sensor to backfill (repeatable, default: all)",
+    )
+    parser.add_argument("--chunk-hours", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=0,
+        help="Readings read per second across all workers, 0 for unlimited",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="Redo chunks already checkpointed"
+    )
+    args = parser.parse_args()
+
+    app = create_app()
+    if app.config["STORAGE_BACKEND"] != "mongo":
+        print("Backfill reads from MongoDB, STORAGE_BACKEND must be mongo")
+        sys.exit(1)
+
+    # The current hour belongs to the live path (see rollups.rebuild)
+    end = rollups.hour_of(datetime.datetime.now())
+    if args.end:
+        end = min(args.end, end)
+    start = rollups.hour_of(args.start) if args.start else None
+    with app.app_context():
+        db = sensor_repository.SENSOR_MODELS["temperature"]._get_db()
+        tasks = plan(
+            db,
+            args.job,
+            args.sensor or sensor_repository.SENSOR_MODELS,
+            start,
+            end,
+            args.chunk_hours,
+            args.restart,
+        )
+
+    if not tasks:
+        print("Nothing to backfill")
+        return
+
+    print(f"{args.job}: {len(tasks)} chunk(s) with {args.workers} worker(s)")
+    settings = worker_settings(app.config)
+    rate = args.max_rate / args.workers if args.max_rate else 0
+
+    failed = 0
+    total_read = 0
+    started = time.perf_counter()
+    # Spawned, not forked: this process already has MongoClient threads and
+    # sockets, each worker opens its own client in init_worker()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(settings, rate),
+    ) as pool:
+        futures = {pool.submit(run_chunk, args.job, *task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            base, chunk_start, _ = futures[future]
+            try:
+                _, _, read, written, seconds = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {base} {chunk_start:%Y-%m-%d %H:00}: {e}")
+                continue
+            total_read += read
+            print(
+                f"[{done}/{len(tasks)}] {base} {chunk_start:%Y-%m-%d %H:00}: "
+                f"{read:,} readings -> {written:,} documents in {seconds:.1f}s"
+            )
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Read {total_read:,} readings in {elapsed:.1f}s "
+        f"({total_read / max(elapsed, 1e-9):,.0f}/s)"
+    )
+    if failed:
+        print(f"{failed} chunk(s) failed, rerun to retry them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Build content-hashed static files into webapp/web/static/dist.
+
+    python -m webapp.cmd.build_assets
+"""
+from webapp.web.utils import assets
+
+
+def main():
+    manifest = assets.build_assets()
+    if assets.brotli is None:
+        print("brotli is not installed, only .gz variants were written")
+    print(f"Wrote {len(manifest)} assets to {assets.DIST_DIR}")
+
+
+if __name__ == "__main__":
+    main()
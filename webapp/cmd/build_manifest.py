@@ -0,0 +1,32 @@
+"""
+Write webapp/web/views/blueprints.json, the blueprint manifest used at startup.
+
+    python -m webapp.cmd.build_manifest          # regenerate
+    python -m webapp.cmd.build_manifest --check  # exit 1 if the manifest is stale
+"""
+import json
+import sys
+
+from webapp.web import views
+
+
+def main():
+    manifest = views.build_manifest()
+    content = json.dumps(manifest, indent=2) + "\n"
+
+    if "--check" in sys.argv:
+        current = ""
+        if views.MANIFEST_FILE.exists():
+            current = views.MANIFEST_FILE.read_text()
+        if current != content:
+            print(f"{views.MANIFEST_FILE} is out of date, run build_manifest")
+            sys.exit(1)
+        print("Blueprint manifest is up to date")
+        return
+
+    views.MANIFEST_FILE.write_text(content)
+    print(f"Wrote {len(manifest)} blueprints to {views.MANIFEST_FILE}")
+
+
+if __name__ == "__main__":
+    main()
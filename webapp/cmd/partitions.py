@@ -0,0 +1,84 @@
+"""
+List or retire time-partitioned sensor collections (SENSOR_PARTITIONING).
+
+    python -m webapp.cmd.partitions list
+    python -m webapp.cmd.partitions drop --before 2026-01-01 --dry-run
+    python -m webapp.cmd.partitions drop --before 2026-01-01
+
+drop removes every partition whose period ends on or before the date; it is
+a collection drop, so it is instant regardless of size. The unpartitioned
+base collections are never dropped.
+"""
+import argparse
+import datetime
+
+from webapp import partitions
+from webapp.repositories import sensor_repository
+from webapp.web import create_app
+
+
+def sensor_partitions():
+    """(sensor, name, start, end, documents) for every partition, oldest first"""
+    found = []
+    for sensor, model in sensor_repository.SENSOR_MODELS.items():
+        db = model._get_db()
+        base = model._get_collection_name()
+        names = db.list_collection_names()
+        for name, start, end in partitions.partitions_of(base, names):
+            documents = db[name].estimated_document_count()
+            found.append((sensor, name, start, end, documents))
+    return found
+
+
+def list_partitions():
+    print(f"Partitioning: {sensor_repository.partitioning}")
+    rows = sensor_partitions()
+    if not rows:
+        print("No partitions")
+        return
+
+    for sensor, name, start, end, documents in rows:
+        period = f"{start:%Y-%m-%d} - {end:%Y-%m-%d}"
+        print(f"  {sensor:<12} {name:<28} {period} {documents:>12,}")
+
+
+def drop_partitions(before, dry_run):
+    dropped = 0
+    for sensor, name, start, end, documents in sensor_partitions():
+        if end > before:
+            continue
+
+        if dry_run:
+            print(f"Would drop {name} ({documents:,} documents)")
+        else:
+            sensor_repository.SENSOR_MODELS[sensor]._get_db().drop_collection(name)
+            print(f"Dropped {name} ({documents:,} documents)")
+        dropped += 1
+
+    print(f"{dropped} partition(s) {'to drop' if dry_run else 'dropped'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage sensor partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List partitions with their periods and sizes")
+    drop = commands.add_parser("drop", help="Drop partitions ending before a date")
+    drop.add_argument(
+        "--before",
+        required=True,
+        type=datetime.datetime.fromisoformat,
+        help="Drop partitions whose period ends on or before this date (YYYY-MM-DD)",
+    )
+    drop.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == "list":
+            list_partitions()
+        else:
+            drop_partitions(args.before, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
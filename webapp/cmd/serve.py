@@ -0,0 +1,112 @@
+"""
+Production entry point: serves create_app() with gunicorn.
+
+The app is loaded once in the master (preload) and forked into WEB_WORKERS
+processes with WEB_THREADS threads each. There is no file watching; use
+scripts/run-web for the livereload development server.
+
+    SIGHUP   graceful worker restart (configuration reload)
+    SIGTERM  graceful shutdown, in-flight requests get WEB_GRACEFUL_TIMEOUT
+    SIGTTIN / SIGTTOU  add / remove a worker
+
+With more than one worker, /metrics adds up every worker's values through
+snapshot files in METRICS_DIR (default: a fresh temporary directory),
+refreshed every METRICS_FLUSH_INTERVAL seconds; see SharedDirectory in
+webapp/metrics.py.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from gunicorn.app.base import BaseApplication
+
+from webapp import metrics
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+class WebApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        started = time.perf_counter()
+        from webapp.web import create_app
+
+        return create_app(import_seconds=time.perf_counter() - started)
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description="Run the web app under gunicorn")
+    parser.add_argument("-H", "--host", default=os.getenv("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("-P", "--port", default=os.getenv("WEB_PORT", "8080"))
+    parser.add_argument(
+        "-w", "--workers", type=int, default=env_int("WEB_WORKERS", os.cpu_count() or 1)
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, default=env_int("WEB_THREADS", 4)
+    )
+    args = parser.parse_args()
+
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "preload_app": True,
+        "timeout": env_int("WEB_TIMEOUT", 60),
+        "graceful_timeout": env_int("WEB_GRACEFUL_TIMEOUT", 30),
+        "keepalive": env_int("WEB_KEEPALIVE", 5),
+        # Recycle workers periodically, jittered so they don't restart together
+        "max_requests": env_int("WEB_MAX_REQUESTS", 5000),
+        "max_requests_jitter": env_int("WEB_MAX_REQUESTS_JITTER", 500),
+        "accesslog": os.getenv("WEB_ACCESS_LOG", "-"),
+        "errorlog": "-",
+    }
+
+
+def metrics_hooks():
+    """Gunicorn hooks sharing the workers' metrics through a directory"""
+    directory = metrics.SharedDirectory(
+        os.getenv("METRICS_DIR") or tempfile.mkdtemp(prefix="webapp-metrics-"),
+        float(os.getenv("METRICS_FLUSH_INTERVAL", 5)),
+    )
+    # Counters start from zero with the server
+    directory.clear()
+    metrics.sources.append(directory.snapshots)
+
+    def post_fork(server, worker):
+        # What the master counted while preloading would count once per worker
+        metrics.REGISTRY.reset()
+        directory.start()
+
+    def worker_exit(server, worker):
+        directory.write()
+
+    def child_exit(server, worker):
+        directory.retire(worker.pid)
+
+    return {
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "child_exit": child_exit,
+    }
+
+
+def main():
+    options = get_options()
+    if options["workers"] > 1:
+        options.update(metrics_hooks())
+    WebApplication(options).run()
+
+
+if __name__ == "__main__":
+    main()
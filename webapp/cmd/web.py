@@ -1,13 +1,17 @@
-from webapp.web import create_app, get_program_options
-
 from livereload import Server
 
 import pathlib
+import time
 
 
 def main():
-    app = create_app()
+    started = time.perf_counter()
+    from webapp.web import create_app, enable_dev_profiler, get_program_options
+
+    app = create_app(import_seconds=time.perf_counter() - started)
     options = get_program_options()
+    if options.profile:
+        enable_dev_profiler(app)
 
     server = Server(app.wsgi_app)
     print(pathlib.Path(__file__).parent)
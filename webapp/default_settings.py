@@ -1,2 +1,72 @@
 MONGODB_DB = "iotdb"
+# Connect lazily so the preloaded gunicorn master never forks an open client
+MONGODB_CONNECT = False
+
+# Connection pool per process (see webapp/mongo_options.py for all options)
+MONGODB_MAX_POOL_SIZE = 20
+MONGODB_MIN_POOL_SIZE = 2
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = 2000
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGODB_COMPRESSORS = ""
+MONGODB_REPLICA_SET = ""
+
+# Dashboard/history reads may go to secondaries, e.g. "secondaryPreferred";
+# -1 disables the staleness bound (otherwise at least 90 seconds)
+MONGODB_ANALYTICS_READ_PREFERENCE = "primary"
+MONGODB_MAX_STALENESS_SECONDS = -1
+
+# Where sensor readings live: "mongo", or "sqlite" for an embedded database
+# file on small gateways (see webapp/sqlite_store.py); the subscriber must use
+# the same STORAGE_BACKEND and SQLITE_PATH. User accounts stay in MongoDB.
+STORAGE_BACKEND = "mongo"
+SQLITE_PATH = "data/readings.sqlite3"
+SQLITE_CACHE_KIB = 8192
+SQLITE_MMAP_BYTES = 64 * 1024 * 1024
+
+# "none", "monthly" or "weekly" collections per sensor (see webapp/partitions.py);
+# the subscriber must use the same SENSOR_PARTITIONING
+SENSOR_PARTITIONING = "none"
+
+# Columnar archive of closed days (see webapp/archive.py), written by
+# python -m webapp.cmd.archive; empty disables it
+SENSOR_ARCHIVE_DIR = ""
+
+# Sensor query result cache (see webapp/cache.py): memory://, file:///path
+# shared by workers/replicas on one host, or redis://host:6379/0
+CACHE_URL = "memory://"
+CACHE_DEFAULT_TTL = 10
+CACHE_MAX_ENTRIES = 10_000
+CACHE_LOCK_TIMEOUT = 10
+
 APP_TITLE = "IoT Management Web"
+
+# Link content-hashed copies of static files from static/dist (ignored in
+# debug); build them at startup when the image did not already
+ASSETS_HASHED = True
+ASSETS_BUILD_ON_STARTUP = True
+
+# Seconds a loaded user (roles, status) is reused by each process, 0 disables
+USER_CACHE_TTL = 30
+
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers
+# are trusted (nginx in docker-compose), used for per-IP login throttling
+PROXY_COUNT = 0
+
+# Login throttling (token buckets) and password hashing pool
+LOGIN_IP_BURST = 20
+LOGIN_IP_PER_MINUTE = 20
+LOGIN_USER_BURST = 5
+LOGIN_USER_PER_MINUTE = 5
+LOGIN_HASH_WORKERS = 2
+LOGIN_HASH_QUEUE = 8
+LOGIN_HASH_TIMEOUT = 5
+LAST_LOGIN_FLUSH_INTERVAL = 10
+
+# Request profiling, toggled at runtime from /admin/profiling; PROFILE_DIR holds
+# the on/off flag and the captures, share it between replicas
+PROFILING_ENABLED = False
+PROFILE_SAMPLE_RATE = 0.01
+PROFILE_SLOW_THRESHOLD_MS = 1000
+PROFILE_STACK_INTERVAL_MS = 5
+PROFILE_KEEP = 50
+PROFILE_DIR = "/tmp/webapp-profiles"
@@ -0,0 +1,118 @@
+"""
+Schema of the sensor messages published by the nodes, checked before
+anything is written:
+
+    validate = compile_schema(MESSAGE_SCHEMA)
+    reading, errors = validate(json.loads(data))
+
+compile_schema() builds one checker per field up front, so validating a
+message is a single pass of type checks and comparisons. errors is a list of
+(reason, field) with reason "missing", "invalid" (wrong type, NaN, infinity)
+or "out_of_range". A field that is absent or null takes its declared
+default, or is missing when it is required. Nothing is coerced silently.
+Unknown fields are ignored.
+
+Only the standard library is used so the subscriber image can copy this module.
+"""
+import math
+
+MESSAGE_SCHEMA = {
+    "temperature": {"type": "number", "required": True, "min": -50, "max": 100},
+    "humidity": {"type": "number", "required": True, "min": 0, "max": 100},
+    # Never defaulted: a node that stops reporting smoke must not read as clear
+    "is_smoke": {"type": "boolean", "required": True},
+    "is_dark": {"type": "boolean", "default": False},
+    "is_raining": {"type": "boolean", "default": False},
+    # Epoch seconds up to 2100-01-01; the subscriber uses the receive time
+    # without it. The bound rejects millisecond epochs, which would make
+    # datetime.fromtimestamp() fail on every delivery
+    "timestamp": {"type": "number", "min": 0, "max": 4_102_444_800},
+    "node": {"type": "string", "max_length": 64},
+}
+
+NO_DEFAULT = object()
+
+
+def number_checker(spec):
+    low, high = spec.get("min"), spec.get("max")
+
+    def check(value):
+        # type() rather than isinstance(): True/False are not numbers here
+        if type(value) not in (int, float) or not math.isfinite(value):
+            return None, "invalid"
+        if (low is not None and value < low) or (high is not None and value > high):
+            return None, "out_of_range"
+        return float(value), None
+
+    return check
+
+
+def boolean_checker(spec):
+    def check(value):
+        if value is True or value is False:
+            return value, None
+        # Some firmware sends flags as 0/1
+        if type(value) is int and value in (0, 1):
+            return bool(value), None
+        return None, "invalid"
+
+    return check
+
+
+def string_checker(spec):
+    max_length = spec.get("max_length")
+
+    def check(value):
+        if type(value) is int:
+            value = str(value)
+        elif type(value) is not str or not value:
+            return None, "invalid"
+        if max_length is not None and len(value) > max_length:
+            return None, "out_of_range"
+        return value, None
+
+    return check
+
+
+CHECKERS = {
+    "number": number_checker,
+    "boolean": boolean_checker,
+    "string": string_checker,
+}
+
+
+def compile_schema(schema):
+    """validate(raw) -> (reading, errors) for a schema of field specs"""
+    fields = tuple(
+        (
+            name,
+            spec.get("required", False),
+            spec.get("default", NO_DEFAULT),
+            CHECKERS[spec["type"]](spec),
+        )
+        for name, spec in schema.items()
+    )
+
+    def validate(raw):
+        if not isinstance(raw, dict):
+            return None, [("invalid", "message")]
+
+        reading = {}
+        errors = []
+        for name, required, default, check in fields:
+            value = raw.get(name)
+            if value is None:
+                if required:
+                    errors.append(("missing", name))
+                elif default is not NO_DEFAULT:
+                    reading[name] = default
+                continue
+
+            value, error = check(value)
+            if error:
+                errors.append((error, name))
+            else:
+                reading[name] = value
+        return reading, errors
+
+    return validate
@@ -0,0 +1,458 @@
+"""
+Minimal Prometheus-style metrics shared by the web app and the subscriber.
+
+Values are kept per process and rendered in the Prometheus text exposition
+format by render(). Processes that serve one scrape endpoint together
+(gunicorn workers, subscriber workers) exchange snapshot()s, and render()
+adds up the ones returned by the callables in `sources`. Only the standard
+library and pymongo are required so the subscriber image can copy this module
+on its own.
+"""
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Driver handshake/heartbeat commands that say nothing about query load
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart"}
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self.metrics[metric.name] = metric
+
+    def render(self, others=()):
+        """Text exposition, adding up the other processes' snapshots"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "".join(metric.render(others) for metric in metrics)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def reset(self, gauges=False):
+        """Zero the counters and histograms (and gauges if asked)"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            if gauges or metric.type != "gauge":
+                with metric.lock:
+                    metric.values = {}
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        if registry is not None:
+            registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, others=()):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self.lock:
+            values = dict(self.values)
+        for other in others:
+            for key, value in other.get(self.name, {}).get("values", ()):
+                key = tuple(key)
+                values[key] = self.merge(values.get(key), value)
+        lines.extend(self.samples(values))
+        return "\n".join(lines) + "\n"
+
+    def merge(self, current, value):
+        """Value of a sample over processes, current is None for the first"""
+        return add_values(current, value)
+
+    def snapshot(self):
+        """Type and [[label values], value] pairs, JSON serialisable"""
+        with self.lock:
+            values = [[list(key), copy_value(v)] for key, v in self.values.items()]
+        return {"type": self.type, "values": values}
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    multiprocess: "sum" the processes' values, or "max" for values that are
+    the same everywhere (e.g. set before the workers were forked)
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess="sum", **kw):
+        super().__init__(name, documentation, labelnames, **kw)
+        self.multiprocess = multiprocess
+
+    def merge(self, current, value):
+        if self.multiprocess == "max" and current is not None:
+            return max(current, value)
+        return add_values(current, value)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, **kw
+    ):
+        super().__init__(name, documentation, labelnames, **kw)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self, values):
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = format_labels(
+                    self.labelnames, key, [("le", format_value(bound))]
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def copy_value(value):
+    if isinstance(value, (list, tuple)):
+        counts, total = value
+        return [list(counts), total]
+    return value
+
+
+def add_values(current, value):
+    """Sum of two sample values: numbers or histogram [counts, sum] pairs"""
+    if isinstance(value, (list, tuple)):
+        counts, total = value
+        if current is None:
+            return [list(counts), total]
+        return [[a + b for a, b in zip(current[0], counts)], current[1] + total]
+    return (current or 0) + value
+
+
+def combine(snapshots, gauges=True):
+    """One snapshot adding up several; gauges=False drops the gauges"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, entry in snapshot.items():
+            if entry["type"] == "gauge" and not gauges:
+                continue
+            values = merged.setdefault(name, (entry["type"], {}))[1]
+            for key, value in entry["values"]:
+                key = tuple(key)
+                values[key] = add_values(values.get(key), value)
+    return {
+        name: {"type": kind, "values": [[list(k), v] for k, v in values.items()]}
+        for name, (kind, values) in merged.items()
+    }
+
+
+def snapshot(registry=REGISTRY):
+    return registry.snapshot()
+
+
+# Callables returning the snapshots of other processes to add to render()
+sources = []
+
+
+def render(registry=REGISTRY):
+    return registry.render([other for source in sources for other in source()])
+
+
+class SharedDirectory:
+    """
+    Metrics of every process of a pre-fork server, through a directory:
+    each worker writes its snapshot to <pid>.json every `interval` seconds
+    (start()) and when it exits (write()); a scrape of any worker adds up
+    the other workers' files. The master folds an exited worker's counters
+    and histograms into retired.json (retire()), so totals never go back
+    when workers are recycled; its gauges are dropped.
+    """
+
+    RETIRED = "retired.json"
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        os.makedirs(path, exist_ok=True)
+        # Scrapes read shared, retire() swaps files under an exclusive lock
+        self.lock_path = os.path.join(path, ".lock")
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                os.unlink(os.path.join(self.path, name))
+
+    def dump(self, name, data):
+        path = os.path.join(self.path, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self):
+        self.dump(f"{os.getpid()}.json", snapshot())
+
+    def start(self):
+        def run():
+            while True:
+                time.sleep(self.interval)
+                self.write()
+
+        self.write()
+        threading.Thread(target=run, daemon=True).start()
+
+    def snapshots(self):
+        own = f"{os.getpid()}.json"
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            names = [
+                name
+                for name in os.listdir(self.path)
+                if name.endswith(".json") and name != own
+            ]
+            found = [self.load(name) for name in names]
+        return [snapshot for snapshot in found if snapshot]
+
+    def retire(self, pid):
+        name = f"{pid}.json"
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            final = self.load(name)
+            if final is None:
+                return
+            retired = self.load(self.RETIRED) or {}
+            self.dump(self.RETIRED, combine([retired, final], gauges=False))
+            os.unlink(os.path.join(self.path, name))
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+MONGO_COMMANDS = Counter(
+    "mongodb_commands_total",
+    "MongoDB commands issued, by command, collection and outcome",
+    ["command", "collection", "status"],
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command round trip time",
+    ["command", "collection"],
+)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener recording per-collection counts and durations"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    @staticmethod
+    def collection_of(event):
+        target = event.command.get(event.command_name)
+        if isinstance(target, str):
+            return target
+        # getMore carries the cursor id, the collection is a separate field
+        return str(event.command.get("collection", ""))
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = (
+                event.command_name,
+                self.collection_of(event),
+            )
+
+    def finish(self, event, status):
+        with self.lock:
+            info = self.pending.pop((event.connection_id, event.request_id), None)
+        if info is None:
+            return
+        command, collection = info
+        MONGO_COMMANDS.inc(command=command, collection=collection, status=status)
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1_000_000, command=command, collection=collection
+        )
+
+    def succeeded(self, event):
+        self.finish(event, "ok")
+
+    def failed(self, event):
+        self.finish(event, "error")
+
+
+MONGO_POOL_CHECKOUTS = Counter(
+    "mongodb_pool_checkouts_total",
+    "Connection checkouts from the pool, by outcome",
+    ["result"],
+)
+MONGO_POOL_WAIT = Histogram(
+    "mongodb_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0),
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongodb_pool_connections",
+    "Open pool connections by server and state",
+    ["address", "state"],
+)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """pymongo pool listener recording checkout waits and pool occupancy"""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @staticmethod
+    def address(event):
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def observe_wait(self):
+        started = getattr(self.local, "started", None)
+        if started is not None:
+            MONGO_POOL_WAIT.observe(time.perf_counter() - started)
+            self.local.started = None
+
+    def connection_checked_out(self, event):
+        self.observe_wait()
+        MONGO_POOL_CHECKOUTS.inc(result="ok")
+        MONGO_POOL_CONNECTIONS.inc(address=self.address(event), state="in_use")
+
+    def connection_check_out_failed(self, event):
+        self.observe_wait()
+        MONGO_POOL_CHECKOUTS.inc(result=str(event.reason))
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CONNECTIONS.dec(address=self.address(event), state="in_use")
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc(address=self.address(event), state="open")
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec(address=self.address(event), state="open")
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+mongo_command_metrics = MongoCommandMetrics()
+mongo_pool_metrics = MongoPoolMetrics()
+mongo_listeners = [mongo_command_metrics, mongo_pool_metrics]
+_monitoring_registered = False
+
+
+def init_mongo_monitoring():
+    """Register the listeners for every MongoClient created afterwards"""
+    global _monitoring_registered
+    if not _monitoring_registered:
+        for listener in mongo_listeners:
+            monitoring.register(listener)
+        _monitoring_registered = True
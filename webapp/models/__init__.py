@@ -1,8 +1,32 @@
 from flask_mongoengine import MongoEngine
 from flask import Flask
 
+from .. import mongo_options
+
 db = MongoEngine()
 
+# Read preference for dashboard/history queries, set by init_db()
+analytics_read_preference = None
+
+
+def get_connection_settings(config):
+    settings = {
+        "db": config["MONGODB_DB"],
+        "host": config.get("MONGODB_HOST", "localhost"),
+        "port": int(config.get("MONGODB_PORT", 27017)),
+        "connect": config["MONGODB_CONNECT"],
+    }
+    settings.update(mongo_options.client_options(config))
+    return settings
+
 
 def init_db(app: Flask):
+    global analytics_read_preference
+
+    # Writes and anything not explicitly routed stay on the primary
+    app.config["MONGODB_SETTINGS"] = get_connection_settings(app.config)
+    analytics_read_preference = mongo_options.read_preference(
+        app.config["MONGODB_ANALYTICS_READ_PREFERENCE"],
+        app.config["MONGODB_MAX_STALENESS_SECONDS"],
+    )
     db.init_app(app)
@@ -20,39 +20,44 @@ class Sensor(me.Document):
 
 class RainSensor(me.Document):
     title = me.StringField(required=True)
+    node = me.StringField()
     value = me.BooleanField(required=True)
     timestamp = me.DateTimeField(required=True, default=datetime.datetime.now)
 
-    meta = {"collection": "rain_sensor"}
+    meta = {"collection": "rain_sensor", "indexes": ["timestamp"]}
 
 
 class TemperatureSensor(me.Document):
     title = me.StringField(required=True)
+    node = me.StringField()
     value = me.FloatField(required=True)  # celsius
     timestamp = me.DateTimeField(required=True, default=datetime.datetime.now)
 
-    meta = {"collection": "temp_sensor"}
+    meta = {"collection": "temp_sensor", "indexes": ["timestamp"]}
 
 
 class LightSensor(me.Document):
     title = me.StringField(required=True)
+    node = me.StringField()
     value = me.BooleanField(required=True)
     timestamp = me.DateTimeField(required=True, default=datetime.datetime.now)
 
-    meta = {"collection": "light_sensor"}
+    meta = {"collection": "light_sensor", "indexes": ["timestamp"]}
 
 
 class HumiditySensor(me.Document):
     title = me.StringField(required=True)
+    node = me.StringField()
     value = me.FloatField(required=True)  # percent
     timestamp = me.DateTimeField(required=True, default=datetime.datetime.now)
 
-    meta = {"collection": "humidity_sensor"}
+    meta = {"collection": "humidity_sensor", "indexes": ["timestamp"]}
 
 
 class SmokeSensor(me.Document):
     title = me.StringField(required=True)
+    node = me.StringField()
     value = me.BooleanField(required=True)
     timestamp = me.DateTimeField(required=True, default=datetime.datetime.now)
 
-    meta = {"collection": "smoke_sensor"}
+    meta = {"collection": "smoke_sensor", "indexes": ["timestamp"]}
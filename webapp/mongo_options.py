@@ -0,0 +1,51 @@
+"""
+MongoClient tuning shared by the web app and the subscriber.
+
+Each MONGODB_* setting maps to a MongoClient keyword; unset or empty values
+keep the driver default.
+"""
+from pymongo import ReadPreference
+from pymongo.read_preferences import (
+    Nearest,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+)
+
+CLIENT_OPTIONS = {
+    "MONGODB_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGODB_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGODB_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGODB_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGODB_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGODB_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGODB_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    # e.g. "zstd,snappy,zlib"; zstd/snappy need the zstandard/python-snappy packages
+    "MONGODB_COMPRESSORS": ("compressors", str),
+    "MONGODB_ZLIB_COMPRESSION_LEVEL": ("zlibCompressionLevel", int),
+    "MONGODB_REPLICA_SET": ("replicaSet", str),
+}
+
+READ_PREFERENCES = {
+    "primary": lambda staleness: ReadPreference.PRIMARY,
+    "primaryPreferred": lambda staleness: PrimaryPreferred(max_staleness=staleness),
+    "secondary": lambda staleness: Secondary(max_staleness=staleness),
+    "secondaryPreferred": lambda staleness: SecondaryPreferred(max_staleness=staleness),
+    "nearest": lambda staleness: Nearest(max_staleness=staleness),
+}
+
+
+def client_options(config):
+    """MongoClient keyword arguments from a config mapping (app.config, os.environ)"""
+    options = {}
+    for key, (kwarg, parse) in CLIENT_OPTIONS.items():
+        value = config.get(key)
+        if value is not None and value != "":
+            options[kwarg] = parse(value)
+    return options
+
+
+def read_preference(name, max_staleness=-1):
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    return READ_PREFERENCES[name](int(max_staleness))
@@ -0,0 +1,110 @@
+"""
+Time-partitioned sensor collections.
+
+With SENSOR_PARTITIONING set to "monthly" or "weekly", readings are written
+to one collection per period next to the base collection:
+
+    temp_sensor_2026_10     monthly, October 2026
+    temp_sensor_2026w42     weekly, ISO week 42 of 2026
+
+With "none" (the default) everything stays in the base collection. The base
+collection is always read as well, so data written before partitioning was
+enabled stays visible. Retiring a period is a collection drop
+(python -m webapp.cmd.partitions drop --before ...).
+
+Only the standard library is used so the subscriber image can copy this module.
+"""
+import datetime
+import re
+
+SCHEMES = ("none", "monthly", "weekly")
+
+PARTITION_PATTERN = re.compile(
+    r"^(?P<base>.+)_(?P<year>\d{4})(?:_(?P<month>\d{2})|w(?P<week>\d{2}))$"
+)
+
+
+def period_start(timestamp, scheme):
+    """Start of the period containing timestamp"""
+    if scheme == "monthly":
+        return datetime.datetime(timestamp.year, timestamp.month, 1)
+    if scheme == "weekly":
+        day = datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+        return day - datetime.timedelta(days=day.weekday())
+    raise ValueError(f"Unknown partitioning scheme: {scheme}")
+
+
+def next_period(start, scheme):
+    if scheme == "monthly":
+        if start.month == 12:
+            return datetime.datetime(start.year + 1, 1, 1)
+        return datetime.datetime(start.year, start.month + 1, 1)
+    return start + datetime.timedelta(weeks=1)
+
+
+def period_suffix(start, scheme):
+    if scheme == "monthly":
+        return f"{start.year:04d}_{start.month:02d}"
+    year, week, _ = start.isocalendar()
+    return f"{year:04d}w{week:02d}"
+
+
+def collection_for(base, timestamp, scheme):
+    """Collection a reading taken at timestamp is written to"""
+    if scheme == "none":
+        return base
+    return f"{base}_{period_suffix(period_start(timestamp, scheme), scheme)}"
+
+
+def parse(name):
+    """(base, start, end) of a partition collection, None for anything else"""
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+
+    year = int(match["year"])
+    if match["month"]:
+        start = datetime.datetime(year, int(match["month"]), 1)
+        return match["base"], start, next_period(start, "monthly")
+
+    start = datetime.datetime.fromisocalendar(year, int(match["week"]), 1)
+    return match["base"], start, next_period(start, "weekly")
+
+
+def base_collection(name):
+    parsed = parse(name)
+    return parsed[0] if parsed else name
+
+
+def partitions_of(base, names):
+    """Partitions of base among names as (name, start, end), oldest first"""
+    found = []
+    for name in names:
+        parsed = parse(name)
+        if parsed and parsed[0] == base:
+            found.append((name, parsed[1], parsed[2]))
+    return sorted(found, key=lambda p: p[1])
+
+
+def collections_between(base, names, start=None, end=None):
+    """
+    Existing collections of base that may hold readings in [start, end),
+    oldest partition first and the unpartitioned base collection last
+    """
+    selected = [
+        name
+        for name, period_from, period_to in partitions_of(base, names)
+        if (start is None or period_to > start) and (end is None or period_from < end)
+    ]
+    if base in names:
+        selected.append(base)
+    return selected
+
+
+def group_by_collection(base, documents, scheme):
+    """Split documents into {collection: [documents]} by their timestamp"""
+    grouped = {}
+    for doc in documents:
+        name = collection_for(base, doc["timestamp"], scheme)
+        grouped.setdefault(name, []).append(doc)
+    return grouped
@@ -0,0 +1,402 @@
+"""
+Sensor reads for the dashboard and history endpoints.
+
+Readings may be spread over time-partitioned collections (see
+webapp/partitions.py); every query fans out only to the collections that
+overlap its time range and results are merged in timestamp order. Days
+before the end of the columnar archive (webapp/archive.py) are read from the
+archive files instead of MongoDB.
+
+The live (not archived) readings come from a storage backend chosen by
+STORAGE_BACKEND: MongoBackend, or SQLiteBackend for gateways without a
+MongoDB server (webapp/sqlite_store.py). Both return plain documents; the
+archive merging and model conversion here are shared.
+"""
+import datetime
+import heapq
+import itertools
+import time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .. import archive, models, partitions, rollups, sqlite_store
+from ..models import sensors
+
+SENSOR_MODELS = {
+    "temperature": sensors.TemperatureSensor,
+    "humidity": sensors.HumiditySensor,
+    "light": sensors.LightSensor,
+    "rain": sensors.RainSensor,
+    "smoke": sensors.SmokeSensor,
+}
+
+# Set from SENSOR_PARTITIONING by init_app()
+partitioning = "none"
+
+# Collection names are listed at most this often (seconds)
+COLLECTION_NAMES_TTL = 30
+collection_names_cache = (0.0, set())
+
+STORAGE_BACKENDS = ("mongo", "sqlite")
+
+
+def init_app(app):
+    global partitioning, backend
+
+    partitioning = app.config["SENSOR_PARTITIONING"]
+    if partitioning not in partitions.SCHEMES:
+        raise ValueError(f"SENSOR_PARTITIONING must be one of {partitions.SCHEMES}")
+
+    storage = app.config["STORAGE_BACKEND"]
+    if storage == "mongo":
+        backend = MongoBackend()
+    elif storage == "sqlite":
+        backend = SQLiteBackend(
+            sqlite_store.SQLiteStore(
+                app.config["SQLITE_PATH"],
+                cache_kib=app.config["SQLITE_CACHE_KIB"],
+                mmap_bytes=app.config["SQLITE_MMAP_BYTES"],
+            )
+        )
+    else:
+        raise ValueError(f"STORAGE_BACKEND must be one of {STORAGE_BACKENDS}")
+
+
+def collection_name(sensor):
+    """Also the result cache namespace the subscriber invalidates on writes"""
+    return SENSOR_MODELS[sensor]._get_collection_name()
+
+
+def existing_collections(db):
+    global collection_names_cache
+
+    expires, names = collection_names_cache
+    if expires < time.monotonic():
+        names = set(db.list_collection_names())
+        collection_names_cache = (time.monotonic() + COLLECTION_NAMES_TTL, names)
+    return names
+
+
+def collections(sensor, start=None, end=None):
+    """
+    Collections to read for [start, end), oldest partition first and the
+    base collection last, routed by the analytics read preference
+    """
+    base = collection_name(sensor)
+    db = SENSOR_MODELS[sensor]._get_db()
+
+    if partitioning == "none":
+        names = [base]
+    else:
+        # The current period may be younger than the cached listing
+        now = datetime.datetime.now()
+        current = partitions.collection_for(base, now, partitioning)
+        names = partitions.collections_between(
+            base, existing_collections(db) | {current, base}, start, end
+        )
+
+    preference = models.analytics_read_preference
+    if preference is None:
+        return [db[name] for name in names]
+    return [db.get_collection(name, read_preference=preference) for name in names]
+
+
+def to_document(sensor, son):
+    return SENSOR_MODELS[sensor]._from_son(son)
+
+
+def merged(cursors, limit, newest_first):
+    """Merge per-collection cursors that are already sorted by timestamp"""
+    readings = heapq.merge(*cursors, key=lambda d: d["timestamp"], reverse=newest_first)
+    return list(itertools.islice(readings, limit))
+
+
+class MongoBackend:
+    """Readings in MongoDB, possibly spread over partitions"""
+
+    def latest(self, sensor):
+        base = collection_name(sensor)
+        found = []
+        # Base collection first, then partitions from the newest; an older
+        # partition can't hold anything newer than a hit in a younger one
+        for collection in reversed(collections(sensor)):
+            doc = collection.find_one(sort=[("timestamp", -1)])
+            if doc:
+                found.append(doc)
+                if collection.name != base:
+                    break
+        return max(found, key=lambda d: d["timestamp"]) if found else None
+
+    def stats(self, sensor, start, end=None):
+        timestamp = {"$gte": start}
+        if end is not None:
+            timestamp["$lt"] = end
+        pipeline = [
+            {"$match": {"timestamp": timestamp}},
+            {
+                "$group": {
+                    "_id": None,
+                    "min": {"$min": "$value"},
+                    "max": {"$max": "$value"},
+                    "sum": {"$sum": {"$toDouble": "$value"}},
+                    "count": {"$sum": 1},
+                }
+            },
+        ]
+
+        result = None
+        for collection in collections(sensor, start=start, end=end):
+            for part in collection.aggregate(pipeline):
+                result = archive.combine_stats(result, part)
+        return result
+
+    def newest(self, sensor, start, limit):
+        cursors = [
+            collection.find(
+                {"timestamp": {"$gte": start}},
+                {"value": 1, "timestamp": 1},
+                sort=[("timestamp", -1)],
+                limit=limit,
+            )
+            for collection in collections(sensor, start=start)
+        ]
+        return merged(cursors, limit, newest_first=True)
+
+    def newest_after(self, sensor, timestamp, after_id, limit):
+        query = {"timestamp": {"$gt": timestamp}}
+        if after_id is not None:
+            # Readings written later with the same timestamp as the cursor
+            query = {"$or": [query, {"timestamp": timestamp, "_id": {"$gt": after_id}}]}
+        cursors = [
+            collection.find(
+                query,
+                {"value": 1, "timestamp": 1},
+                sort=[("timestamp", -1), ("_id", -1)],
+                limit=limit,
+            )
+            for collection in collections(sensor, start=timestamp)
+        ]
+        readings = heapq.merge(
+            *cursors, key=lambda d: (d["timestamp"], d["_id"]), reverse=True
+        )
+        return list(itertools.islice(readings, limit))
+
+    @staticmethod
+    def parse_id(value):
+        try:
+            return ObjectId(value)
+        except InvalidId as e:
+            raise ValueError(str(e)) from e
+
+    def series(self, sensor, start, end):
+        import numpy as np
+
+        query = {"timestamp": {"$gte": start, "$lt": end}}
+        cursors = [
+            collection.find(query, {"_id": 0, "value": 1, "timestamp": 1}).sort(
+                "timestamp", 1
+            )
+            for collection in collections(sensor, start=start, end=end)
+        ]
+        docs = list(heapq.merge(*cursors, key=lambda d: d["timestamp"]))
+        return (
+            np.array([d["timestamp"] for d in docs], dtype="datetime64[ms]"),
+            np.array([d["value"] for d in docs], dtype="float64"),
+        )
+
+
+class SQLiteBackend:
+    """Readings in an embedded SQLite file, see webapp/sqlite_store.py"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def latest(self, sensor):
+        return self.store.latest(collection_name(sensor))
+
+    def stats(self, sensor, start, end=None):
+        result = self.store.stats(collection_name(sensor), start, end)
+        if result:
+            # Booleans are stored as 0/1, report min/max like MongoDB does
+            field = SENSOR_MODELS[sensor]._fields["value"]
+            result["min"] = field.to_python(result["min"])
+            result["max"] = field.to_python(result["max"])
+        return result
+
+    def newest(self, sensor, start, limit):
+        return self.store.newest(collection_name(sensor), start, limit)
+
+    def newest_after(self, sensor, timestamp, after_id, limit):
+        return self.store.newest_after(
+            collection_name(sensor), timestamp, after_id, limit
+        )
+
+    @staticmethod
+    def parse_id(value):
+        return int(value)
+
+    def series(self, sensor, start, end):
+        import numpy as np
+
+        rows = self.store.range(collection_name(sensor), start, end)
+        if not rows:
+            return np.empty(0, "datetime64[ms]"), np.empty(0, "float64")
+        millis, values = zip(*rows)
+        return (
+            np.array(millis, dtype="int64").view("datetime64[ms]"),
+            np.array(values, dtype="float64"),
+        )
+
+
+# Replaced from STORAGE_BACKEND by init_app()
+backend = MongoBackend()
+
+
+def archived_until(sensor):
+    """Readings before this come from the archive, None without one"""
+    if archive.sensor_archive is None:
+        return None
+    return archive.sensor_archive.archived_until(collection_name(sensor))
+
+
+def archived_documents(sensor, start, end, limit, newest_first):
+    """Up to `limit` archived readings in [start, end) as documents"""
+    timestamps, values, _ = archive.sensor_archive.read(
+        collection_name(sensor), start, end
+    )
+    if newest_first:
+        timestamps, values = timestamps[::-1], values[::-1]
+    return [
+        to_document(
+            sensor,
+            {"value": value.item(), "timestamp": archive.to_datetime(timestamp)},
+        )
+        for timestamp, value in zip(timestamps[:limit], values[:limit])
+    ]
+
+
+def latest(sensor):
+    doc = backend.latest(sensor)
+    if doc:
+        return to_document(sensor, doc)
+
+    # Everything may have been archived and removed from the backend
+    if archived_until(sensor):
+        newest = archive.sensor_archive.newest(collection_name(sensor))
+        if newest:
+            timestamp, value = newest
+            return to_document(sensor, {"value": value, "timestamp": timestamp})
+    return None
+
+
+def stats_between(sensor, start, end=None):
+    """min/max/sum/count of the values in [start, end), None without readings"""
+    boundary = archived_until(sensor)
+
+    result = None
+    if boundary and start < boundary:
+        archive_end = boundary if end is None else min(end, boundary)
+        result = archive.sensor_archive.stats(
+            collection_name(sensor), start, archive_end
+        )
+        start = boundary
+        if end is not None and end <= start:
+            return result
+
+    return archive.combine_stats(result, backend.stats(sensor, start, end))
+
+
+def stats_since(sensor, since):
+    """min/max/sum of the values since a timestamp"""
+    return stats_between(sensor, since)
+
+
+def history(sensor, since, limit=100):
+    """The newest `limit` readings since a timestamp, oldest first"""
+    boundary = archived_until(sensor)
+    start = max(since, boundary) if boundary else since
+
+    readings = [
+        to_document(sensor, doc) for doc in backend.newest(sensor, start, limit)
+    ]
+
+    if boundary and since < boundary and len(readings) < limit:
+        readings += archived_documents(
+            sensor, since, boundary, limit - len(readings), newest_first=True
+        )
+    return list(reversed(readings))
+
+
+def parse_id(value):
+    """The backend's id of a reading from its string form; raises ValueError"""
+    return backend.parse_id(value)
+
+
+def history_after(sensor, after, after_id=None, limit=100):
+    """
+    The newest `limit` readings after the (timestamp, id) cursor of the last
+    reading a client has, oldest first. A client further behind than that
+    skips ahead to the newest readings instead of paging through the gap.
+    Without an id (archived readings have none) the cursor is strictly after
+    the timestamp. after_id comes from parse_id().
+    """
+    boundary = archived_until(sensor)
+
+    if not (boundary and after < boundary):
+        newer = backend.newest_after(sensor, after, after_id, limit)
+        return [to_document(sensor, doc) for doc in reversed(newer)]
+
+    # Everything in the backend is newer than the archived cursor
+    readings = [
+        to_document(sensor, doc) for doc in backend.newest(sensor, boundary, limit)
+    ]
+    if len(readings) < limit:
+        # The archive range includes its start, drop readings at `after`
+        older = archived_documents(
+            sensor, after, boundary, limit - len(readings), newest_first=True
+        )
+        readings += [r for r in older if r.timestamp > after]
+    return list(reversed(readings))
+
+
+def series(sensor, start, end):
+    """
+    (timestamps, values) NumPy arrays of every reading in [start, end),
+    archived days first and then the backend, in timestamp order
+    """
+    # NumPy is only needed here, keep it out of the app's startup imports
+    import numpy as np
+
+    boundary = archived_until(sensor)
+    parts = []
+    if boundary and start < boundary:
+        timestamps, values, _ = archive.sensor_archive.read(
+            collection_name(sensor), start, min(end, boundary)
+        )
+        parts.append((timestamps, values.astype("float64")))
+        start = max(start, boundary)
+
+    if start < end:
+        parts.append(backend.series(sensor, start, end))
+
+    if not parts:
+        return np.empty(0, "datetime64[ms]"), np.empty(0, "float64")
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def quantiles(sensor, start, end, fractions, node=None, by_node=False):
+    """
+    Approximate quantiles over [start, end), widened to whole hours, from
+    the hourly sketches kept with the rollups; None with the SQLite backend,
+    which has no rollups
+    """
+    if not isinstance(backend, MongoBackend):
+        return None
+
+    db = SENSOR_MODELS[sensor]._get_db()
+    collection = db.get_collection(
+        rollups.rollup_collection(collection_name(sensor)),
+        read_preference=models.analytics_read_preference,
+    )
+    return rollups.quantiles(collection, start, end, fractions, node, by_node)
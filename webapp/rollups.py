@@ -0,0 +1,279 @@
+"""
+Hourly rollups of sensor readings, per collection and node:
+
+    <collection>_rollup_1h    {_id: "<YYYY-MM-DDTHH>|<node>", hour, node,
+                               count, sum, min, max, digest, digest_version}
+
+digest holds the [mean, weight] centroids of a t-digest (webapp/tdigest.py)
+of the hour's values; quantiles() merges them over any range of hours.
+
+With ROLLUPS_ENABLED the subscriber hands every write to LiveRollups, which
+folds them into the stored documents from a background thread, off the ack
+path. Each flush rewrites a bucket's count/sum/min/max and digest in a single
+update guarded by digest_version, so concurrent writers retry rather than
+lose each other's values. python -m webapp.cmd.backfill rollups rebuilds
+closed hours from the stored readings; the current hour is left to the live
+path. Both paths bucket readings with accumulate(), so they produce the same
+documents. Booleans count as 0/1.
+
+Only pymongo and the standard library are used so the subscriber image can
+copy this module.
+"""
+import datetime
+import threading
+import time
+import uuid
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from . import partitions, tdigest
+
+HOUR = datetime.timedelta(hours=1)
+SUFFIX = "_rollup_1h"
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+# Attempts at a bucket update that keeps losing to concurrent writers
+DIGEST_RETRIES = 5
+
+# Rollup collections whose hour index this process has created
+indexed = set()
+
+
+def rollup_collection(base):
+    return f"{base}{SUFFIX}"
+
+
+def hour_of(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(hour, node):
+    return f"{hour:%Y-%m-%dT%H}|{node or ''}"
+
+
+def accumulate(readings, buckets=None):
+    """Fold (timestamp, value, node) tuples into {(hour, node): stats}"""
+    buckets = {} if buckets is None else buckets
+    for timestamp, value, node in readings:
+        value = float(value)
+        key = (hour_of(timestamp), node)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                "count": 1,
+                "sum": value,
+                "min": value,
+                "max": value,
+                "digest": tdigest.TDigest(),
+            }
+        else:
+            bucket["count"] += 1
+            bucket["sum"] += value
+            if value < bucket["min"]:
+                bucket["min"] = value
+            if value > bucket["max"]:
+                bucket["max"] = value
+        bucket["digest"].add(value)
+    return buckets
+
+
+def get_collection(db, base):
+    name = rollup_collection(base)
+    if name not in indexed:
+        db[name].create_index("hour")
+        indexed.add(name)
+    return db[name]
+
+
+def stored_bucket(hour, node, bucket):
+    return {
+        "hour": hour,
+        "node": node,
+        "count": bucket["count"],
+        "sum": bucket["sum"],
+        "min": bucket["min"],
+        "max": bucket["max"],
+        "digest": bucket["digest"].centroids(),
+        "digest_version": uuid.uuid4().hex,
+    }
+
+
+def combine(bucket, other):
+    """Fold the stats of other into bucket"""
+    bucket["count"] += other["count"]
+    bucket["sum"] += other["sum"]
+    bucket["min"] = min(bucket["min"], other["min"])
+    bucket["max"] = max(bucket["max"], other["max"])
+    bucket["digest"].merge(other["digest"])
+    return bucket
+
+
+def loaded_bucket(doc):
+    """Bucket stats from a stored rollup document"""
+    return {
+        "count": doc["count"],
+        "sum": doc["sum"],
+        "min": doc["min"],
+        "max": doc["max"],
+        # Rolled up before digests existed: only the new values are sketched
+        "digest": tdigest.TDigest.from_centroids(
+            doc.get("digest", ()), doc["min"], doc["max"]
+        ),
+    }
+
+
+def merge_bucket(collection, hour, node, bucket):
+    """
+    Add bucket to the stored rollup. The stats and digest are written in one
+    update conditioned on the digest_version that was read, so a concurrent
+    writer (another subscriber process or a backfill) makes this one retry
+    on the fresh document instead of overwriting it.
+    """
+    _id = bucket_id(hour, node)
+    for _ in range(DIGEST_RETRIES):
+        stored = collection.find_one({"_id": _id})
+        if stored is None:
+            try:
+                collection.insert_one(
+                    {"_id": _id, **stored_bucket(hour, node, bucket)}
+                )
+                return
+            except DuplicateKeyError:
+                continue
+
+        merged = combine(loaded_bucket(stored), bucket)
+        result = collection.update_one(
+            # None also matches documents that have no digest yet
+            {"_id": _id, "digest_version": stored.get("digest_version")},
+            {"$set": stored_bucket(hour, node, merged)},
+        )
+        if result.matched_count:
+            return
+    raise RuntimeError(f"Rollup update for {_id} kept conflicting")
+
+
+class LiveRollups:
+    """
+    Accumulates freshly written readings in memory and merges them into the
+    stored rollups every interval seconds from flush(). Buckets that fail to
+    merge are kept for the next flush; readings still pending when the
+    process dies are only recovered by a backfill of their range.
+    """
+
+    def __init__(self, db, interval=1.0):
+        self.db = db
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def add(self, documents):
+        """Queue freshly written {collection: [documents]}"""
+        with self.lock:
+            for name, docs in documents.items():
+                buckets = self.pending.setdefault(partitions.base_collection(name), {})
+                accumulate(
+                    ((doc["timestamp"], doc["value"], doc.get("node")) for doc in docs),
+                    buckets,
+                )
+
+    def requeue(self, base, key, bucket):
+        with self.lock:
+            buckets = self.pending.setdefault(base, {})
+            if key in buckets:
+                combine(bucket, buckets[key])
+            buckets[key] = bucket
+
+    def flush(self):
+        """Merge what is pending, raising the first error after requeueing"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        error = None
+        for base, buckets in pending.items():
+            collection = get_collection(self.db, base)
+            for (hour, node), bucket in buckets.items():
+                try:
+                    merge_bucket(collection, hour, node, bucket)
+                except Exception as e:
+                    self.requeue(base, (hour, node), bucket)
+                    error = error or e
+        if error is not None:
+            raise error
+
+    def run(self, on_error=None):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+
+
+def rebuild(db, base, start, end, readings):
+    """
+    Replace the rollups of the whole hours in [start, end) with the ones
+    computed from readings; rerunning a range gives the same result. The
+    current hour is still being written by the live path and is skipped.
+    """
+    end = min(end, hour_of(datetime.datetime.now()))
+    if start >= end:
+        return 0
+
+    buckets = {
+        key: bucket
+        for key, bucket in accumulate(readings).items()
+        if start <= key[0] < end
+    }
+    collection = get_collection(db, base)
+
+    ids = []
+    operations = []
+    for (hour, node), bucket in buckets.items():
+        ids.append(bucket_id(hour, node))
+        operations.append(
+            ReplaceOne(
+                {"_id": ids[-1]}, stored_bucket(hour, node, bucket), upsert=True
+            )
+        )
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+    # Hours or nodes that no longer have readings
+    collection.delete_many({"hour": {"$gte": start, "$lt": end}, "_id": {"$nin": ids}})
+    return len(operations)
+
+
+def quantiles(
+    collection, start, end, fractions=DEFAULT_QUANTILES, node=None, by_node=False
+):
+    """
+    Quantiles of the values in the hours overlapping [start, end), from the
+    merged hourly digests: {node or None: {"count", "quantiles"}}. Only the
+    sketches are read, so the cost depends on the number of hours and nodes,
+    not on the number of readings.
+    """
+    query = {"hour": {"$gte": hour_of(start), "$lt": end}}
+    if node is not None:
+        query["node"] = node
+
+    digests = {}
+    projection = {"node": 1, "min": 1, "max": 1, "digest": 1}
+    for doc in collection.find(query, projection):
+        if not doc.get("digest"):
+            # Rolled up before digests existed; a backfill adds them
+            continue
+        key = doc.get("node") if by_node else None
+        digest = digests.get(key)
+        if digest is None:
+            digest = digests[key] = tdigest.TDigest()
+        digest.add_centroids(doc["digest"], doc.get("min"), doc.get("max"))
+
+    return {
+        key: {
+            "count": int(digest.total),
+            "quantiles": {str(q): digest.quantile(q) for q in fractions},
+        }
+        for key, digest in digests.items()
+    }
@@ -0,0 +1,180 @@
+"""
+Protects request workers from login bursts:
+
+- token buckets per client IP and per username reject floods before any
+  password hashing happens (the username bucket only pays for failures),
+- password checks run on a small bounded executor, so at most
+  LOGIN_HASH_WORKERS hashes run at once and excess attempts fail fast,
+- last_login_date updates are coalesced and written in bulk off the request.
+"""
+import atexit
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from pymongo import UpdateOne
+
+from .. import metrics
+from ..models.user_model import User
+
+LOGIN_ATTEMPTS = metrics.Counter(
+    "webapp_login_attempts_total",
+    "Login attempts by outcome",
+    ["result"],
+)
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by an arbitrary string"""
+
+    def __init__(self, capacity, per_minute, max_keys=100_000):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def refill(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def store(self, key, tokens, now):
+        if key not in self.buckets and len(self.buckets) >= self.max_keys:
+            self.prune(now)
+        self.buckets[key] = (tokens, now)
+
+    def allow(self, key):
+        """Takes a token when one is available"""
+        now = time.monotonic()
+        with self.lock:
+            tokens = self.refill(key, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.store(key, tokens, now)
+        return allowed
+
+    def peek(self, key):
+        """True when a token is available, without taking it"""
+        with self.lock:
+            return self.refill(key, time.monotonic()) >= 1
+
+    def charge(self, key):
+        """Takes a token after the fact, never going below empty"""
+        now = time.monotonic()
+        with self.lock:
+            self.store(key, max(0.0, self.refill(key, now) - 1), now)
+
+    def prune(self, now):
+        # Drop buckets that have refilled completely, they carry no state
+        full = (self.capacity / self.rate) if self.rate else 0
+        for key, (_, updated) in list(self.buckets.items()):
+            if now - updated >= full:
+                del self.buckets[key]
+
+
+class PasswordChecker:
+    """Runs password hash checks on a bounded pool of threads"""
+
+    def __init__(self, workers=2, queue_size=8, timeout=5):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.timeout = timeout
+
+    def check(self, user, password):
+        """True/False for the password, None when the pool is saturated"""
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            future = self.executor.submit(user.check_password, password)
+        except Exception:
+            self.slots.release()
+            raise
+        # The slot is held until the hash finishes, even when we stop waiting,
+        # so timed out checks still count against the pool
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            return None
+
+
+class LastLoginRecorder:
+    """Coalesces last_login_date updates into periodic bulk writes"""
+
+    def __init__(self, interval=10):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.thread = None
+
+    def record(self, user_id, when=None):
+        with self.lock:
+            self.pending[user_id] = when or datetime.datetime.now()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        updates = [
+            UpdateOne({"_id": user_id}, {"$set": {"last_login_date": when}})
+            for user_id, when in pending.items()
+        ]
+        try:
+            User._get_collection().bulk_write(updates, ordered=False)
+        except Exception as e:
+            print(f"Failed to write last_login_date for {len(updates)} users: {e}")
+
+
+ip_limiter = TokenBucketLimiter(capacity=20, per_minute=20)
+username_limiter = TokenBucketLimiter(capacity=5, per_minute=5)
+password_checker = PasswordChecker()
+last_login_recorder = LastLoginRecorder()
+
+atexit.register(last_login_recorder.flush)
+
+
+def init_app(app):
+    global ip_limiter, username_limiter, password_checker
+
+    ip_limiter = TokenBucketLimiter(
+        app.config["LOGIN_IP_BURST"], app.config["LOGIN_IP_PER_MINUTE"]
+    )
+    username_limiter = TokenBucketLimiter(
+        app.config["LOGIN_USER_BURST"], app.config["LOGIN_USER_PER_MINUTE"]
+    )
+    password_checker = PasswordChecker(
+        app.config["LOGIN_HASH_WORKERS"],
+        app.config["LOGIN_HASH_QUEUE"],
+        app.config["LOGIN_HASH_TIMEOUT"],
+    )
+    last_login_recorder.interval = app.config["LAST_LOGIN_FLUSH_INTERVAL"]
+
+
+def username_key(username):
+    return f"user:{username.strip().lower()}"
+
+
+def allow_attempt(remote_addr, username):
+    # Every attempt costs an IP token; the username bucket is only charged by
+    # record_failure, so its owner can still log in while it has tokens left
+    ip_ok = ip_limiter.allow(f"ip:{remote_addr}")
+    return ip_ok and username_limiter.peek(username_key(username))
+
+
+def record_failure(username):
+    username_limiter.charge(username_key(username))
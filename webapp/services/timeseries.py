@@ -0,0 +1,98 @@
+"""
+Vectorized alignment of sensor series on a common time grid, plus derived
+metrics (dew point, correlation). Everything works on NumPy arrays; missing
+grid points are NaN.
+"""
+import math
+
+import numpy as np
+
+FILL_METHODS = ("none", "ffill", "linear")
+
+# Magnus formula coefficients (Sonntag 1990), valid for -45..60 °C
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12
+
+
+def make_grid(start, end, step_seconds):
+    """datetime64[ms] grid points from start (inclusive) to end (exclusive)"""
+    step = np.timedelta64(int(step_seconds * 1000), "ms")
+    return np.arange(np.datetime64(start, "ms"), np.datetime64(end, "ms"), step)
+
+
+def resample(timestamps, values, grid, fill="none"):
+    """
+    Mean of the readings falling in each [grid[i], grid[i+1]) bucket, with
+    empty buckets filled by `fill`. On/off sensors come out as the fraction
+    of readings that were on.
+    """
+    values = np.asarray(values, dtype="float64")
+    result = np.full(len(grid), np.nan)
+    if len(grid) == 0 or len(timestamps) == 0:
+        return result
+
+    step = grid[1] - grid[0] if len(grid) > 1 else np.timedelta64(1, "ms")
+    buckets = np.searchsorted(grid, timestamps, side="right") - 1
+    inside = (buckets >= 0) & (timestamps < grid[-1] + step)
+    buckets = buckets[inside]
+
+    sums = np.bincount(buckets, weights=values[inside], minlength=len(grid))
+    counts = np.bincount(buckets, minlength=len(grid))
+    filled = counts > 0
+    result[filled] = sums[filled] / counts[filled]
+
+    return fill_gaps(result, fill)
+
+
+def fill_gaps(series, fill):
+    if fill == "none":
+        return series
+
+    known = ~np.isnan(series)
+    if not known.any():
+        return series
+
+    if fill == "ffill":
+        # Index of the last known point at or before each position
+        index = np.where(known, np.arange(len(series)), 0)
+        np.maximum.accumulate(index, out=index)
+        filled = series[index]
+        # Leading gaps have nothing to carry forward
+        filled[: np.argmax(known)] = np.nan
+        return filled
+
+    if fill == "linear":
+        positions = np.arange(len(series))
+        filled = np.interp(positions, positions[known], series[known])
+        # No extrapolation past the first/last known point
+        filled[: np.argmax(known)] = np.nan
+        filled[len(series) - np.argmax(known[::-1]) :] = np.nan
+        return filled
+
+    raise ValueError(f"fill must be one of {FILL_METHODS}")
+
+
+def dew_point(temperature, humidity):
+    """Dew point in °C from temperature (°C) and relative humidity (%)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = np.log(humidity / 100) + MAGNUS_A * temperature / (
+            MAGNUS_B + temperature
+        )
+        return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+
+def correlation(x, y):
+    """Pearson correlation over points where both are known, None if undefined"""
+    both = ~(np.isnan(x) | np.isnan(y))
+    if both.sum() < 2:
+        return None
+    x, y = x[both], y[both]
+    if x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def to_json_list(series, decimals=3):
+    """Rounded values with NaN as None, for JSON responses"""
+    rounded = np.round(series, decimals)
+    return [None if math.isnan(v) else v for v in rounded.tolist()]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from .. import metrics
+
+USER_CACHE_REQUESTS = metrics.Counter(
+    "webapp_user_cache_requests_total",
+    "User lookups served from the per-process cache (hit) or Mongo (miss)",
+    ["result"],
+)
+
+
+class UserCache:
+    """
+    Per-process cache of loaded users, so authenticated requests don't pay a
+    Mongo round trip for flask-login's user_loader. Entries expire after ttl
+    seconds, which bounds how long a role or status change made elsewhere (the
+    shell, init_admin, another replica) takes to apply; code changing a user
+    inside this process should call invalidate(user_id).
+    """
+
+    def __init__(self, ttl=30, max_size=10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, user_id, loader):
+        """Cached user, or loader() on a miss (only then is Mongo touched)"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+        if entry and entry[0] > now:
+            USER_CACHE_REQUESTS.inc(result="hit")
+            return entry[1]
+
+        USER_CACHE_REQUESTS.inc(result="miss")
+        user = loader()
+        if user is None or self.ttl <= 0:
+            return user
+
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                self.evict(now)
+            self.entries[user_id] = (now + self.ttl, user)
+        return user
+
+    def evict(self, now):
+        expired = [key for key, (expires, _) in self.entries.items() if expires <= now]
+        for key in expired or list(self.entries)[: self.max_size // 10]:
+            del self.entries[key]
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
@@ -1,25 +1,45 @@
 from ..models.user_model import User
 from flask_login import login_user
 from ..web.forms.user_form import RegisterForm
-import datetime
+from . import login_guard
 
 
 class UserService:
     @staticmethod
-    def login(username: str, password: str):
+    def login(username: str, password: str, remote_addr: str = None):
+        if not login_guard.allow_attempt(remote_addr, username):
+            login_guard.LOGIN_ATTEMPTS.inc(result="throttled")
+            return {
+                "error_msg": "พยายามเข้าสู่ระบบบ่อยเกินไป กรุณาลองใหม่ภายหลัง",
+                "success": False,
+                "throttled": True,
+            }
+
         user = User.objects(username=username).first()
         error_msg = ""
-        if not user or not user.check_password(password):
+        valid = False
+        if user:
+            valid = login_guard.password_checker.check(user, password)
+            if valid is None:
+                login_guard.LOGIN_ATTEMPTS.inc(result="busy")
+                return {
+                    "error_msg": "ระบบไม่ว่าง กรุณาลองใหม่อีกครั้ง",
+                    "success": False,
+                    "throttled": True,
+                }
+        if not user or not valid:
             error_msg = "ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง"
+            login_guard.record_failure(username)
 
         if user and user.status == "disactive":
             error_msg = "บัญชีของท่านถูกลบออกจากระบบ"
 
         if error_msg:
+            login_guard.LOGIN_ATTEMPTS.inc(result="failed")
             return {"error_msg": error_msg, "success": False}
         login_user(user)
-        user.last_login_date = datetime.datetime.now()
-        user.save()
+        login_guard.last_login_recorder.record(user.id)
+        login_guard.LOGIN_ATTEMPTS.inc(result="success")
         return {"error_msg": "", "success": True}
 
     @staticmethod
@@ -0,0 +1,197 @@
+"""
+Embedded SQLite storage for sensor readings, for gateways that can't run a
+MongoDB server (STORAGE_BACKEND = "sqlite").
+
+Every sensor shares one table, keyed by the collection name the MongoDB
+backend would use:
+
+    readings(sensor, node, timestamp, value, title)
+
+timestamp is milliseconds since the epoch of the naive datetimes the rest of
+the app uses; booleans are stored as 0/1. The indexes on
+(sensor, timestamp, value) and (sensor, node, timestamp, value) cover the
+dashboard queries, so they are answered from the index without touching the
+table. The database runs in WAL mode: the subscriber's batched writes (one
+transaction per flush) never block the web workers' reads.
+
+Only the standard library is used so the subscriber image can copy this module.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS readings (
+        sensor TEXT NOT NULL,
+        node TEXT,
+        timestamp INTEGER NOT NULL,
+        value REAL NOT NULL,
+        title TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS readings_sensor_time "
+    "ON readings (sensor, timestamp, value)",
+    "CREATE INDEX IF NOT EXISTS readings_sensor_node_time "
+    "ON readings (sensor, node, timestamp, value)",
+)
+
+
+def to_millis(timestamp):
+    return (timestamp - EPOCH) // MILLISECOND
+
+
+def from_millis(millis):
+    return EPOCH + millis * MILLISECOND
+
+
+class SQLiteStore:
+    """Readings in one SQLite file, with a connection per thread"""
+
+    def __init__(self, path, cache_kib=8192, mmap_bytes=64 * 1024 * 1024, timeout=5):
+        self.path = str(path)
+        self.cache_kib = cache_kib
+        self.mmap_bytes = mmap_bytes
+        self.timeout = timeout
+        self.local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Set up with a throwaway connection so a preloading parent process
+        # never hands an open connection to its forked workers
+        connection = self.connect()
+        try:
+            # WAL is persistent, it only needs to be switched on once per file
+            connection.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+        finally:
+            connection.close()
+
+    def connect(self):
+        # Autocommit; writes open their own transaction (see insert())
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout, isolation_level=None
+        )
+        # NORMAL is durable across application crashes in WAL mode, only an
+        # OS crash or power loss can drop the last transactions
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA cache_size = -{int(self.cache_kib)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_bytes)}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        return connection
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+        return connection
+
+    def insert(self, documents):
+        """Write {sensor: [documents]} in a single transaction"""
+        rows = [
+            (
+                sensor,
+                doc.get("node"),
+                to_millis(doc["timestamp"]),
+                float(doc["value"]),
+                doc.get("title"),
+            )
+            for sensor, docs in documents.items()
+            for doc in docs
+        ]
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO readings (sensor, node, timestamp, value, title) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return len(rows)
+
+    def latest(self, sensor):
+        row = self.connection.execute(
+            "SELECT timestamp, value, title, node FROM readings "
+            "WHERE sensor = ? ORDER BY timestamp DESC LIMIT 1",
+            (sensor,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "timestamp": from_millis(row[0]),
+            "value": row[1],
+            "title": row[2],
+            "node": row[3],
+        }
+
+    def stats(self, sensor, start, end=None):
+        """min/max/sum/count of the values in [start, end), None when empty"""
+        query = (
+            "SELECT MIN(value), MAX(value), SUM(value), COUNT(*) FROM readings "
+            "WHERE sensor = ? AND timestamp >= ?"
+        )
+        params = [sensor, to_millis(start)]
+        if end is not None:
+            query += " AND timestamp < ?"
+            params.append(to_millis(end))
+
+        low, high, total, count = self.connection.execute(query, params).fetchone()
+        if not count:
+            return None
+        return {"min": low, "max": high, "sum": total, "count": count}
+
+    def newest(self, sensor, start, limit):
+        """Up to `limit` readings at or after start, newest first"""
+        rows = self.connection.execute(
+            "SELECT rowid, timestamp, value FROM readings "
+            "WHERE sensor = ? AND timestamp >= ? "
+            "ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+            (sensor, to_millis(start), limit),
+        )
+        return [
+            {"_id": rowid, "timestamp": from_millis(ms), "value": value}
+            for rowid, ms, value in rows
+        ]
+
+    def newest_after(self, sensor, timestamp, after_id, limit):
+        """
+        Up to `limit` readings after the (timestamp, rowid) cursor, newest
+        first; strictly after timestamp when after_id is None
+        """
+        millis = to_millis(timestamp)
+        if after_id is None:
+            where, params = "timestamp > ?", [millis]
+        else:
+            where = "(timestamp > ? OR (timestamp = ? AND rowid > ?))"
+            params = [millis, millis, after_id]
+        rows = self.connection.execute(
+            "SELECT rowid, timestamp, value FROM readings "
+            f"WHERE sensor = ? AND {where} "
+            "ORDER BY timestamp DESC, rowid DESC LIMIT ?",
+            (sensor, *params, limit),
+        )
+        return [
+            {"_id": rowid, "timestamp": from_millis(ms), "value": value}
+            for rowid, ms, value in rows
+        ]
+
+    def range(self, sensor, start, end):
+        """(millis, value) rows in [start, end), oldest first"""
+        return self.connection.execute(
+            "SELECT timestamp, value FROM readings "
+            "WHERE sensor = ? AND timestamp >= ? AND timestamp < ? "
+            "ORDER BY timestamp",
+            (sensor, to_millis(start), to_millis(end)),
+        ).fetchall()
@@ -0,0 +1,147 @@
+"""
+Merging t-digest (Dunning & Ertl) for approximate quantiles.
+
+A digest summarises any number of values in at most ~compression centroids
+(mean, weight), kept small near the tails so extreme quantiles stay
+accurate: the rank error of quantile(q) is roughly proportional to
+q * (1 - q) / compression. Digests merge by pooling their centroids, so
+hourly sketches can be combined over any range of hours.
+
+Only the standard library is used so the subscriber image can copy this module.
+"""
+import bisect
+import math
+
+DEFAULT_COMPRESSION = 100
+# Values buffered before they are merged into the centroids
+BUFFER_FACTOR = 5
+
+
+def scale(q, compression):
+    """k1 scale function: centroid sizes shrink towards q = 0 and q = 1"""
+    return compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+
+def inverse_scale(k, compression):
+    return (math.sin(k * 2 * math.pi / compression) + 1) / 2
+
+
+class TDigest:
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def from_centroids(cls, centroids, minimum=None, maximum=None, **kwargs):
+        digest = cls(**kwargs)
+        digest.add_centroids(centroids, minimum, maximum)
+        return digest
+
+    def add(self, value, weight=1.0):
+        self.buffer.append((value, weight))
+        self.total += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.buffer) >= BUFFER_FACTOR * self.compression:
+            self.compress()
+
+    def add_centroids(self, centroids, minimum=None, maximum=None):
+        """Merge stored [mean, weight] pairs (and the range they came from)"""
+        for mean, weight in centroids:
+            self.buffer.append((mean, weight))
+            self.total += weight
+            self.min = min(self.min, mean)
+            self.max = max(self.max, mean)
+        # Centroid means lie inside the true range, the stored bounds are exact
+        if minimum is not None:
+            self.min = min(self.min, minimum)
+        if maximum is not None:
+            self.max = max(self.max, maximum)
+        if len(self.buffer) >= BUFFER_FACTOR * self.compression:
+            self.compress()
+
+    def merge(self, other):
+        self.add_centroids(other.centroids(), other.min, other.max)
+
+    def compress(self):
+        if not self.buffer:
+            return
+
+        items = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+        total = self.total
+
+        means, weights = [], []
+        mean, weight = items[0]
+        before = 0.0
+        limit = total * inverse_scale(
+            scale(0.0, self.compression) + 1, self.compression
+        )
+        for next_mean, next_weight in items[1:]:
+            if before + weight + next_weight <= limit:
+                # Fold into the current centroid
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+                continue
+
+            means.append(mean)
+            weights.append(weight)
+            before += weight
+            k = scale(min(before / total, 1.0), self.compression)
+            limit = total * inverse_scale(
+                min(k + 1, self.compression / 4), self.compression
+            )
+            mean, weight = next_mean, next_weight
+
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def centroids(self):
+        """[mean, weight] pairs, for storage"""
+        self.compress()
+        return [[mean, weight] for mean, weight in zip(self.means, self.weights)]
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), None when empty"""
+        self.compress()
+        if not self.means:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        # Each centroid's weight is centred on its mean; interpolate between
+        # neighbouring centres, and towards min/max beyond the outer ones
+        target = q * self.total
+        centres = []
+        cumulative = 0.0
+        for weight in self.weights:
+            centres.append(cumulative + weight / 2)
+            cumulative += weight
+
+        if target <= centres[0]:
+            return self._between(self.min, self.means[0], 0.0, centres[0], target)
+        if target >= centres[-1]:
+            return self._between(
+                self.means[-1], self.max, centres[-1], self.total, target
+            )
+
+        i = bisect.bisect_right(centres, target) - 1
+        return self._between(
+            self.means[i], self.means[i + 1], centres[i], centres[i + 1], target
+        )
+
+    @staticmethod
+    def _between(low, high, start, end, target):
+        if end <= start:
+            return low
+        return low + (high - low) * (target - start) / (end - start)
@@ -2,9 +2,14 @@ import os
 import optparse
 from flask import Flask
 from . import views
-from .. import models
+from .. import archive, cache, models
+from ..repositories import sensor_repository
 from .utils.error_handling import init_error_handling
 from .utils import acl
+from .utils.assets import init_assets
+from .utils.metrics import init_metrics
+from .utils.profiling import init_profiling
+from .utils.startup import StartupTimer
 from dotenv import load_dotenv
 import json
 
@@ -25,27 +30,54 @@ def load_config(app):
             app.config[k] = v
 
 
-def create_app():
+def create_app(import_seconds=None):
+    """import_seconds: time the caller spent importing this package"""
+    timer = StartupTimer()
+    if import_seconds:
+        timer.add("imports", import_seconds)
 
-    app = Flask(__name__)
-    load_config(app)
+    with timer.phase("config"):
+        app = Flask(__name__)
+        load_config(app)
+        if app.config["PROXY_COUNT"]:
+            from werkzeug.middleware.proxy_fix import ProxyFix
 
-    views.register_blueprint(app)
-    views.init_htmx(app)
-    models.init_db(app)
-    acl.init_acl(app)
+            count = app.config["PROXY_COUNT"]
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count, x_proto=count)
 
-    init_error_handling(app)
-    print("Registered routes:")
-    for rule in app.url_map.iter_rules():
-        print(f"{rule.endpoint}: {rule.rule} [{', '.join(rule.methods)}]")
+    with timer.phase("blueprints"):
+        views.register_blueprint(app)
+        views.init_htmx(app)
+
+    with timer.phase("assets"):
+        init_assets(app)
+
+    with timer.phase("instrumentation"):
+        init_metrics(app)
+        init_profiling(app)
+
+    with timer.phase("database"):
+        models.init_db(app)
+        cache.init_app(app)
+        sensor_repository.init_app(app)
+        archive.init_app(app)
+
+    with timer.phase("acl"):
+        acl.init_acl(app)
+        init_error_handling(app)
+
+    if app.debug:
+        print("Registered routes:")
+        for rule in app.url_map.iter_rules():
+            print(f"{rule.endpoint}: {rule.rule} [{', '.join(rule.methods)}]")
+
+    timer.report(app)
     return app
 
 
 def get_program_options(default_host="0.0.0.0", default_port="8080"):
     """
-    Takes a flask.Flask instance and runs it. Parses
-    command-line flags to configure the app.
+    Parses command-line flags to configure the development server.
     """
 
     # Set up the command-line options
@@ -81,13 +113,16 @@ def get_program_options(default_host="0.0.0.0", default_port="8080"):
 
     options, _ = parser.parse_args()
 
-    # If the user selects the profiling option, then we need
-    # to do a little extra setup
+    # Profiling every request only makes sense on the dev server
     if options.profile:
-        from werkzeug.middleware.profiler import ProfilerMiddleware
-
-        app.config["PROFILE"] = True
-        app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[30])
         options.debug = True
 
     return options
+
+
+def enable_dev_profiler(app):
+    """Print cProfile stats for every request (the --profile flag)"""
+    from werkzeug.middleware.profiler import ProfilerMiddleware
+
+    app.config["PROFILE"] = True
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[30])
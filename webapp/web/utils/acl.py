@@ -4,16 +4,19 @@ from werkzeug.exceptions import Forbidden, Unauthorized
 
 from functools import wraps
 from ...models.user_model import User
+from ...services.user_cache import user_cache
+from ...services import login_guard
 
 login_manager = LoginManager()
 
 
 def init_acl(app: Flask):
     login_manager.init_app(app)
+    user_cache.ttl = app.config["USER_CACHE_TTL"]
+    login_guard.init_app(app)
 
 
 def roles_required(*roles):
-    print(f"Setting up roles_required for roles: {roles}")
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -51,7 +54,7 @@ def permissions_required(permissions: list[str]):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.objects.with_id(user_id)
+    return user_cache.get(user_id, lambda: User.objects.with_id(user_id))
 
 
 @login_manager.unauthorized_handler
@@ -0,0 +1,154 @@
+"""
+Content-hashed static assets.
+
+build_assets() copies every file matched by ASSET_PATTERNS into static/dist
+under a name containing a hash of its content, next to precompressed .gz and
+.br variants, and writes dist/manifest.json:
+
+    {"css/app.css": "css/app.3f2a9c1b.css", ...}
+
+static_url() resolves names through the manifest, so a URL only changes when
+the file does and browsers may cache it forever. nginx serves dist/ straight
+from disk (see nginx.*.conf); Flask only serves it when nothing is in front.
+"""
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+
+from flask import Flask, request
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without the brotli package
+    brotli = None
+
+STATIC_DIR = pathlib.Path(__file__).resolve().parent.parent / "static"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_FILE = DIST_DIR / "manifest.json"
+
+ASSET_PATTERNS = [
+    "css/app.css",
+    "js/*.js",
+    "node_modules/htmx.org/dist/htmx.min.js",
+    "node_modules/cally/dist/cally.js",
+]
+
+# Smaller files gain nothing from compression
+COMPRESS_MIN_SIZE = 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+manifest = {}
+
+
+def hashed_name(name, content):
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    path = pathlib.PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def write_atomic(path, content):
+    # Replicas sharing the directory may build at the same time
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR, prune=True):
+    """Build dist/ and its manifest, only writing files whose content changed"""
+    static_dir = pathlib.Path(static_dir)
+    dist_dir = pathlib.Path(dist_dir)
+
+    result = {}
+    for pattern in ASSET_PATTERNS:
+        sources = sorted(static_dir.glob(pattern))
+        if not sources:
+            print(f"Asset {pattern} not found, skipped")
+        for source in sources:
+            name = source.relative_to(static_dir).as_posix()
+            content = source.read_bytes()
+            target = dist_dir / hashed_name(name, content)
+            result[name] = target.relative_to(dist_dir).as_posix()
+
+            if target.exists():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(target, content)
+            if len(content) >= COMPRESS_MIN_SIZE:
+                write_atomic(
+                    target.with_name(f"{target.name}.gz"),
+                    gzip.compress(content, compresslevel=9, mtime=0),
+                )
+                if brotli is not None:
+                    write_atomic(
+                        target.with_name(f"{target.name}.br"),
+                        brotli.compress(content, quality=11),
+                    )
+
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    write_atomic(
+        dist_dir / "manifest.json",
+        (json.dumps(result, indent=2, sort_keys=True) + "\n").encode(),
+    )
+
+    if prune:
+        prune_assets(dist_dir, result)
+    return result
+
+
+def prune_assets(dist_dir, current, keep=2):
+    """Remove old hashed versions, keeping a few for pages still open in browsers"""
+    current_files = set(current.values())
+    for name in current:
+        path = pathlib.PurePosixPath(name)
+        folder = dist_dir / path.parent
+        versions = [
+            f
+            for f in folder.glob(f"{path.stem}.*{path.suffix}")
+            if f.relative_to(dist_dir).as_posix() not in current_files
+        ]
+        versions.sort(key=lambda f: f.stat().st_mtime, reverse=True)
+        for old in versions[keep:]:
+            for suffix in ("", ".gz", ".br"):
+                old.with_name(f"{old.name}{suffix}").unlink(missing_ok=True)
+
+
+def load_manifest(path=MANIFEST_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_path(filename):
+    """Path under static/ to link for filename, hashed when it is in the manifest"""
+    hashed = manifest.get(filename)
+    return f"dist/{hashed}" if hashed else filename
+
+
+def set_immutable(response):
+    if response.status_code == 200 and request.path.startswith("/static/dist/"):
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app: Flask):
+    global manifest
+
+    # The dev server links the source files so edits show up on reload
+    if app.debug or not app.config["ASSETS_HASHED"]:
+        manifest = {}
+        return
+
+    if app.config["ASSETS_BUILD_ON_STARTUP"]:
+        manifest = build_assets()
+    else:
+        manifest = load_manifest()
+        if not manifest:
+            print(f"{MANIFEST_FILE} is missing, run python -m webapp.cmd.build_assets")
+
+    app.after_request(set_immutable)
@@ -0,0 +1,59 @@
+import time
+
+from flask import Flask, g, request
+
+from ... import metrics
+
+REQUEST_DURATION = metrics.Histogram(
+    "webapp_request_duration_seconds",
+    "Request latency by endpoint",
+    ["method", "endpoint"],
+)
+REQUESTS = metrics.Counter(
+    "webapp_requests_total",
+    "Requests handled by endpoint and status code",
+    ["method", "endpoint", "status"],
+)
+IN_FLIGHT = metrics.Gauge(
+    "webapp_requests_in_flight",
+    "Requests currently being handled",
+)
+
+
+def endpoint_label():
+    # Unmatched URLs share one label so 404 scans can't blow up cardinality
+    return request.endpoint or "unmatched"
+
+
+def init_metrics(app: Flask):
+    # Must run before models.init_db() so the MongoClient picks up the listener
+    metrics.init_mongo_monitoring()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        IN_FLIGHT.inc()
+        g.metrics_in_flight = True
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                endpoint=endpoint_label(),
+            )
+            REQUESTS.inc(
+                method=request.method,
+                endpoint=endpoint_label(),
+                status=response.status_code,
+            )
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        # Teardown also runs when an earlier before_request handler aborted
+        # before start_timer, only undo our own increment
+        if g.pop("metrics_in_flight", False):
+            IN_FLIGHT.dec()
@@ -0,0 +1,281 @@
+"""
+On-demand request profiling that is safe to leave deployed.
+
+While enabled, every request is watched by a low-frequency stack sampler and
+has its Mongo commands recorded. A random PROFILE_SAMPLE_RATE fraction of
+requests additionally runs under cProfile. Requests that were sampled, or
+that took longer than PROFILE_SLOW_THRESHOLD_MS, are written to PROFILE_DIR:
+
+    <id>.json     request info, duration and the Mongo commands issued
+    <id>.folded   collapsed stacks (flamegraph.pl / speedscope compatible)
+    <id>.pstats   cProfile stats, for sampled requests only
+
+The on/off switch is a flag file in PROFILE_DIR. Point PROFILE_DIR at a
+directory shared by every replica (docker-compose mounts the profiles volume)
+so they all follow the admin toggle and their captures are listed together;
+the default under /tmp is only shared by the workers of one container.
+"""
+import cProfile
+import datetime
+import json
+import os
+import pathlib
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from flask import Flask, request
+from pymongo import monitoring
+
+
+class Capture:
+    def __init__(self, sampled):
+        self.id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.sampled = sampled
+        self.profile = None
+        self.queries = []
+        self.pending_queries = {}
+        self.stacks = {}
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Attaches Mongo commands to the capture running on the current thread"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def started(self, event):
+        capture = self.profiler.current()
+        if capture is None:
+            return
+        command = json.dumps(event.command, default=str)
+        capture.pending_queries[event.request_id] = {
+            "command": event.command_name,
+            "database": event.database_name,
+            "body": command[:2000],
+        }
+
+    def finish(self, event, status):
+        capture = self.profiler.current()
+        if capture is None:
+            return
+        query = capture.pending_queries.pop(event.request_id, None)
+        if query is not None:
+            query["duration_ms"] = event.duration_micros / 1000
+            query["status"] = status
+            capture.queries.append(query)
+
+    def succeeded(self, event):
+        self.finish(event, "ok")
+
+    def failed(self, event):
+        self.finish(event, "error")
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.active = {}
+        # Set while captures are active; the sampler parks on it otherwise
+        self.wake = threading.Event()
+        self.sampler = None
+        self.directory = None
+        self.sample_rate = 0.0
+        self.threshold = 1.0
+        self.interval = 0.005
+        self.keep = 50
+        self.flag_checked = 0.0
+        self.flag_value = False
+        self.recorder = None
+
+    def init_app(self, app: Flask):
+        self.directory = pathlib.Path(app.config["PROFILE_DIR"])
+        self.sample_rate = float(app.config["PROFILE_SAMPLE_RATE"])
+        self.threshold = float(app.config["PROFILE_SLOW_THRESHOLD_MS"]) / 1000
+        self.interval = float(app.config["PROFILE_STACK_INTERVAL_MS"]) / 1000
+        self.keep = int(app.config["PROFILE_KEEP"])
+        if app.config["PROFILING_ENABLED"]:
+            self.set_enabled(True)
+
+        # Must be registered before models.init_db() creates the MongoClient
+        if self.recorder is None:
+            self.recorder = QueryRecorder(self)
+            monitoring.register(self.recorder)
+
+        app.before_request(self.start)
+        app.teardown_request(self.stop)
+
+    @property
+    def flag_file(self):
+        return self.directory / "enabled"
+
+    def is_enabled(self):
+        # The flag file is checked at most once a second
+        now = time.monotonic()
+        if now - self.flag_checked > 1:
+            self.flag_value = self.flag_file.exists()
+            self.flag_checked = now
+        return self.flag_value
+
+    def set_enabled(self, enabled):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if enabled:
+            self.flag_file.touch()
+        else:
+            self.flag_file.unlink(missing_ok=True)
+        self.flag_checked = 0.0
+
+    def current(self):
+        return getattr(self.local, "capture", None)
+
+    def start(self):
+        if not self.is_enabled():
+            return
+
+        capture = Capture(sampled=random.random() < self.sample_rate)
+        if capture.sampled:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                capture.profile = profile
+            except ValueError:
+                # Another profiler is active on this interpreter, rely on stacks
+                pass
+
+        self.local.capture = capture
+        with self.lock:
+            self.active[capture.thread_id] = capture
+            self.wake.set()
+        self.ensure_sampler()
+
+    def stop(self, exc=None):
+        capture = self.current()
+        if capture is None:
+            return
+        self.local.capture = None
+        if capture.profile is not None:
+            capture.profile.disable()
+
+        with self.lock:
+            self.active.pop(capture.thread_id, None)
+
+        duration = time.perf_counter() - capture.started
+        if capture.sampled or duration >= self.threshold:
+            try:
+                self.save(capture, duration)
+            except OSError as e:
+                print(f"Failed to save profile {capture.id}: {e}")
+
+    def ensure_sampler(self):
+        if self.sampler is None or not self.sampler.is_alive():
+            self.sampler = threading.Thread(target=self.sample_stacks, daemon=True)
+            self.sampler.start()
+
+    def sample_stacks(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                captures = list(self.active.values())
+                if not captures:
+                    self.wake.clear()
+            if not captures:
+                # Parked until start() registers a capture, so nothing runs
+                # while profiling is off or the worker is idle
+                self.wake.wait()
+                continue
+
+            frames = sys._current_frames()
+            for capture in captures:
+                frame = frames.get(capture.thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    location = f"{code.co_filename}:{frame.f_lineno}"
+                    stack.append(f"{code.co_name} ({location})")
+                    frame = frame.f_back
+                if stack:
+                    key = ";".join(reversed(stack))
+                    capture.stacks[key] = capture.stacks.get(key, 0) + 1
+
+    def save(self, capture, duration):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / capture.id
+
+        files = ["json", "folded"]
+        with open(f"{base}.folded", "w") as f:
+            for stack, count in list(capture.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        if capture.profile is not None:
+            capture.profile.dump_stats(f"{base}.pstats")
+            files.append("pstats")
+
+        info = {
+            "id": capture.id,
+            "method": request.method,
+            "path": request.full_path,
+            "endpoint": request.endpoint,
+            "duration_ms": round(duration * 1000, 2),
+            "sampled": capture.sampled,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "query_count": len(capture.queries),
+            "query_ms": round(sum(q["duration_ms"] for q in capture.queries), 2),
+            "queries": capture.queries,
+            "files": files,
+        }
+        with open(f"{base}.json", "w") as f:
+            json.dump(info, f, indent=2)
+
+        self.prune()
+
+    def list_captures(self, limit=None):
+        """Captures from every worker sharing PROFILE_DIR, slowest first"""
+        captures = []
+        for path in self.directory.glob("*.json"):
+            try:
+                with open(path) as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            info.pop("queries", None)
+            captures.append(info)
+
+        captures.sort(key=lambda c: c["duration_ms"], reverse=True)
+        return captures[:limit] if limit else captures
+
+    def prune(self):
+        """
+        Keep the PROFILE_KEEP newest sampled captures and the PROFILE_KEEP
+        slowest other ones, so slow requests don't crowd out the sample
+        """
+        captures = self.list_captures()
+        sampled = sorted(
+            (info for info in captures if info["sampled"]),
+            key=lambda info: info["created"],
+            reverse=True,
+        )
+        slow = [info for info in captures if not info["sampled"]]
+        for info in sampled[self.keep :] + slow[self.keep :]:
+            for ext in info["files"]:
+                (self.directory / f"{info['id']}.{ext}").unlink(missing_ok=True)
+
+    def capture_file(self, capture_id, ext):
+        if ext not in ("json", "folded", "pstats") or "/" in capture_id:
+            return None
+        path = self.directory / f"{capture_id}.{ext}"
+        return path if path.exists() else None
+
+
+profiler = RequestProfiler()
+
+
+def init_profiling(app: Flask):
+    profiler.init_app(app)
@@ -0,0 +1,52 @@
+import time
+from contextlib import contextmanager
+
+from ... import metrics
+
+STARTUP_PHASE_SECONDS = metrics.Gauge(
+    "webapp_startup_phase_seconds",
+    "Time spent in each create_app() phase at the last startup",
+    ["phase"],
+    # Measured once in the gunicorn master, every worker inherits it
+    multiprocess="max",
+)
+
+
+class StartupTimer:
+    """Collects per-phase wall time while the app is being created"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def report(self, app):
+        total = self.total
+        timings = {name: round(sec * 1000, 2) for name, sec in self.phases.items()}
+        timings["total"] = round(total * 1000, 2)
+        app.config["STARTUP_TIMINGS"] = timings
+
+        for name, seconds in self.phases.items():
+            STARTUP_PHASE_SECONDS.set(seconds, phase=name)
+        STARTUP_PHASE_SECONDS.set(total, phase="total")
+
+        breakdown = ", ".join(f"{name} {ms:.1f}ms" for name, ms in timings.items())
+        print(f"Startup timing: {breakdown}")
+
+        budget = app.config.get("STARTUP_BUDGET_MS")
+        if budget and timings["total"] > budget:
+            print(f"⚠️  Startup took {timings['total']:.0f}ms, budget is {budget}ms")
@@ -1,4 +1,5 @@
 import importlib
+import json
 import logging
 import pathlib
 from flask_htmx import HTMX
@@ -8,40 +9,58 @@ logger = logging.getLogger(__name__)
 
 htmx = HTMX()
 
+# Precomputed list of blueprint modules, written by webapp.cmd.build_manifest.
+# Production startup imports exactly these instead of scanning the filesystem.
+MANIFEST_FILE = pathlib.Path(__file__).parent / "blueprints.json"
 
-def get_subblueprints(directory):
+
+def get_subblueprints(directory, package=__name__, manifest=None):
+    """
+    Scan directory for modules exposing a `module` blueprint.
+    When manifest is a list, each discovered module is appended to it as
+    {"module": <import name>, "parent": <parent import name or None>}.
+    """
     blueprints = []
 
-    package = directory.parts[len(pathlib.Path.cwd().parts) :]
     parent_module = None
     try:
-        pymod_file = f"{'.'.join(package)}"
-        pymod = importlib.import_module(pymod_file)
+        pymod = importlib.import_module(package)
 
         if "module" in dir(pymod):
             parent_module = pymod.module
             blueprints.append(parent_module)
+            if manifest is not None:
+                manifest.append({"module": package, "parent": None})
     except Exception as e:
         logger.exception(e)
         return blueprints
 
     subblueprints = []
-    for module in directory.iterdir():
+    for module in sorted(directory.iterdir()):
         if module.name[:2] == "__":
             continue
 
         if module.match("*.py"):
             try:
-                pymod_file = f"{'.'.join(package)}.{module.stem}"
+                pymod_file = f"{package}.{module.stem}"
                 pymod = importlib.import_module(pymod_file)
 
                 if "module" in dir(pymod):
                     subblueprints.append(pymod.module)
+                    if manifest is not None:
+                        parent = package if parent_module else None
+                        manifest.append({"module": pymod_file, "parent": parent})
             except Exception as e:
                 logger.exception(e)
 
         elif module.is_dir():
-            subblueprints.extend(get_subblueprints(module))
+            start = len(manifest) if manifest is not None else 0
+            subblueprints.extend(
+                get_subblueprints(module, f"{package}.{module.name}", manifest)
+            )
+            if manifest is not None and parent_module:
+                for entry in manifest[start:]:
+                    entry["parent"] = entry["parent"] or package
 
     for module in subblueprints:
         if parent_module:
@@ -52,10 +71,36 @@ def get_subblueprints(directory):
     return blueprints
 
 
+def build_manifest():
+    manifest = []
+    get_subblueprints(pathlib.Path(__file__).parent, manifest=manifest)
+    return manifest
+
+
+def load_manifest_blueprints(manifest):
+    blueprints = []
+    registered = {}
+    for entry in manifest:
+        blueprint = importlib.import_module(entry["module"]).module
+        registered[entry["module"]] = blueprint
+
+        if entry["parent"]:
+            registered[entry["parent"]].register_blueprint(blueprint)
+        else:
+            blueprints.append(blueprint)
+
+    return blueprints
+
+
 def register_blueprint(app):
     app.add_template_filter(template_filters.static_url)
-    parent = pathlib.Path(__file__).parent
-    blueprints = get_subblueprints(parent)
+
+    # Debug keeps scanning so new view modules show up without a rebuild
+    if MANIFEST_FILE.exists() and not app.debug:
+        with open(MANIFEST_FILE) as f:
+            blueprints = load_manifest_blueprints(json.load(f))
+    else:
+        blueprints = get_subblueprints(pathlib.Path(__file__).parent)
 
     for blueprint in blueprints:
         app.register_blueprint(blueprint)
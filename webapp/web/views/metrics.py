@@ -0,0 +1,15 @@
+from flask import Blueprint, Response, abort, current_app, request
+
+from ... import metrics
+
+module = Blueprint("metrics", __name__, url_prefix="/metrics")
+
+
+@module.route("")
+def index():
+    """Prometheus scrape endpoint, every gunicorn worker's values added up"""
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(403)
+
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
@@ -0,0 +1,46 @@
+from flask import Blueprint, abort, jsonify, request, send_file
+
+from webapp.web.utils.acl import roles_required
+from ..utils.profiling import profiler
+
+module = Blueprint("profiling", __name__, url_prefix="/admin/profiling")
+
+
+def status(limit):
+    return {
+        "enabled": profiler.is_enabled(),
+        "sample_rate": profiler.sample_rate,
+        "slow_threshold_ms": profiler.threshold * 1000,
+        "captures": profiler.list_captures(limit),
+    }
+
+
+@module.route("/")
+@roles_required("admin")
+def index():
+    """Profiling state and the slowest captures of every replica"""
+    limit = int(request.args.get("limit", 20))
+    return jsonify(status(limit))
+
+
+@module.route("/toggle", methods=["POST"])
+@roles_required("admin")
+def toggle():
+    data = request.get_json(silent=True) or request.form
+    if "enabled" in data:
+        enabled = str(data["enabled"]).lower() in ("1", "true", "on", "yes")
+    else:
+        enabled = not profiler.is_enabled()
+
+    profiler.set_enabled(enabled)
+    return jsonify(status(20))
+
+
+@module.route("/<capture_id>.<ext>")
+@roles_required("admin")
+def capture(capture_id, ext):
+    """Download a capture (json, folded stacks or pstats)"""
+    path = profiler.capture_file(capture_id, ext)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=ext != "json")
@@ -1,57 +1,130 @@
-from flask import Blueprint, render_template
-import json
+from flask import Blueprint, render_template, abort, make_response
 from flask import request, jsonify  # type: ignore
+from jinja2_fragments.flask import render_block
 import datetime
+import math
 
 from webapp.web.utils.acl import roles_required
-from ...models import sensors
+from ...cache import result_cache
+from ...repositories import sensor_repository
 
 module = Blueprint("sensors", __name__, url_prefix="/sensors")
 
 
+# Card title and value colour for each sensor on the status page
+SENSOR_CARDS = {
+    "temperature": {"label": "🌡️ อุณหภูมิ", "color": "text-orange-500"},
+    "humidity": {"label": "💧 ความชื้น", "color": "text-blue-500"},
+    "light": {"label": "💡 แสง", "color": "text-yellow-500"},
+    "rain": {"label": "🌧️ ฝน", "color": "text-indigo-500"},
+    "smoke": {"label": "💨 ควัน", "color": "text-red-500"},
+}
+
+# Largest grid the aligned endpoint will build, and its smallest step (s)
+MAX_ALIGNED_POINTS = 5000
+MIN_ALIGNED_STEP = 1
+
+# A sensor is active when it reported within this window
+ACTIVE_THRESHOLD = datetime.timedelta(minutes=5)
+
+# sensor -> (version, rendered card), shared by every viewer in this process
+card_cache = {}
+
+
+def cached(sensor, key, compute):
+    """
+    Result shared by all workers and replicas through the result cache,
+    invalidated by the subscriber whenever it writes readings for the sensor
+    """
+    namespace = sensor_repository.collection_name(sensor)
+    return result_cache.get_or_compute(namespace, key, compute)
+
+
+def latest_reading(sensor):
+    def load():
+        reading = sensor_repository.latest(sensor)
+        if not reading:
+            return None
+        return {
+            "value": reading.value,
+            "timestamp": reading.timestamp.isoformat(),
+            "title": reading.title,
+        }
+
+    return cached(sensor, "latest", load)
+
+
+def sensor_status(sensor, now=None):
+    reading = latest_reading(sensor)
+    timestamp = None
+    if reading:
+        timestamp = datetime.datetime.fromisoformat(reading["timestamp"])
+    now = now or datetime.datetime.now()
+    active = bool(reading and (now - timestamp) < ACTIVE_THRESHOLD)
+
+    # The card only changes with a new reading or when it turns (in)active
+    version = f"{timestamp:%Y%m%d%H%M%S%f}-{int(active)}" if reading else "none"
+
+    return dict(
+        SENSOR_CARDS[sensor],
+        active=active,
+        last_update=timestamp,
+        value=reading["value"] if reading else None,
+        version=version,
+    )
+
+
+def all_sensor_status():
+    now = datetime.datetime.now()
+    return {sensor: sensor_status(sensor, now) for sensor in SENSOR_CARDS}
+
+
 @module.route("/")
 @roles_required("user", "admin")
 def index():
-    # Get latest readings from all sensor types to check if they're active
-    latest_temp = sensors.TemperatureSensor.objects.order_by("-timestamp").first()
-    latest_humidity = sensors.HumiditySensor.objects.order_by("-timestamp").first()
-    latest_light = sensors.LightSensor.objects.order_by("-timestamp").first()
-    latest_rain = sensors.RainSensor.objects.order_by("-timestamp").first()
-    latest_smoke = sensors.SmokeSensor.objects.order_by("-timestamp").first()
-    
-    # Check if data is recent (within last 5 minutes)
-    now = datetime.datetime.now()
-    threshold = datetime.timedelta(minutes=5)
-    
-    sensors_status = {
-        "temperature": {
-            "active": latest_temp and (now - latest_temp.timestamp) < threshold,
-            "last_update": latest_temp.timestamp if latest_temp else None,
-            "value": latest_temp.value if latest_temp else None,
-        },
-        "humidity": {
-            "active": latest_humidity and (now - latest_humidity.timestamp) < threshold,
-            "last_update": latest_humidity.timestamp if latest_humidity else None,
-            "value": latest_humidity.value if latest_humidity else None,
-        },
-        "light": {
-            "active": latest_light and (now - latest_light.timestamp) < threshold,
-            "last_update": latest_light.timestamp if latest_light else None,
-            "value": latest_light.value if latest_light else None,
-        },
-        "rain": {
-            "active": latest_rain and (now - latest_rain.timestamp) < threshold,
-            "last_update": latest_rain.timestamp if latest_rain else None,
-            "value": latest_rain.value if latest_rain else None,
-        },
-        "smoke": {
-            "active": latest_smoke and (now - latest_smoke.timestamp) < threshold,
-            "last_update": latest_smoke.timestamp if latest_smoke else None,
-            "value": latest_smoke.value if latest_smoke else None,
-        },
-    }
-    
-    return render_template("/sensors/index.html", sensors_status=sensors_status)
+    return render_template(
+        "/sensors/index.html", sensors_status=all_sensor_status()
+    )
+
+
+@module.route("/cards/<sensor>")
+@roles_required("user", "admin")
+def card(sensor):
+    """
+    One sensor card for htmx polling. Returns 204 (htmx keeps the card) when
+    the version shown by the client is still current.
+    """
+    if sensor not in SENSOR_CARDS:
+        abort(404)
+
+    status = sensor_status(sensor)
+    shown = request.args.get("version")
+    if shown == status["version"]:
+        return "", 204
+
+    cached = card_cache.get(sensor)
+    if cached and cached[0] == status["version"]:
+        html = cached[1]
+    else:
+        html = render_block(
+            "/sensors/index.html", "sensor_card", sensor=sensor, status=status
+        )
+        card_cache[sensor] = (status["version"], html)
+
+    response = make_response(html)
+    if shown:
+        # Let the summary refresh itself, it listens for this event
+        response.headers["HX-Trigger"] = "sensor-changed"
+    return response
+
+
+@module.route("/summary")
+@roles_required("user", "admin")
+def summary():
+    return render_block(
+        "/sensors/index.html", "status_summary", sensors_status=all_sensor_status()
+    )
+
 
 @module.route("/view")
 @roles_required("user", "admin")
@@ -59,159 +132,143 @@ def view():
     return render_template("/sensors/view.html")
 
 
-@module.route("/temperature/latest")
-@roles_required("user", "admin")
-def temperature_latest():
-    """Get latest temperature reading with stats"""
-    latest = sensors.TemperatureSensor.objects.order_by("-timestamp").first()
+def parse_timestamp(value):
+    """
+    ISO timestamp from a query string as the naive local time readings are
+    stored in; raises ValueError
+    """
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def latest_response(sensor):
+    """Latest reading with min/max over the last 24 hours"""
+    latest = latest_reading(sensor)
     if not latest:
         return jsonify({"error": "No data"}), 404
 
-    # Get min/max from last 24 hours
-    day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    recent = sensors.TemperatureSensor.objects.filter(timestamp__gte=day_ago)
+    def load_stats():
+        day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
+        return sensor_repository.stats_since(sensor, day_ago)
 
-    values = [s.value for s in recent]
+    stats = cached(sensor, "stats-24h", load_stats)
 
     return jsonify(
         {
-            "value": latest.value,
-            "timestamp": latest.timestamp.isoformat(),
-            "title": latest.title,
-            "min": min(values) if values else latest.value,
-            "max": max(values) if values else latest.value,
+            **latest,
+            "min": stats["min"] if stats else latest["value"],
+            "max": stats["max"] if stats else latest["value"],
         }
     )
 
 
+def history_response(sensor):
+    """
+    Readings for the last N hours (?hours=, default 24), oldest first.
+    With ?since=<timestamp>&after_id=<id> of the last point the client has,
+    only newer readings are returned (at most the newest 100), so live
+    charts only fetch what they are missing.
+    """
+    try:
+        hours = int(request.args.get("hours", 24))
+        since = request.args.get("since")
+        since = parse_timestamp(since) if since else None
+        after_id = request.args.get("after_id") or None
+        cursor_id = sensor_repository.parse_id(after_id) if after_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid hours, since or after_id"}), 400
+    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
+
+    # Clients that are up to date all send the same cursor and share an entry
+    key = f"history:{hours}:{since.isoformat() if since else ''}:{after_id or ''}"
+    if since and since < time_ago:
+        # The cursor left the window, its id no longer applies
+        since, cursor_id = time_ago, None
+
+    def load():
+        if since:
+            readings = sensor_repository.history_after(sensor, since, cursor_id)
+        else:
+            readings = sensor_repository.history(sensor, time_ago)
+        return [
+            {
+                "value": r.value,
+                "timestamp": r.timestamp.isoformat(),
+                "id": "" if r.id is None else str(r.id),
+            }
+            for r in readings
+        ]
+
+    return jsonify(cached(sensor, key, load))
+
+
+@module.route("/temperature/latest")
+@roles_required("user", "admin")
+def temperature_latest():
+    """Get latest temperature reading with stats"""
+    return latest_response("temperature")
+
+
 @module.route("/temperature/history")
 @roles_required("user", "admin")
 def temperature_history():
     """Get temperature history for last N hours"""
-    from flask import request
-
-    hours = int(request.args.get("hours", 24))
-
-    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
-    readings = (
-        sensors.TemperatureSensor.objects.filter(timestamp__gte=time_ago)
-        .order_by("timestamp")
-        .limit(100)
-    )
-
-    return jsonify(
-        [{"value": r.value, "timestamp": r.timestamp.isoformat()} for r in readings]
-    )
+    return history_response("temperature")
 
 
 @module.route("/humidity/latest")
 @roles_required("user", "admin")
 def humidity_latest():
-    latest = sensors.HumiditySensor.objects.order_by("-timestamp").first()
-    if not latest:
-        return jsonify({"error": "No data"}), 404
-
-    day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    recent = sensors.HumiditySensor.objects.filter(timestamp__gte=day_ago)
-    values = [s.value for s in recent]
-
-    return jsonify(
-        {
-            "value": latest.value,
-            "timestamp": latest.timestamp.isoformat(),
-            "title": latest.title,
-            "min": min(values) if values else latest.value,
-            "max": max(values) if values else latest.value,
-        }
-    )
+    return latest_response("humidity")
 
 
 @module.route("/humidity/history")
 @roles_required("user", "admin")
 def humidity_history():
-    from flask import request
-
-    hours = int(request.args.get("hours", 24))
-    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
-
-    readings = (
-        sensors.HumiditySensor.objects.filter(timestamp__gte=time_ago)
-        .order_by("timestamp")
-        .limit(100)
-    )
-
-    return jsonify(
-        [{"value": r.value, "timestamp": r.timestamp.isoformat()} for r in readings]
-    )
+    return history_response("humidity")
 
 
 @module.route("/light/latest")
 @roles_required("user", "admin")
 def light_latest():
-    latest = sensors.LightSensor.objects.order_by("-timestamp").first()
-    if not latest:
-        return jsonify({"error": "No data"}), 404
-
-    day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    recent = sensors.LightSensor.objects.filter(timestamp__gte=day_ago)
-    values = [s.value for s in recent]
-
-    return jsonify(
-        {
-            "value": latest.value,
-            "timestamp": latest.timestamp.isoformat(),
-            "title": latest.title,
-            "min": min(values) if values else latest.value,
-            "max": max(values) if values else latest.value,
-        }
-    )
+    return latest_response("light")
 
 
 @module.route("/light/history")
 @roles_required("user", "admin")
 def light_history():
-    from flask import request
-
-    hours = int(request.args.get("hours", 24))
-    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
-
-    readings = (
-        sensors.LightSensor.objects.filter(timestamp__gte=time_ago)
-        .order_by("timestamp")
-        .limit(100)
-    )
-
-    return jsonify(
-        [{"value": r.value, "timestamp": r.timestamp.isoformat()} for r in readings]
-    )
+    return history_response("light")
 
 
 @module.route("/rain/latest")
 @roles_required("user", "admin")
 def rain_latest():
-    latest = sensors.RainSensor.objects.order_by("-timestamp").first()
+    latest = latest_reading("rain")
     if not latest:
         return jsonify({"error": "No data"}), 404
 
-    # Calculate today's total rainfall
-    today_start = datetime.datetime.now().replace(
-        hour=0, minute=0, second=0, microsecond=0
-    )
-    today_readings = sensors.RainSensor.objects.filter(timestamp__gte=today_start)
-    total_today = sum(r.value for r in today_readings)
+    def load_stats():
+        # Calculate today's total rainfall
+        today_start = datetime.datetime.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
+        return {
+            "today": sensor_repository.stats_since("rain", today_start),
+            "day": sensor_repository.stats_since("rain", day_ago),
+        }
 
-    day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    recent = sensors.RainSensor.objects.filter(timestamp__gte=day_ago)
-    values = [s.value for s in recent]
+    stats = cached("rain", "rain-stats", load_stats)
+    today, day = stats["today"], stats["day"]
 
     return jsonify(
         {
-            "value": latest.value,
-            "timestamp": latest.timestamp.isoformat(),
-            "title": latest.title,
-            "total_today": total_today,
-            "min": min(values) if values else 0,
-            "max": max(values) if values else latest.value,
+            **latest,
+            "total_today": today["sum"] if today else 0,
+            "min": day["min"] if day else 0,
+            "max": day["max"] if day else latest["value"],
         }
     )
 
@@ -219,56 +276,201 @@ def rain_latest():
 @module.route("/rain/history")
 @roles_required("user", "admin")
 def rain_history():
-    from flask import request
+    return history_response("rain")
 
-    hours = int(request.args.get("hours", 24))
-    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
+@module.route("/smoke/latest")
+@roles_required("user", "admin")
+def smoke_latest():
+    return latest_response("smoke")
+
+@module.route("/smoke/history")
+@roles_required("user", "admin")
+def smoke_history():
+    return history_response("smoke")
 
-    readings = (
-        sensors.RainSensor.objects.filter(timestamp__gte=time_ago)
-        .order_by("timestamp")
-        .limit(100)
-    )
+
+@module.route("/<sensor>/stats")
+@roles_required("user", "admin")
+def sensor_stats(sensor):
+    """
+    min/max/mean/count over ?start=&end= (ISO timestamps, default the last
+    30 days). Archived days are read from the columnar archive.
+    """
+    if sensor not in sensor_repository.SENSOR_MODELS:
+        abort(404)
+
+    try:
+        end = request.args.get("end")
+        end = parse_timestamp(end) if end else None
+        start = request.args.get("start")
+        if start:
+            start = parse_timestamp(start)
+        else:
+            # "Now"-relative windows start on the minute so they share an entry
+            now = datetime.datetime.now().replace(second=0, microsecond=0)
+            start = (end or now) - datetime.timedelta(days=30)
+    except ValueError:
+        return jsonify({"error": "Invalid start or end"}), 400
+
+    def load():
+        return sensor_repository.stats_between(sensor, start, end)
+
+    key = f"stats:{start.isoformat()}:{end.isoformat() if end else ''}"
+    stats = cached(sensor, key, load)
+    if not stats:
+        return jsonify({"error": "No data"}), 404
 
     return jsonify(
-        [{"value": r.value, "timestamp": r.timestamp.isoformat()} for r in readings]
+        {
+            "start": start.isoformat(),
+            "end": end.isoformat() if end else None,
+            "count": stats["count"],
+            "min": stats["min"],
+            "max": stats["max"],
+            "mean": stats["sum"] / stats["count"],
+        }
     )
 
-@module.route("/smoke/latest")
+
+@module.route("/<sensor>/quantiles")
 @roles_required("user", "admin")
-def smoke_latest():
-    latest = sensors.SmokeSensor.objects.order_by("-timestamp").first()
-    if not latest:
+def sensor_quantiles(sensor):
+    """
+    Approximate quantiles over ?start=&end= (default the last 7 days,
+    widened to whole hours) from the hourly t-digest sketches:
+
+        ?q=0.5,0.95,0.99    quantiles to return
+        ?node=<id>          only one node
+        ?by_node=true       one result per node
+    """
+    if sensor not in sensor_repository.SENSOR_MODELS:
+        abort(404)
+
+    try:
+        end = request.args.get("end")
+        end = parse_timestamp(end) if end else datetime.datetime.now()
+        start = request.args.get("start")
+        start = parse_timestamp(start) if start else end - datetime.timedelta(days=7)
+        q = request.args.get("q", "0.5,0.9,0.95,0.99")
+        fractions = [float(value) for value in q.split(",")]
+    except ValueError:
+        return jsonify({"error": "Invalid start, end or q"}), 400
+    if any(not 0 <= q <= 1 for q in fractions):
+        return jsonify({"error": "q must be between 0 and 1"}), 400
+
+    node = request.args.get("node")
+    by_node = request.args.get("by_node", "false").lower() == "true"
+
+    def load():
+        result = sensor_repository.quantiles(
+            sensor, start, end, fractions, node=node, by_node=by_node
+        )
+        if result is None:
+            return None
+        # Nodes may be None, which can't be a JSON object key
+        return [{"node": key, **value} for key, value in result.items()]
+
+    # "Now"-relative windows share an entry per minute
+    key = request.query_string.decode()
+    if not request.args.get("end"):
+        key = f"{key}:{end:%Y-%m-%dT%H:%M}"
+    groups = cached(sensor, f"quantiles:{key}", load)
+    if groups is None:
+        return jsonify({"error": "Quantiles need the MongoDB rollups"}), 404
+    if not groups:
         return jsonify({"error": "No data"}), 404
 
-    day_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    recent = sensors.SmokeSensor.objects.filter(timestamp__gte=day_ago)
-    values = [s.value for s in recent]
-
     return jsonify(
         {
-            "value": latest.value,
-            "timestamp": latest.timestamp.isoformat(),
-            "title": latest.title,
-            "min": min(values) if values else latest.value,
-            "max": max(values) if values else latest.value,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "results": groups if by_node else groups[0],
         }
     )
 
-@module.route("/smoke/history")
-@roles_required("user", "admin")
-def smoke_history():
-    from flask import request
 
-    hours = int(request.args.get("hours", 24))
-    time_ago = datetime.datetime.now() - datetime.timedelta(hours=hours)
+@module.route("/aligned")
+@roles_required("user", "admin")
+def aligned():
+    """
+    Sensors resampled on one time grid, as columns:
+
+        ?start=&end=        ISO timestamps (default: the last 24 hours)
+        ?step=300           grid step in seconds (at least 1)
+        ?sensors=a,b        subset of sensors (default: all)
+        ?fill=none          none, ffill or linear for empty grid points,
+        ?fill.<sensor>=     overridden per sensor
+
+    Each point is the mean of the readings in its step (the fraction "on"
+    for light, rain and smoke). Dew point and the temperature/humidity
+    correlation are included when both series are requested.
+    """
+    # NumPy based, imported on first use to keep it out of app startup
+    import numpy as np
+
+    from ...services import timeseries
+
+    try:
+        end = request.args.get("end")
+        end = parse_timestamp(end) if end else datetime.datetime.now()
+        start = request.args.get("start")
+        start = parse_timestamp(start) if start else end - datetime.timedelta(hours=24)
+        step = float(request.args.get("step", 300))
+    except ValueError:
+        return jsonify({"error": "Invalid start, end or step"}), 400
+    if not math.isfinite(step) or step < MIN_ALIGNED_STEP:
+        return jsonify({"error": f"step must be at least {MIN_ALIGNED_STEP}s"}), 400
+
+    names = request.args.get("sensors")
+    names = names.split(",") if names else list(sensor_repository.SENSOR_MODELS)
+    if any(name not in sensor_repository.SENSOR_MODELS for name in names):
+        return jsonify({"error": "Unknown sensor"}), 400
+
+    default_fill = request.args.get("fill", "none")
+    fills = {name: request.args.get(f"fill.{name}", default_fill) for name in names}
+    if any(fill not in timeseries.FILL_METHODS for fill in fills.values()):
+        return jsonify({"error": f"fill must be one of {timeseries.FILL_METHODS}"}), 400
+
+    if end <= start:
+        return jsonify({"error": "Empty time range"}), 400
+    if (end - start).total_seconds() / step > MAX_ALIGNED_POINTS:
+        return jsonify({"error": f"More than {MAX_ALIGNED_POINTS} points"}), 400
+
+    def load():
+        grid = timeseries.make_grid(start, end, step)
+        series = {
+            name: timeseries.resample(
+                *sensor_repository.series(name, start, end), grid, fills[name]
+            )
+            for name in names
+        }
 
-    readings = (
-        sensors.SmokeSensor.objects.filter(timestamp__gte=time_ago)
-        .order_by("timestamp")
-        .limit(100)
-    )
+        derived, correlations = {}, {}
+        if "temperature" in series and "humidity" in series:
+            temperature, humidity = series["temperature"], series["humidity"]
+            derived["dew_point"] = timeseries.to_json_list(
+                timeseries.dew_point(temperature, humidity), 2
+            )
+            correlations["temperature_humidity"] = timeseries.correlation(
+                temperature, humidity
+            )
+
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "step": step,
+            "fill": fills,
+            "timestamps": np.datetime_as_string(grid, unit="s").tolist(),
+            "series": {
+                name: timeseries.to_json_list(values)
+                for name, values in series.items()
+            },
+            "derived": derived,
+            "correlations": correlations,
+        }
 
-    return jsonify(
-        [{"value": r.value, "timestamp": r.timestamp.isoformat()} for r in readings]
-    )
+    key = request.query_string.decode()
+    if not request.args.get("end"):
+        # "Now"-relative windows share an entry per step-aligned start
+        key = f"{key}:{int(end.timestamp() // step)}"
+    return jsonify(result_cache.get_or_compute("aligned", key, load))
@@ -23,10 +23,16 @@ def login():
         return render_template("/users/login.html", form=form, error_msg=error_msg)
 
     # Authenticate user
-    login_result = UserService.login(form.username.data, form.password.data)
+    login_result = UserService.login(
+        form.username.data, form.password.data, request.remote_addr
+    )
     if not login_result["success"]:
-        return render_template(
-            "/users/login.html", form=form, error_msg=login_result["error_msg"]
+        status = 429 if login_result.get("throttled") else 200
+        return (
+            render_template(
+                "/users/login.html", form=form, error_msg=login_result["error_msg"]
+            ),
+            status,
         )
     return redirect(url_for("dashboard.index"))
 